@@ -34,8 +34,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media offloading to the front proxy (see DEPLOYMENT.md)
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD') or None
+MEDIA_OFFLOAD_PREFIX = os.environ.get('MEDIA_OFFLOAD_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', MEDIA_CACHE_MAX_BYTES))
+MEDIA_CACHE_MAX_FILE_SIZE = int(os.environ.get('MEDIA_CACHE_MAX_FILE_SIZE', MEDIA_CACHE_MAX_FILE_SIZE))
+
+# card_data builder; 'auto' builds it with json_agg on PostgreSQL
+CARD_DATA_ENGINE = os.environ.get('CARD_DATA_ENGINE', CARD_DATA_ENGINE)
+
+# Pre-rendered catalog snapshots; SNAPSHOT_ROOT must be writable by the app
+SNAPSHOT_ROOT = os.environ.get('SNAPSHOT_ROOT', os.path.join(BASE_DIR, 'snapshots'))
+SNAPSHOT_ORIGINS = [origin for origin in os.environ.get('SNAPSHOT_ORIGINS', '').split(',') if origin]
+
 # Add whitenoise middleware for static files
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+
+# Request metrics at /metrics; they are only served once METRICS_TOKEN is set
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+# Views over their QUERY_BUDGETS are logged (and counted) instead of failing
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'log') or None
+
+# Profiles of staff-requested and sampled requests; PROFILING_ROOT must be writable
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_ROUTES = [route for route in os.environ.get('PROFILING_ROUTES', '').split(',') if route]
+PROFILING_ROOT = os.environ.get('PROFILING_ROOT', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', '100'))
 
 # CORS settings for production
 CORS_ALLOWED_ORIGINS = [
@@ -52,6 +78,22 @@ SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY')
 SUPABASE_BUCKET_NAME = os.environ.get('SUPABASE_BUCKET_NAME', 'fashion-images')
 
+# Store uploads under their SHA-256 digest and skip re-uploading identical bytes
+SUPABASE_CONTENT_ADDRESSED = os.environ.get('SUPABASE_CONTENT_ADDRESSED', '').lower() in ('1', 'true', 'yes')
+
+# Storage backend for uploads (see fashion_images/storage.py)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', STORAGE_BACKEND)
+
+# Connection pool for AsyncSupabaseStorageService
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_CONNECTIONS', '100'))
+SUPABASE_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_KEEPALIVE_CONNECTIONS', '20'))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get('SUPABASE_KEEPALIVE_EXPIRY', '30'))
+
+# Files above this size are uploaded in resumable parts (see SUPABASE_SETUP.md)
+SUPABASE_RESUMABLE_THRESHOLD = int(os.environ.get('SUPABASE_RESUMABLE_THRESHOLD', 6 * 1024 * 1024))
+SUPABASE_RESUMABLE_CHUNK_SIZE = int(os.environ.get('SUPABASE_RESUMABLE_CHUNK_SIZE', 6 * 1024 * 1024))
+SUPABASE_RESUMABLE_RETRIES = int(os.environ.get('SUPABASE_RESUMABLE_RETRIES', '5'))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
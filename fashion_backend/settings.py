@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'fashion_images.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -51,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'fashion_images.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'fashion_backend.urls'
@@ -137,6 +139,99 @@ CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Bytes read per chunk when streaming files from MEDIA_ROOT
+MEDIA_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Let the front proxy send media files: None, 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache/lighttpd). With nginx, MEDIA_OFFLOAD_PREFIX must be an
+# `internal` location aliased to MEDIA_ROOT.
+MEDIA_OFFLOAD = None
+MEDIA_OFFLOAD_PREFIX = '/protected-media/'
+
+# Media files up to MEDIA_CACHE_MAX_FILE_SIZE bytes are kept in an in-process
+# LRU cache of at most MEDIA_CACHE_MAX_BYTES per worker (0 disables it). The
+# file limit admits the logos and loader (logo.png is ~960 KiB) and still
+# leaves room for several images in the budget.
+MEDIA_CACHE_MAX_BYTES = 16 * 1024 * 1024
+MEDIA_CACHE_MAX_FILE_SIZE = 2 * 1024 * 1024
+
+# Responsive image derivatives (see the generate_derivatives command)
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1280, 2048]
+IMAGE_DERIVATIVE_FORMATS = ['webp', 'jpeg']
+IMAGE_DERIVATIVE_QUALITY = 80
+# Read width/height/size/dominant color/BlurHash of local files when they are
+# saved (see the backfill_metadata command for existing rows)
+IMAGE_METADATA_ON_SAVE = True
+# Default `sizes` attribute sent with each srcset
+IMAGE_SIZES = '(max-width: 640px) 100vw, (max-width: 1280px) 50vw, 33vw'
+
+# How card_data is built: 'values' (rows straight from values_list()),
+# 'serializer' (the DRF serializers), 'postgres' (json_agg in the database)
+# or 'auto' (postgres on PostgreSQL, values elsewhere).
+CARD_DATA_ENGINE = 'auto'
+
+# Pre-rendered card_data/media_list JSON shared by all workers through mmap
+# (see the build_snapshots command). Only requests to the scheme://host
+# values in SNAPSHOT_ORIGINS are served from snapshots; the payloads embed
+# URLs built from the Host header, so other hosts are rendered live.
+CATALOG_SNAPSHOTS = True
+SNAPSHOT_ROOT = BASE_DIR / 'snapshots'
+SNAPSHOT_ORIGINS = ['http://localhost:8000', 'http://127.0.0.1:8000']
+
+# Per-worker budget for br/zstd/gzip bodies of the JSON API, compressed once
+# per payload and reused until the catalog changes (0 disables the cache)
+COMPRESSED_RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+
+# Where uploads go (fashion_images.storage): Supabase by default, or
+# 'fashion_images.storage.LocalStorageBackend' / 'InMemoryStorageBackend' to
+# run the migration and derivative commands offline. STORAGE_OPTIONS are
+# passed to the class, e.g. {'root': ..., 'latency': 0.05, 'bandwidth': 10e6}.
+STORAGE_BACKEND = 'fashion_images.supabase_service.SupabaseStorageService'
+STORAGE_OPTIONS = {}
+
+# Request metrics (fashion_images.metrics): latency, queries, serialization
+# time and bytes per route, served at /metrics in the Prometheus text format
+# (send `Authorization: Bearer <METRICS_TOKEN>`; without a token /metrics is
+# only served when DEBUG is on). SERVER_TIMING adds a Server-Timing header
+# with the same breakdown to every response; it exposes query counts and
+# timings to any client, so it is only on with DEBUG by default.
+# Counters are per worker process.
+METRICS_ENABLED = True
+METRICS_TOKEN = None
+SERVER_TIMING = DEBUG
+# Most queries each URL name may run, whatever the catalog size; going over
+# means an N+1 crept in. Requests with a session cookie are not checked, as
+# loading the session and user adds queries. QUERY_BUDGET_MODE 'raise' fails
+# the request, 'log' logs a warning and None only counts it in /metrics.
+QUERY_BUDGETS = {
+    'card-data': 5,
+    'teammember-card-data': 5,
+    'teammember-list': 4,
+    'teammember-detail': 3,
+    'mediafile-list': 2,
+    'mediafile-detail': 1,
+    'mediafile-media-list': 2,
+    # Staff only, so this includes the user lookup of Basic authentication
+    'duplicates': 4,
+    'mediafile-duplicates': 4,
+    'serve-media': 0,
+    'serve-image': 0,
+}
+QUERY_BUDGET_MODE = 'raise' if DEBUG else 'log'
+
+# Request profiling (fashion_images.profiling): staff users get a cProfile +
+# tracemalloc profile of a request by sending `X-Profile: 1` or `?profile=1`;
+# PROFILING_SAMPLE_RATE also profiles that fraction of all requests, public
+# traffic included (of the URL names in PROFILING_ROUTES when set); sampled
+# responses are unchanged. The newest PROFILING_MAX_PROFILES
+# are kept in PROFILING_ROOT; see the profiles command.
+PROFILING_ENABLED = True
+PROFILING_SAMPLE_RATE = 0
+PROFILING_ROUTES = []
+PROFILING_ROOT = BASE_DIR / 'profiles'
+PROFILING_MAX_PROFILES = 100
+PROFILING_TRACEMALLOC = True
+
 # Static files
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class FashionImagesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'fashion_images'
+
+    def ready(self):
+        # Register signal handlers that keep the catalog version current
+        from . import signals  # noqa: F401
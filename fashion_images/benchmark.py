@@ -0,0 +1,171 @@
+"""
+In-process load benchmark of the API endpoints
+
+Each endpoint is requested through the Django test client, so a run
+measures the view, ORM, serialization and compression cost without
+network noise. Per endpoint the report records latency percentiles,
+queries and bytes per response, and the peak RSS reached while it ran.
+Reports are plain JSON; compare_reports() diffs two of them to catch
+regressions before a deploy.
+"""
+import gc
+import os
+import platform
+import resource
+import sys
+import time
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import django
+
+REPORT_VERSION = 1
+
+# Default fraction by which a metric may grow before compare_reports() flags it
+DEFAULT_TOLERANCE = 0.2
+
+# Latency changes smaller than this are noise on any machine
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of an already sorted list"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(values, digits=3):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        'min': round(values[0], digits),
+        'p50': round(percentile(values, 0.50), digits),
+        'p95': round(percentile(values, 0.95), digits),
+        'p99': round(percentile(values, 0.99), digits),
+        'max': round(values[-1], digits),
+        'mean': round(sum(values) / len(values), digits),
+    }
+
+
+def reset_peak_rss():
+    """Reset the kernel's high-water mark so the next reading is per endpoint (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident set size in bytes (since the last reset_peak_rss() where supported)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def response_size(response):
+    """Bytes on the wire; streaming bodies are consumed, as a client would"""
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return size
+
+
+def run_endpoint(client, url, requests, warmup=0, headers=None, before_request=None):
+    """Request `url` `requests` times after `warmup` unmeasured requests and summarize the results"""
+    headers = headers or {}
+    for _ in range(warmup):
+        response_size(client.get(url, headers=headers))
+
+    gc.collect()
+    rss_reset = reset_peak_rss()
+    latencies, queries, sizes, statuses = [], [], [], set()
+    encoding = None
+    for _ in range(requests):
+        if before_request is not None:
+            before_request()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url, headers=headers)
+            size = response_size(response)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        sizes.append(size)
+        statuses.add(response.status_code)
+        encoding = response.get('Content-Encoding', 'identity')
+
+    return {
+        'url': url,
+        'requests': requests,
+        'status': sorted(statuses),
+        'content_encoding': encoding,
+        'latency_ms': summarize(latencies),
+        'queries': summarize(queries, digits=2),
+        'bytes': summarize(sizes, digits=1),
+        'peak_rss_bytes': peak_rss(),
+        'peak_rss_scope': 'endpoint' if rss_reset else 'process',
+    }
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def new_report(catalog, options):
+    return {
+        'version': REPORT_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'environment': environment_info(),
+        'catalog': catalog,
+        'options': options,
+        'endpoints': {},
+    }
+
+
+def compare_reports(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Regressions of `current` against `baseline`, as human-readable strings
+
+    Latency (p50/p95/p99), bytes and peak RSS may grow by `tolerance`;
+    any extra query per request is a regression.
+    """
+    regressions = []
+    for name, now in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        for key in ('p50', 'p95', 'p99'):
+            old, new = before['latency_ms'].get(key), now['latency_ms'].get(key)
+            if old is not None and new is not None and new > old * (1 + tolerance) and new - old >= MIN_LATENCY_DELTA_MS:
+                regressions.append(f'{name}: {key} latency {old:.2f} ms -> {new:.2f} ms')
+        old, new = before['queries'].get('max'), now['queries'].get('max')
+        if old is not None and new is not None and new > old:
+            regressions.append(f'{name}: queries per request {old:g} -> {new:g}')
+        old, new = before['bytes'].get('mean'), now['bytes'].get('mean')
+        if old is not None and new is not None and new > old * (1 + tolerance):
+            regressions.append(f'{name}: response size {old:.0f} -> {new:.0f} bytes')
+        old, new = before.get('peak_rss_bytes'), now.get('peak_rss_bytes')
+        if old and new and new > old * (1 + tolerance):
+            regressions.append(f'{name}: peak RSS {old // 1024} -> {new // 1024} KiB')
+    return regressions
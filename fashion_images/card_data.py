@@ -0,0 +1,242 @@
+"""
+Builders for the card-data payload
+
+`serializer_card_data` is the reference implementation on top of the DRF
+serializers. `values_card_data` builds the same structure from three
+`values_list()` queries in a single pass, without model instances or
+serializer fields. On PostgreSQL, `postgres_card_data` has the database
+assemble the whole payload with json_agg/json_build_object and return it as
+one text value. tests/test_card_data.py (run on PostgreSQL in CI) and the
+check_card_data command verify they all agree.
+
+'auto' picks `postgres` on PostgreSQL and `values` everywhere else.
+"""
+from collections import defaultdict
+import json
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Prefetch
+from .metrics import timed
+from .models import TeamMember, FashionImage, ImageDerivative
+from .renderers import ORJSONRenderer
+from .serializers import TeamMemberSerializer
+
+CARD_DATA_ENGINES = ('values', 'serializer', 'postgres')
+
+# Images in display order; `id` breaks ties between equal `order` values
+IMAGE_ORDERING = ('order', 'id')
+
+
+def card_members_queryset():
+    """Team members with their images and derivatives prefetched for the serializers"""
+    images = FashionImage.objects.order_by(*IMAGE_ORDERING).prefetch_related('derivatives')
+    return TeamMember.objects.prefetch_related(Prefetch('images', queryset=images)).order_by('id')
+
+
+def get_card_data_engine():
+    """CARD_DATA_ENGINE, with 'auto' resolved to 'postgres' on PostgreSQL, else 'values'"""
+    engine = getattr(settings, 'CARD_DATA_ENGINE', 'auto')
+    if engine == 'auto':
+        return 'postgres' if connection.vendor == 'postgresql' else 'values'
+    if engine not in CARD_DATA_ENGINES:
+        raise ImproperlyConfigured(
+            f"CARD_DATA_ENGINE must be 'auto' or one of {', '.join(CARD_DATA_ENGINES)}, not {engine!r}"
+        )
+    if engine == 'postgres' and connection.vendor != 'postgresql':
+        raise ImproperlyConfigured(f"CARD_DATA_ENGINE 'postgres' needs PostgreSQL, not {connection.vendor}")
+    return engine
+
+
+def serializer_card_data(request, members=None):
+    """Card data through TeamMemberSerializer; `members` defaults to the whole catalog"""
+    if members is None:
+        members = card_members_queryset()
+    serializer = TeamMemberSerializer(members, many=True, context={'request': request})
+
+    # Transform the data to match frontend format
+    card_data = []
+    for member in serializer.data:
+        card_data.append({
+            'id': member['id'],
+            'name': member['name'],
+            'title': member['title'],
+            'images': [img['image_url'] for img in member['images']],
+            # Responsive variants aligned with `images`, ready for <img srcset sizes>
+            'imageSources': [
+                {
+                    'src': img['image_url'],
+                    'srcset': img['srcset'],
+                    'webpSrcset': img['webp_srcset'],
+                    'sizes': img['sizes'],
+                    # Lets clients reserve layout space and paint a placeholder
+                    'width': img['width'],
+                    'height': img['height'],
+                    'dominantColor': img['dominant_color'],
+                    'blurhash': img['blurhash'],
+                }
+                for img in member['images']
+            ],
+            'viewUrl': member['view_url']
+        })
+    return card_data
+
+
+def values_card_data(request, member_ids=None):
+    """
+    Card data built straight from database rows
+
+    Mirrors FashionImageSerializer: the Supabase URL, else a local
+    /media/images/ URL on the request's host, one srcset per format and the
+    stored placeholder metadata.
+    """
+    members = TeamMember.objects.order_by('id')
+    images = FashionImage.objects.order_by(*IMAGE_ORDERING)
+    derivatives = ImageDerivative.objects.order_by('width')
+    if member_ids is not None:
+        members = members.filter(id__in=member_ids)
+        images = images.filter(team_member_id__in=member_ids)
+        derivatives = derivatives.filter(image__team_member_id__in=member_ids)
+
+    local_prefix = f"{request.scheme}://{request.get_host()}" if request else ''
+    sizes = settings.IMAGE_SIZES
+
+    srcsets = defaultdict(lambda: {'jpeg': [], 'webp': []})
+    for image_id, image_format, url, width in derivatives.values_list('image_id', 'format', 'url', 'width'):
+        srcsets[image_id][image_format].append(f"{url} {width}w")
+
+    member_images = defaultdict(list)
+    rows = images.values_list(
+        'id', 'team_member_id', 'image_url', 'image_file', 'width', 'height', 'dominant_color', 'blurhash'
+    )
+    for image_id, member_id, image_url, image_file, width, height, color, image_blurhash in rows:
+        if not image_url and image_file:
+            image_url = f"{local_prefix}/media/images/{image_file.split('/')[-1]}"
+        image_srcsets = srcsets.get(image_id)
+        member_images[member_id].append({
+            'src': image_url or None,
+            'srcset': ', '.join(image_srcsets['jpeg']) if image_srcsets else '',
+            'webpSrcset': ', '.join(image_srcsets['webp']) if image_srcsets else '',
+            'sizes': sizes,
+            'width': width,
+            'height': height,
+            'dominantColor': color,
+            'blurhash': image_blurhash,
+        })
+
+    card_data = []
+    for member_id, name, title, view_url in members.values_list('id', 'name', 'title', 'view_url'):
+        sources = member_images.get(member_id, [])
+        card_data.append({
+            'id': member_id,
+            'name': name,
+            'title': title,
+            'images': [source['src'] for source in sources],
+            'imageSources': sources,
+            'viewUrl': view_url,
+        })
+    return card_data
+
+
+def _postgres_card_data_sql(filter_members):
+    tables = {
+        'members': TeamMember._meta.db_table,
+        'images': FashionImage._meta.db_table,
+        'derivatives': ImageDerivative._meta.db_table,
+    }
+    member_filter = 'WHERE m.id = ANY(%(member_ids)s)' if filter_members else ''
+    image_filter = 'WHERE i.team_member_id = ANY(%(member_ids)s)' if filter_members else ''
+    srcset = """COALESCE((
+            SELECT string_agg(d.url || ' ' || d.width || 'w', ', ' ORDER BY d.width)
+            FROM {derivatives} d WHERE d.image_id = i.id AND d.format = '{format}'
+        ), '')"""
+    return f"""
+        WITH images AS (
+            SELECT
+                i.id,
+                i.team_member_id,
+                i."order",
+                CASE
+                    WHEN COALESCE(i.image_url, '') <> '' THEN i.image_url
+                    WHEN COALESCE(i.image_file, '') <> ''
+                        THEN %(local_prefix)s::text || '/media/images/' || regexp_replace(i.image_file, '^.*/', '')
+                END AS src,
+                i.width,
+                i.height,
+                i.dominant_color,
+                i.blurhash,
+                {srcset.format(format='jpeg', **tables)} AS srcset,
+                {srcset.format(format='webp', **tables)} AS webp_srcset
+            FROM {tables['images']} i
+            {image_filter}
+        )
+        SELECT COALESCE(json_agg(card ORDER BY member_id), '[]'::json)::text
+        FROM (
+            SELECT m.id AS member_id, json_build_object(
+                'id', m.id,
+                'name', m.name,
+                'title', m.title,
+                'images', COALESCE((
+                    SELECT json_agg(img.src ORDER BY img."order", img.id)
+                    FROM images img WHERE img.team_member_id = m.id
+                ), '[]'::json),
+                'imageSources', COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'src', img.src,
+                        'srcset', img.srcset,
+                        'webpSrcset', img.webp_srcset,
+                        'sizes', %(sizes)s::text,
+                        'width', img.width,
+                        'height', img.height,
+                        'dominantColor', img.dominant_color,
+                        'blurhash', img.blurhash
+                    ) ORDER BY img."order", img.id)
+                    FROM images img WHERE img.team_member_id = m.id
+                ), '[]'::json),
+                'viewUrl', m.view_url
+            ) AS card
+            FROM {tables['members']} m
+            {member_filter}
+        ) cards
+    """
+
+
+def postgres_card_data(request, member_ids=None):
+    """
+    Card data as a JSON string assembled by PostgreSQL in a single row
+
+    The text is equivalent to the other engines' output once parsed, but
+    PostgreSQL formats it with its own spacing.
+    """
+    params = {
+        'local_prefix': f"{request.scheme}://{request.get_host()}" if request else '',
+        'sizes': settings.IMAGE_SIZES,
+        'member_ids': list(member_ids) if member_ids is not None else None,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_postgres_card_data_sql(member_ids is not None), params)
+        return cursor.fetchone()[0]
+
+
+def build_card_data(request, member_ids=None, engine=None):
+    """Card data for the given team members (default: all) as Python objects"""
+    engine = engine or get_card_data_engine()
+    if engine == 'serializer':
+        members = card_members_queryset()
+        if member_ids is not None:
+            members = members.filter(id__in=member_ids)
+        return serializer_card_data(request, members)
+    if engine == 'postgres':
+        return json.loads(postgres_card_data(request, member_ids))
+    return values_card_data(request, member_ids)
+
+
+def render_card_data(request, member_ids=None, engine=None):
+    """Card data rendered to JSON bytes"""
+    engine = engine or get_card_data_engine()
+    if engine == 'postgres':
+        # Already JSON; hand the database's text straight to the response
+        return postgres_card_data(request, member_ids).encode()
+    data = build_card_data(request, member_ids, engine)
+    with timed('serialize'):
+        return ORJSONRenderer().render(data)
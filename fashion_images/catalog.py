@@ -0,0 +1,39 @@
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from .models import CatalogVersion
+
+# The catalog version lives in a single row so every worker sees the same value
+CATALOG_VERSION_PK = 1
+
+
+def get_catalog_version():
+    """Return the current CatalogVersion row (one primary-key lookup)"""
+    catalog, _ = CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK)
+    return catalog
+
+
+def bump_catalog_version():
+    """Increment the catalog version after any change to the card or media data"""
+    updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).update(
+        version=F('version') + 1,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_PK, defaults={'version': 1})
+
+
+def apply_catalog_validators(response, catalog, vary_on_host=False):
+    """Attach ETag/Last-Modified derived from the catalog version to a response
+
+    Bodies holding absolute URLs built from the request pass vary_on_host, so a
+    cached copy for one host is never revalidated and reused for another.
+    """
+    response['ETag'] = catalog.etag
+    response['Last-Modified'] = http_date(catalog.last_modified)
+    # Clients may keep the body but must revalidate before reusing it
+    patch_cache_control(response, no_cache=True)
+    if vary_on_host:
+        patch_vary_headers(response, ['Host'])
+    return response
@@ -0,0 +1,180 @@
+"""
+Content-Encoding negotiation and cached compressed JSON bodies
+
+The catalog JSON only changes when the catalog version does, so each body
+is compressed once per encoding and process and reused until the next
+change. Bodies are cached under a digest of the rendered JSON: it changes
+with the catalog version without a query to look that up, and a stale
+compressed copy can never be served. brotli and zstd are used when their
+packages (`brotli`, `zstandard`, both in requirements.txt) are installed;
+gzip always is.
+
+Bodies compressed on the request path use moderate levels, which are
+several times faster than the maximum ones at a few percent larger output;
+snapshots are compressed once per catalog change and use the maximum.
+"""
+from collections import OrderedDict
+import gzip
+import hashlib
+import threading
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from .metrics import timed
+
+try:
+    import brotli
+except ImportError:  # brotli variants are optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd variants are optional
+    zstandard = None
+
+# Encodings in order of preference when the client accepts several
+ENCODINGS = ('br', 'zstd', 'gzip', 'identity')
+
+# Smaller bodies are sent as they are; the headers would cost more than the savings
+MIN_COMPRESS_SIZE = 512
+
+
+def available_encodings():
+    missing = {'br': brotli is None, 'zstd': zstandard is None}
+    return [encoding for encoding in ENCODINGS if not missing.get(encoding)]
+
+
+# Levels used while a client waits, and for bodies compressed ahead of time
+COMPRESSION_LEVELS = {'br': 5, 'zstd': 3, 'gzip': 6}
+BEST_COMPRESSION_LEVELS = {'br': 11, 'zstd': 19, 'gzip': 9}
+
+
+def compress(content, encoding, best=False):
+    """`content` in `encoding`; `best` selects the maximum level for bodies built ahead of time"""
+    level = (BEST_COMPRESSION_LEVELS if best else COMPRESSION_LEVELS).get(encoding)
+    if encoding == 'br':
+        return brotli.compress(content, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(content)
+    if encoding == 'gzip':
+        return gzip.compress(content, compresslevel=level, mtime=0)
+    return content
+
+
+def weaken_etag(response):
+    """Compressed bytes differ from the identity representation, so their ETag must be weak"""
+    if response.has_header('ETag') and not response['ETag'].startswith('W/'):
+        response['ETag'] = 'W/' + response['ETag']
+
+
+def negotiate_encoding(request, encodings=None):
+    """Best of `encodings` (default: all available) that the client accepts"""
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        # "gzip;q=0" explicitly refuses an encoding
+        if params.replace(' ', '').lower() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    for encoding in encodings or available_encodings():
+        if encoding == 'identity' or encoding in accepted:
+            return encoding
+    return 'identity'
+
+
+class CompressedBodyCache:
+    """Byte-budgeted LRU of compressed response bodies"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self.entries[key] = body
+            self.current_bytes += len(body)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_compressed_body_cache():
+    """The process-wide cache, or None when COMPRESSED_RESPONSE_CACHE_BYTES is 0"""
+    global _cache
+    max_bytes = getattr(settings, 'COMPRESSED_RESPONSE_CACHE_BYTES', 32 * 1024 * 1024)
+    if not max_bytes:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.max_bytes != max_bytes:
+            _cache = CompressedBodyCache(max_bytes)
+        return _cache
+
+
+def compress_response(request, response):
+    """
+    Compress a rendered JSON response for the client, reusing the body
+    compressed for an earlier identical response
+
+    Streaming and non-200 responses are returned unchanged, as are already
+    encoded ones (snapshots) apart from their ETag, which is weakened.
+    """
+    if response.has_header('Content-Encoding'):
+        weaken_etag(response)
+        return response
+    if (response.streaming or response.status_code != 200
+            or not response.get('Content-Type', '').startswith('application/json')):
+        return response
+    patch_vary_headers(response, ['Accept-Encoding'])
+
+    encoding = negotiate_encoding(request)
+    content = response.content
+    if encoding == 'identity' or len(content) < MIN_COMPRESS_SIZE:
+        return response
+
+    key = (encoding, hashlib.sha1(content).digest())
+    cache = get_compressed_body_cache()
+    body = cache.get(key) if cache else None
+    if body is None:
+        body = compress(content, encoding)
+        if cache:
+            cache.set(key, body)
+
+    response.content = body
+    response['Content-Length'] = str(len(body))
+    response['Content-Encoding'] = encoding
+    weaken_etag(response)
+    return response
+
+
+class CompressedResponseMixin:
+    """ViewSet mixin negotiating br/zstd/gzip for every JSON response it returns"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            with timed('serialize'):
+                response.render()
+        with timed('compress'):
+            return compress_response(request, response)
@@ -0,0 +1,158 @@
+"""
+Near-duplicate search over the stored dHash values
+
+Uses multi-index hashing: a 64-bit hash is split into radius + 1 chunks,
+and by the pigeonhole principle two hashes within `radius` bits agree
+exactly on at least one chunk. Each chunk gets a dict index, so a lookup
+only compares against hashes that share a chunk instead of every image.
+Chunks narrow as the radius grows, so large radii approach a comparison of
+every pair; the API stops at MAX_API_DUPLICATE_DISTANCE and caches its
+results, and larger radii are left to the find_duplicates command.
+"""
+import threading
+from .models import FashionImage, MediaFile
+
+HASH_BITS = 64
+# Largest Hamming distance accepted by the find_duplicates command
+MAX_DUPLICATE_DISTANCE = 16
+# Largest accepted by the API: 9 chunks of 7 bits still rule out most pairs
+MAX_API_DUPLICATE_DISTANCE = 8
+DEFAULT_DUPLICATE_DISTANCE = 6
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class HammingIndex:
+    """Exact radius search over integer hashes for one fixed radius"""
+
+    def __init__(self, radius, bits=HASH_BITS):
+        self.radius = radius
+        # (shift, mask) per chunk; chunk widths differ by at most one bit
+        chunks = radius + 1
+        self.chunks = []
+        shift = 0
+        for i in range(chunks):
+            width = bits // chunks + (1 if i < bits % chunks else 0)
+            self.chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [{} for _ in self.chunks]
+        self.keys = {}
+
+    def add(self, value, key):
+        keys = self.keys.get(value)
+        if keys is not None:
+            keys.append(key)
+            return
+        self.keys[value] = [key]
+        for (shift, mask), table in zip(self.chunks, self.tables):
+            table.setdefault((value >> shift) & mask, []).append(value)
+
+    def search(self, value):
+        """Keys whose hash is within the radius of `value`, as (key, distance) pairs"""
+        seen = set()
+        results = []
+        for (shift, mask), table in zip(self.chunks, self.tables):
+            for candidate in table.get((value >> shift) & mask, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = hamming(value, candidate)
+                if distance <= self.radius:
+                    results.extend((key, distance) for key in self.keys[candidate])
+        return results
+
+
+def find_clusters(items, radius=DEFAULT_DUPLICATE_DISTANCE):
+    """
+    Group keys whose hashes are within `radius` bits, transitively
+
+    Args:
+        items: Iterable of (key, hash as int)
+
+    Returns:
+        Clusters with at least two keys, each a list in input order
+    """
+    index = HammingIndex(radius)
+    order = {}
+    for key, value in items:
+        index.add(value, key)
+        order[key] = len(order)
+
+    parent = {key: key for key in order}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    # One search per distinct hash; exact copies come back from it too
+    for value, keys in index.keys.items():
+        root = find(keys[0])
+        for key, _ in index.search(value):
+            other = find(key)
+            if other != root:
+                parent[other] = root
+
+    clusters = {}
+    for key in order:
+        clusters.setdefault(find(key), []).append(key)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def duplicate_clusters(radius=DEFAULT_DUPLICATE_DISTANCE):
+    """
+    Clusters of near-identical FashionImage and MediaFile rows
+
+    Returns:
+        List of clusters (largest first), each a list of dicts with type,
+        id, name, url, size and dhash
+    """
+    entries = {}
+    for model, url_field in ((FashionImage, 'image_url'), (MediaFile, 'file_url')):
+        rows = model.objects.exclude(dhash='').select_related(
+            *(['team_member'] if model is FashionImage else [])
+        ).iterator(chunk_size=2000)
+        for obj in rows:
+            entries[(model._meta.model_name, obj.pk)] = {
+                'type': model._meta.model_name,
+                'id': obj.pk,
+                'name': str(obj),
+                'url': getattr(obj, url_field),
+                'size': obj.size,
+                'dhash': obj.dhash,
+            }
+
+    clusters = find_clusters(((key, int(entry['dhash'], 16)) for key, entry in entries.items()), radius)
+    clusters.sort(key=len, reverse=True)
+    return [[entries[key] for key in cluster] for cluster in clusters]
+
+
+# Clusters by radius for one catalog ETag
+_cached_clusters = {'etag': None, 'clusters': {}}
+_cached_clusters_lock = threading.Lock()
+
+
+def cached_duplicate_clusters(catalog, radius=DEFAULT_DUPLICATE_DISTANCE):
+    """
+    duplicate_clusters() computed once per catalog version and radius in
+    this process
+
+    Concurrent misses wait for the first one instead of all searching at once.
+    """
+    with _cached_clusters_lock:
+        if _cached_clusters['etag'] != catalog.etag:
+            _cached_clusters['etag'] = catalog.etag
+            _cached_clusters['clusters'] = {}
+        clusters = _cached_clusters['clusters'].get(radius)
+        if clusters is None:
+            clusters = _cached_clusters['clusters'][radius] = duplicate_clusters(radius)
+        return clusters
+
+
+def wasted_bytes(cluster):
+    """Bytes that would be saved by keeping only the largest copy"""
+    sizes = [entry['size'] or 0 for entry in cluster]
+    return sum(sizes) - max(sizes)
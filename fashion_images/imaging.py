@@ -0,0 +1,294 @@
+"""
+Image processing helpers that run inside worker processes
+
+Nothing here touches Django models, so these functions can be shipped to a
+ProcessPoolExecutor regardless of the multiprocessing start method.
+"""
+import io
+import mimetypes
+import os
+import time
+import urllib.request
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+EXIF_ORIENTATION = 0x0112
+
+# Derivative format name -> Pillow encoder and file extension
+DERIVATIVE_ENCODERS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+}
+
+
+def open_image(source):
+    """Open a local path or an http(s) URL as a Pillow image"""
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=60) as response:
+            return Image.open(io.BytesIO(response.read()))
+    return Image.open(source)
+
+
+def encode_image(img, image_format, quality):
+    """Encode an RGB image into bytes in memory"""
+    encoder, _ = DERIVATIVE_ENCODERS[image_format]
+    buffer = io.BytesIO()
+    if image_format == 'jpeg':
+        img.save(buffer, encoder, quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(buffer, encoder, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def render_derivatives(source, targets, quality=80):
+    """
+    Resize one image to several widths and encode each in the requested formats
+
+    Args:
+        source: Local path or URL of the original image
+        targets: (width, format) pairs; widths larger than the original are skipped
+        quality: Encoder quality for both JPEG and WebP
+
+    Returns:
+        List of dicts with width, height, format, extension and content (bytes)
+    """
+    widths = sorted({width for width, _ in targets}, reverse=True)
+    with open_image(source) as img:
+        # Let the JPEG decoder downscale by a power of two while loading; both
+        # sides stay >= the largest width in case EXIF rotation swaps them
+        img.draft('RGB', (widths[0], widths[0]))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        widths = [width for width in widths if width <= img.width]
+        if not widths:
+            return []
+
+        renditions = []
+        # Resize from the previous (larger) rendition to keep each step cheap
+        resized = img
+        for width in widths:
+            height = max(1, round(width * resized.height / resized.width))
+            resized = resized.resize((width, height), Image.LANCZOS)
+            for target_width, image_format in targets:
+                if target_width != width:
+                    continue
+                renditions.append({
+                    'width': width,
+                    'height': height,
+                    'format': image_format,
+                    'extension': DERIVATIVE_ENCODERS[image_format][1],
+                    'content': encode_image(resized, image_format, quality),
+                })
+        return renditions
+
+
+def derivative_file_name(original_name, width, extension):
+    """e.g. ('images/1.jpg', 640, '.webp') -> '1-640w.webp'"""
+    stem = os.path.splitext(os.path.basename(original_name))[0]
+    return f"{stem}-{width}w{extension}"
+
+
+def _encode_jpeg(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _best_quality(img, max_bytes, min_quality, max_quality):
+    """Binary-search the highest JPEG quality whose encoding fits in max_bytes"""
+    smallest = _encode_jpeg(img, min_quality)
+    if len(smallest) > max_bytes:
+        return None, smallest
+
+    best_quality, best = min_quality, smallest
+    low, high = min_quality + 1, max_quality
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode_jpeg(img, quality)
+        if len(data) <= max_bytes:
+            best_quality, best = quality, data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best_quality, best
+
+
+def compress_to_jpeg(input_path, max_bytes, min_quality=60, max_quality=95):
+    """
+    Compress an image to a JPEG of at most max_bytes, entirely in memory
+
+    Picks the highest quality in [min_quality, max_quality] that fits. When
+    even min_quality is too large the image is downscaled by halves (decoded
+    straight at the smaller size through JPEG draft mode) and searched again.
+
+    Returns:
+        Dict with content (bytes), quality, scale (downscale divisor),
+        original_size and seconds (time spent compressing)
+    """
+    started = time.perf_counter()
+    original_size = os.path.getsize(input_path)
+    scale = 1
+    while True:
+        with Image.open(input_path) as img:
+            target_size = (max(1, img.width // scale), max(1, img.height // scale))
+            if scale > 1:
+                # JPEG can decode directly at 1/2, 1/4 or 1/8 scale
+                img.draft('RGB', target_size)
+            # Orientations 5-8 rotate by 90 degrees, swapping the target axes
+            if img.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+                target_size = target_size[::-1]
+            img = ImageOps.exif_transpose(img)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            if scale > 1 and img.size != target_size:
+                img = img.resize(target_size, Image.LANCZOS)
+
+            quality, content = _best_quality(img, max_bytes, min_quality, max_quality)
+            # Give up shrinking once the image is thumbnail-sized
+            if quality is not None or min(img.size) <= 64:
+                return {
+                    'content': content,
+                    'quality': quality or min_quality,
+                    'scale': scale,
+                    'original_size': original_size,
+                    'seconds': time.perf_counter() - started,
+                }
+        scale *= 2
+
+
+# Side of the thumbnail dominant colors and blurhashes are computed from
+METADATA_THUMBNAIL_SIZE = 64
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _base83(value, length):
+    return ''.join(BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(pixels):
+    values = pixels / 255.0
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value):
+    value = min(1.0, max(0.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(pixels, x_components=4, y_components=3):
+    """
+    Encode an RGB uint8 array of shape (height, width, 3) as a BlurHash
+
+    All basis functions are evaluated at once as two small cosine matrices
+    contracted against the linearised pixels.
+    """
+    height, width = pixels.shape[:2]
+    linear = _srgb_to_linear(pixels.astype(np.float64))
+    cos_y = np.cos(np.pi * np.outer(np.arange(y_components), np.arange(height)) / height)
+    cos_x = np.cos(np.pi * np.outer(np.arange(x_components), np.arange(width)) / width)
+    # factors[j, i] = mean over pixels of cos_y[j, y] * cos_x[i, x] * linear[y, x]
+    factors = np.einsum('jy,ix,yxc->jic', cos_y, cos_x, linear) / (width * height)
+    factors[1:, :] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    quantised = np.clip(np.floor(np.sign(ac) * np.sqrt(np.abs(ac / max_value)) * 9 + 9.5), 0, 18).astype(int)
+    for r, g, b in quantised:
+        result += _base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+
+def dominant_color(pixels):
+    """
+    Most common color of an RGB uint8 array as '#rrggbb'
+
+    Pixels are bucketed at 4 bits per channel with one bincount; the result
+    is the mean of the pixels in the fullest bucket.
+    """
+    flat = pixels.reshape(-1, 3)
+    buckets = ((flat >> 4).astype(np.int32) * np.array([256, 16, 1])).sum(axis=1)
+    fullest = np.bincount(buckets, minlength=4096).argmax()
+    r, g, b = np.rint(flat[buckets == fullest].mean(axis=0)).astype(int)
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def dhash(pixels, hash_size=8):
+    """
+    Difference hash of an RGB uint8 array as a hex string
+
+    Each bit says whether a pixel of the (hash_size + 1) x hash_size
+    grayscale thumbnail is brighter than its right neighbour; re-encoded or
+    resized copies of an image land within a few bits of each other.
+    """
+    gray = Image.fromarray(pixels).convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    values = np.asarray(gray, dtype=np.int16)
+    bits = (values[:, 1:] > values[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+def image_metadata(source):
+    """
+    Dimensions, byte size, MIME type, dominant color, BlurHash and dHash of a file
+
+    `source` is a local path or an http(s) URL. Files Pillow cannot open
+    (videos, for instance) only get size and mime, and remote non-image
+    URLs are not downloaded at all. Dimensions are reported after EXIF
+    rotation, as browsers display them.
+    """
+    mime = mimetypes.guess_type(source.split('?')[0])[0] or ''
+    metadata = {
+        'width': None,
+        'height': None,
+        'size': None,
+        'mime': mime,
+        'dominant_color': '',
+        'blurhash': '',
+        'dhash': '',
+    }
+    if source.startswith(('http://', 'https://')):
+        if mime and not mime.startswith('image/'):
+            return metadata
+        with urllib.request.urlopen(source, timeout=60) as response:
+            data = response.read()
+        metadata['size'] = len(data)
+        image_file = io.BytesIO(data)
+    else:
+        metadata['size'] = os.path.getsize(source)
+        image_file = source
+
+    try:
+        img = Image.open(image_file)
+    except (UnidentifiedImageError, OSError):
+        return metadata
+
+    with img:
+        metadata['mime'] = Image.MIME.get(img.format) or metadata['mime']
+        rotated = img.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+        metadata['width'], metadata['height'] = (img.height, img.width) if rotated else img.size
+        img.draft('RGB', (METADATA_THUMBNAIL_SIZE, METADATA_THUMBNAIL_SIZE))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail((METADATA_THUMBNAIL_SIZE, METADATA_THUMBNAIL_SIZE))
+        pixels = np.asarray(img)
+
+    metadata['dominant_color'] = dominant_color(pixels)
+    metadata['blurhash'] = blurhash(pixels)
+    metadata['dhash'] = dhash(pixels)
+    return metadata
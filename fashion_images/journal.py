@@ -0,0 +1,216 @@
+from itertools import islice
+import time
+from django.db import transaction
+from django.db.models import Count
+from .catalog import bump_catalog_version
+from .models import MigrationJournalEntry
+from .storage import file_sha256
+
+JOURNAL_UNIQUE_FIELDS = ['command', 'object_type', 'object_id']
+
+# Finished uploads are journaled in flushes of at most this many, or of
+# those finished within this many seconds, whichever comes first
+UPLOADED_FLUSH_SIZE = 20
+UPLOADED_FLUSH_SECONDS = 1.0
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items without materializing the iterable"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class MigrationJournal:
+    """
+    Tracks each object of a migration run through pending -> uploading ->
+    uploaded -> committed in the database so an interrupted run can resume
+
+    Entries are read and written a batch at a time, so journal queries grow
+    with rows / batch size rather than with rows. Finished uploads are the
+    exception: they are journaled in small flushes (UPLOADED_FLUSH_SIZE), so a
+    killed run loses the record of only a few uploads, not of a whole batch.
+    All methods must be called from the command's main thread.
+    """
+
+    def __init__(self, command, resume=False):
+        self.command = command
+        self.resume = resume
+        # Entries of the batch currently being scanned
+        self.entries = {}
+        # Entries waiting to be written as uploading by start_uploads()
+        self.queued = []
+        # Finished uploads waiting to be written as uploaded by flush_uploaded()
+        self.finished = []
+        self.finished_since = None
+        # Uploads a previous run started but never finished; may have left orphans
+        self.interrupted = []
+        # Objects whose upload from a previous run was applied without re-uploading
+        self.recovered = 0
+        if not resume:
+            MigrationJournalEntry.objects.filter(command=command).delete()
+
+    def _key(self, obj):
+        return obj._meta.model_name, obj.pk
+
+    def load(self, objs):
+        """Fetch the entries for one batch of objects of the same model"""
+        self.entries = {}
+        if not objs or not self.resume:
+            return
+        entries = MigrationJournalEntry.objects.filter(
+            command=self.command,
+            object_type=objs[0]._meta.model_name,
+            object_id__in=[obj.pk for obj in objs],
+        )
+        self.entries = {(entry.object_type, entry.object_id): entry for entry in entries}
+
+    def get(self, obj):
+        return self.entries.get(self._key(obj))
+
+    def is_committed(self, obj):
+        entry = self.get(obj)
+        return entry is not None and entry.state == 'committed'
+
+    def uploaded_url(self, obj, local_path):
+        """
+        URL of an upload that finished before the previous run stopped
+
+        Only returned while the local file still has the journaled digest, so
+        a file replaced since then is uploaded again.
+        """
+        entry = self.get(obj)
+        if entry is None or entry.state != 'uploaded' or not entry.url:
+            return None
+        if entry.digest and entry.digest != file_sha256(local_path):
+            return None
+        return entry.url
+
+    def _entry(self, obj, **fields):
+        object_type, object_id = self._key(obj)
+        return MigrationJournalEntry(command=self.command, object_type=object_type, object_id=object_id, **fields)
+
+    def _write(self, entries, update_fields):
+        """Insert or update many entries in one query"""
+        MigrationJournalEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=JOURNAL_UNIQUE_FIELDS,
+            update_fields=update_fields + ['updated_at'],
+        )
+
+    def queue(self, obj):
+        """Record that an object will be uploaded by this run"""
+        previous = self.get(obj)
+        if previous is not None and previous.state in ('pending', 'uploading'):
+            self.interrupted.append(previous)
+        # The digest is taken by the upload worker and journaled with the URL
+        self.queued.append(self._entry(
+            obj,
+            state='uploading',
+            digest='',
+            attempts=(previous.attempts if previous else 0) + 1,
+            error='',
+        ))
+
+    def start_uploads(self):
+        """Journal the queued objects as uploading before any of them is handed to the uploader"""
+        if self.queued:
+            self._write(self.queued, ['state', 'digest', 'attempts', 'error'])
+            self.queued = []
+
+    def uploaded(self, obj, url, digest):
+        """Record a finished upload and the digest of the file that was sent"""
+        if not self.finished:
+            self.finished_since = time.monotonic()
+        self.finished.append(self._entry(obj, state='uploaded', url=url, digest=digest or ''))
+        if (len(self.finished) >= UPLOADED_FLUSH_SIZE
+                or time.monotonic() - self.finished_since >= UPLOADED_FLUSH_SECONDS):
+            self.flush_uploaded()
+
+    def flush_uploaded(self):
+        if self.finished:
+            self._write(self.finished, ['state', 'url', 'digest'])
+            self.finished = []
+
+    def fail(self, failures):
+        """Record (obj, error) pairs as failed"""
+        if failures:
+            self._write([self._entry(obj, state='failed', error=error or '') for obj, error in failures], ['state', 'error'])
+
+    def commit(self, model, objs, update_fields):
+        """
+        Save a batch of migrated objects
+
+        Uploads still waiting to be journaled are written first, then the
+        objects are saved with bulk_update and marked committed in one
+        transaction.
+        """
+        self.flush_uploaded()
+        if not objs:
+            return
+        url_field = update_fields[0]
+        with transaction.atomic():
+            model.objects.bulk_update(objs, update_fields)
+            self._write([self._entry(obj, state='committed', url=getattr(obj, url_field)) for obj in objs], ['state', 'url'])
+            # bulk_update skips post_save, so invalidate cached catalog responses here
+            bump_catalog_version()
+
+    def report(self):
+        """Reconciliation summary lines for the end of a run"""
+        entries = MigrationJournalEntry.objects.filter(command=self.command)
+        counts = dict(entries.values_list('state').annotate(Count('id')))
+        lines = [
+            'Journal: ' + ', '.join(f'{counts.get(state, 0)} {state}' for state, _ in MigrationJournalEntry.STATE_CHOICES),
+        ]
+        if self.recovered:
+            lines.append(f'  {self.recovered} uploads from the previous run were committed without re-uploading')
+        if self.interrupted:
+            lines.append(
+                f'  {len(self.interrupted)} uploads were queued or in flight when the previous run stopped and were restarted; '
+                'any that had started may have left orphaned objects in storage:'
+            )
+            lines.extend(f'    {entry.object_type} {entry.object_id}' for entry in self.interrupted)
+        failed = entries.filter(state='failed').iterator()
+        lines.extend(f'  failed {entry.object_type} {entry.object_id}: {entry.error}' for entry in failed)
+        return lines
+
+
+class CommitBatcher:
+    """
+    Collects migrated objects and commits them through the journal in
+    batches of `batch_size`
+
+    Use as a context manager so the last partial batch is saved even when
+    the run stops early.
+    """
+
+    def __init__(self, journal, model, update_fields, batch_size=500):
+        self.journal = journal
+        self.model = model
+        self.update_fields = update_fields
+        self.batch_size = max(1, batch_size)
+        self.objects = []
+        self.failures = []
+
+    def add(self, obj):
+        self.objects.append(obj)
+        if len(self.objects) >= self.batch_size:
+            self.flush()
+
+    def add_failure(self, obj, error):
+        self.failures.append((obj, error))
+        if len(self.failures) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.journal.commit(self.model, self.objects, self.update_fields)
+        self.journal.fail(self.failures)
+        self.objects = []
+        self.failures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
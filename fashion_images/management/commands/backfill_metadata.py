@@ -0,0 +1,111 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from fashion_images.catalog import bump_catalog_version
+from fashion_images.imaging import image_metadata
+from fashion_images.metadata import METADATA_FIELDS, apply_metadata, metadata_is_current, metadata_source
+from fashion_images.models import FashionImage, MediaFile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Compute dimensions, size, MIME type, dominant color, BlurHash and dHash for images and media files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute metadata that is already up to date',
+        )
+        parser.add_argument(
+            '--local-only',
+            action='store_true',
+            help='Skip objects whose file only exists as a URL',
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: all cores)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Objects saved per database batch (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        self.force = options['force']
+        self.allow_remote = not options['local_only']
+        self.jobs = max(1, options['jobs'])
+        self.batch_size = max(1, options['batch_size'])
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for model in (FashionImage, MediaFile):
+                self.backfill(executor, model)
+
+        self.stdout.write(self.style.SUCCESS('Metadata backfill completed!'))
+
+    def pending(self, model, counts):
+        """Stream (obj, source) pairs whose metadata is missing or stale"""
+        objects = model.objects.order_by('pk').iterator(chunk_size=self.batch_size)
+        for obj in objects:
+            source = metadata_source(obj, allow_remote=self.allow_remote)
+            if not source:
+                counts['skipped'] += 1
+                continue
+            if metadata_is_current(obj, source) and not self.force:
+                counts['up to date'] += 1
+                continue
+            yield obj, source
+
+    def backfill(self, executor, model):
+        self.stdout.write(f'\nBackfilling {model.__name__} metadata with {self.jobs} processes...')
+        counts = {'updated': 0, 'up to date': 0, 'skipped': 0, 'errors': 0}
+        batch = []
+        pending = self.pending(model, counts)
+        running = {}
+        exhausted = False
+
+        while True:
+            # Keep a couple of files per worker in flight so rows are read lazily
+            while not exhausted and len(running) < self.jobs * 2:
+                item = next(pending, None)
+                if item is None:
+                    exhausted = True
+                    break
+                obj, source = item
+                running[executor.submit(image_metadata, source)] = (obj, source)
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                obj, source = running.pop(future)
+                try:
+                    metadata = future.result()
+                except Exception as e:
+                    counts['errors'] += 1
+                    self.stdout.write(self.style.ERROR(f'  Failed: {obj} ({e})'))
+                    continue
+                apply_metadata(obj, source, metadata)
+                batch.append(obj)
+                counts['updated'] += 1
+                if len(batch) >= self.batch_size:
+                    self.save(model, batch)
+                    batch = []
+        self.save(model, batch)
+
+        self.stdout.write(f'{model.__name__} metadata summary: ' + ', '.join(f'{count} {label}' for label, count in counts.items()))
+
+    def save(self, model, batch):
+        if not batch:
+            return
+        with transaction.atomic():
+            model.objects.bulk_update(batch, METADATA_FIELDS)
+            # bulk_update skips post_save, so invalidate cached catalog responses here
+            bump_catalog_version()
+        self.stdout.write(f'  Saved metadata for {len(batch)} {model.__name__} objects')
@@ -0,0 +1,189 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from fashion_images.benchmark import DEFAULT_TOLERANCE, compare_reports, new_report, run_endpoint
+from fashion_images.catalog import bump_catalog_version, get_catalog_version
+from fashion_images.compression import get_compressed_body_cache
+from fashion_images.media_cache import get_media_cache
+from fashion_images.models import TeamMember, FashionImage, ImageDerivative, MediaFile
+
+ENDPOINTS = {
+    'card_data': '/api/card-data/',
+    'card_data_page': '/api/card-data/?limit=100',
+    'team_members': '/api/team-members/',
+    'media_files': '/api/media-files/',
+    'media_list': '/api/media-files/media_list/',
+}
+
+class Command(BaseCommand):
+    help = 'Benchmark the API endpoints in-process and write a JSON report (latency, queries, bytes, peak RSS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Measured requests per endpoint (default: 50)',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=3,
+            help='Unmeasured requests per endpoint before measuring (default: 3)',
+        )
+        parser.add_argument(
+            '--endpoint',
+            choices=sorted([*ENDPOINTS, 'serve_media']),
+            action='append',
+            help='Endpoint to benchmark; repeat for several (default: all)',
+        )
+        parser.add_argument(
+            '--media-file',
+            help='<type>/<file> under MEDIA_ROOT for serve_media (default: the first file found)',
+        )
+        parser.add_argument(
+            '--accept-encoding',
+            default='gzip, deflate, br, zstd',
+            help="Accept-Encoding sent with every request; '' measures uncompressed bodies "
+                 "(default: 'gzip, deflate, br, zstd', like a browser)",
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Bump the catalog version and clear the in-process caches before every request',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file',
+        )
+        parser.add_argument(
+            '--compare',
+            help='Baseline report to compare with; exits with an error on regressions',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=DEFAULT_TOLERANCE,
+            help=f'Fraction latency, bytes and RSS may grow before --compare fails (default: {DEFAULT_TOLERANCE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('--requests must be >= 1 and --warmup >= 0')
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        endpoints = self.select_endpoints(options['endpoint'], options['media_file'])
+        headers = {'Accept-Encoding': options['accept_encoding']} if options['accept_encoding'] else {}
+        report = new_report(self.catalog_size(), {
+            'requests': options['requests'],
+            'warmup': options['warmup'],
+            'accept_encoding': options['accept_encoding'],
+            'cold': options['cold'],
+        })
+
+        # Snapshot testserver too, so card_data and media_list take the production path
+        with override_settings(ALLOWED_HOSTS=['testserver'], SNAPSHOT_ORIGINS=[*getattr(settings, 'SNAPSHOT_ORIGINS', []), 'http://testserver']):
+            client = Client()
+            for name, url in endpoints.items():
+                self.stdout.write(f'Benchmarking {name} ({url})...')
+                report['endpoints'][name] = run_endpoint(
+                    client, url, options['requests'], options['warmup'], headers,
+                    before_request=self.reset_caches if options['cold'] else None,
+                )
+
+        self.print_report(report)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"\nReport written to {options['output']}")
+
+        if baseline is not None:
+            self.compare(baseline, report, options['tolerance'])
+
+    def select_endpoints(self, names, media_file):
+        names = names or [*ENDPOINTS, 'serve_media']
+        endpoints = {name: ENDPOINTS[name] for name in names if name in ENDPOINTS}
+        if 'serve_media' in names:
+            media_file = media_file or self.first_media_file()
+            if media_file:
+                endpoints['serve_media'] = f'/media/{media_file}'
+            else:
+                self.stderr.write(self.style.WARNING(f'No media files under {settings.MEDIA_ROOT}; skipping serve_media'))
+        return endpoints
+
+    def first_media_file(self):
+        media_root = str(settings.MEDIA_ROOT)
+        if not os.path.isdir(media_root):
+            return None
+        for media_type in sorted(os.listdir(media_root)):
+            type_dir = os.path.join(media_root, media_type)
+            if not os.path.isdir(type_dir):
+                continue
+            for filename in sorted(os.listdir(type_dir)):
+                if os.path.isfile(os.path.join(type_dir, filename)):
+                    return f'{media_type}/{filename}'
+        return None
+
+    def catalog_size(self):
+        return {
+            'team_members': TeamMember.objects.count(),
+            'images': FashionImage.objects.count(),
+            'derivatives': ImageDerivative.objects.count(),
+            'media_files': MediaFile.objects.count(),
+            'catalog_version': get_catalog_version().version,
+        }
+
+    def reset_caches(self):
+        """Make the next request pay for a catalog change: new snapshot, cold body and file caches"""
+        bump_catalog_version()
+        for cache in (get_compressed_body_cache(), get_media_cache()):
+            if cache is not None:
+                cache.clear()
+
+    def print_report(self, report):
+        catalog = report['catalog']
+        self.stdout.write(
+            f"\n{catalog['team_members']} members, {catalog['images']} images, "
+            f"{catalog['media_files']} media files ({report['environment']['database']})\n"
+        )
+        self.stdout.write(f"{'endpoint':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'bytes':>12}{'peak RSS':>12}")
+        for name, result in report['endpoints'].items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name:<16}{latency['p50']:>10.2f}{latency['p95']:>10.2f}{latency['p99']:>10.2f}"
+                f"{result['queries']['max']:>9g}{result['bytes']['mean']:>12.0f}"
+                f"{result['peak_rss_bytes'] // (1024 * 1024):>9} MiB"
+            )
+            if result['status'] != [200]:
+                self.stdout.write(self.style.WARNING(f"  {name} answered with status {result['status']}"))
+
+    def compare(self, baseline, report, tolerance):
+        sizes = ('team_members', 'images', 'derivatives', 'media_files')
+        if any(baseline.get('catalog', {}).get(key) != report['catalog'][key] for key in sizes):
+            self.stderr.write(self.style.WARNING(
+                'The baseline was measured on a catalog of a different size; the comparison may not be meaningful'
+            ))
+        if baseline.get('options') != report['options']:
+            self.stderr.write(self.style.WARNING(
+                f"The baseline was run with other options ({baseline.get('options')}); the comparison may not be meaningful"
+            ))
+        regressions = compare_reports(baseline, report, tolerance)
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(f'  {regression}'))
+            raise CommandError(f'{len(regressions)} regression(s) against {self.baseline_name(baseline)}')
+        self.stdout.write(self.style.SUCCESS(f'\nNo regressions against {self.baseline_name(baseline)}'))
+
+    def baseline_name(self, baseline):
+        return f"the baseline from {baseline.get('created_at', 'an unknown date')}"
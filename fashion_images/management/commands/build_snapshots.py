@@ -0,0 +1,61 @@
+import os
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from fashion_images.catalog import get_catalog_version
+from fashion_images.card_data import render_card_data
+from fashion_images.models import MediaFile
+from fashion_images.compression import available_encodings
+from fashion_images.snapshots import snapshot_path, write_snapshot
+from fashion_images.views import MediaFileViewSet
+
+class Command(BaseCommand):
+    help = 'Render the card_data and media_list snapshots for the current catalog version'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--origin',
+            action='append',
+            help='scheme://host the API is served from; repeat for several (default: SNAPSHOT_ORIGINS)',
+        )
+
+    def handle(self, *args, **options):
+        origins = options['origin'] or getattr(settings, 'SNAPSHOT_ORIGINS', [])
+        if not origins:
+            raise CommandError('No origins given. Pass --origin https://api.example.com or set SNAPSHOT_ORIGINS.')
+
+        catalog = get_catalog_version()
+        self.stdout.write(f'Building snapshots for catalog version {catalog.version}...')
+        for origin in origins:
+            if origin not in getattr(settings, 'SNAPSHOT_ORIGINS', []):
+                self.stdout.write(self.style.WARNING(
+                    f'  {origin} is not in SNAPSHOT_ORIGINS; its requests are rendered live and never read this snapshot'
+                ))
+            request = self.make_request(origin)
+            snapshots = {
+                'card_data': lambda: render_card_data(request),
+                'media_list': lambda: JSONRenderer().render(
+                    MediaFileViewSet(request=request, format_kwarg=None).build_media_list(MediaFile.objects.all())
+                ),
+            }
+            for name, render in snapshots.items():
+                content = render()
+                write_snapshot(name, catalog, origin, content)
+                sizes = ', '.join(
+                    f'{encoding} {os.path.getsize(snapshot_path(name, catalog, origin, encoding))}B'
+                    for encoding in available_encodings()
+                )
+                self.stdout.write(f'  {origin} {name}: {sizes}')
+
+        self.stdout.write(self.style.SUCCESS('Snapshots built!'))
+
+    def make_request(self, origin):
+        """A GET request that looks like it arrived at `origin`"""
+        parts = urlsplit(origin)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise CommandError(f'Invalid origin {origin!r}; expected scheme://host')
+        request = RequestFactory().get('/', secure=parts.scheme == 'https', HTTP_HOST=parts.netloc)
+        return Request(request)
@@ -0,0 +1,68 @@
+import json
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from fashion_images.card_data import CARD_DATA_ENGINES, render_card_data, serializer_card_data, card_members_queryset
+from fashion_images.models import TeamMember
+
+class Command(BaseCommand):
+    help = ('Check that every card_data engine renders the same payload as the DRF serializer path on this '
+            'database (tests/test_card_data.py covers edge cases)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--origin',
+            default='http://testserver',
+            help='scheme://host used for local fallback image URLs (default: http://testserver)',
+        )
+
+    def handle(self, *args, **options):
+        parts = urlsplit(options['origin'])
+        request = Request(RequestFactory().get(
+            '/api/card-data/', secure=parts.scheme == 'https', HTTP_HOST=parts.netloc or 'testserver'
+        ))
+
+        # The origin only shapes local URLs; it need not be in ALLOWED_HOSTS
+        with override_settings(ALLOWED_HOSTS=[parts.hostname or 'testserver']):
+            failures = self.compare(request)
+
+        if failures:
+            raise CommandError(f'{failures} card_data parity check(s) failed')
+        self.stdout.write(self.style.SUCCESS('All card_data engines match the serializer output!'))
+
+    def compare(self, request):
+        member_ids = list(TeamMember.objects.order_by('id').values_list('id', flat=True))
+        subsets = {'all members': None, 'first page': member_ids[:3], 'no members': []}
+        failures = 0
+        for label, ids in subsets.items():
+            members = card_members_queryset()
+            if ids is not None:
+                members = members.filter(id__in=ids)
+            # What the endpoint returned before the fast paths existed
+            expected = JSONRenderer().render(serializer_card_data(request, members))
+            for engine in CARD_DATA_ENGINES:
+                if engine == 'postgres' and connection.vendor != 'postgresql':
+                    self.stdout.write(f'  SKIP {engine} ({label}): database is {connection.vendor}')
+                    continue
+                actual = render_card_data(request, ids, engine=engine)
+                if actual == expected:
+                    self.stdout.write(f'  OK   {engine} ({label}, {len(actual)} bytes)')
+                    continue
+                # PostgreSQL formats JSON its own way; the parsed payloads must still be equal
+                if engine == 'postgres' and json.loads(actual) == json.loads(expected):
+                    self.stdout.write(f'  OK   {engine} ({label}, equal after parsing, {len(actual)} bytes)')
+                    continue
+                failures += 1
+                offset = next(
+                    (i for i, (a, b) in enumerate(zip(actual, expected)) if a != b),
+                    min(len(actual), len(expected)),
+                )
+                self.stdout.write(self.style.ERROR(
+                    f'  FAIL {engine} ({label}): first difference at byte {offset}\n'
+                    f'       expected ...{expected[max(0, offset - 40):offset + 40]!r}\n'
+                    f'       actual   ...{actual[max(0, offset - 40):offset + 40]!r}'
+                ))
+        return failures
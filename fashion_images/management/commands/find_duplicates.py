@@ -0,0 +1,52 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from fashion_images.dedup import DEFAULT_DUPLICATE_DISTANCE, MAX_DUPLICATE_DISTANCE, duplicate_clusters, wasted_bytes
+from fashion_images.models import FashionImage, MediaFile
+
+class Command(BaseCommand):
+    help = 'List clusters of near-duplicate images and media files by dHash distance'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=DEFAULT_DUPLICATE_DISTANCE,
+            help=f'Maximum Hamming distance between hashes in a cluster (default: {DEFAULT_DUPLICATE_DISTANCE})',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the clusters as JSON',
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if not 0 <= threshold <= MAX_DUPLICATE_DISTANCE:
+            raise CommandError(f'--threshold must be between 0 and {MAX_DUPLICATE_DISTANCE}')
+
+        # Videos and other non-images keep an empty hash even after a backfill
+        unprocessed = sum(model.objects.filter(metadata_source='').count() for model in (FashionImage, MediaFile))
+        if unprocessed:
+            # stderr keeps --json output parseable
+            self.stderr.write(self.style.WARNING(
+                f'{unprocessed} objects have no metadata yet; run backfill_metadata to include them'
+            ))
+
+        clusters = duplicate_clusters(threshold)
+
+        if options['json']:
+            self.stdout.write(json.dumps(clusters, indent=2))
+            return
+
+        total_wasted = 0
+        for number, cluster in enumerate(clusters, 1):
+            wasted = wasted_bytes(cluster)
+            total_wasted += wasted
+            self.stdout.write(f'\nCluster {number} ({len(cluster)} copies, {wasted} bytes duplicated):')
+            for entry in cluster:
+                self.stdout.write(f"  {entry['type']} {entry['id']}: {entry['name']} [{entry['dhash']}] {entry['url'] or ''}")
+
+        duplicates = sum(len(cluster) - 1 for cluster in clusters)
+        self.stdout.write(self.style.SUCCESS(
+            f'\nFound {len(clusters)} clusters with {duplicates} duplicates ({total_wasted} bytes duplicated)'
+        ))
@@ -0,0 +1,194 @@
+import os
+import random
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from fashion_images.catalog import bump_catalog_version
+from fashion_images.models import TeamMember, FashionImage, ImageDerivative, MediaFile
+
+# Synthetic rows are recognisable by these prefixes so --clear never touches real data
+SYNTHETIC_VIEW_URL_PREFIX = '/synthetic/'
+SYNTHETIC_MEDIA_PREFIX = 'synthetic-'
+
+MAX_MEMBERS = 100000
+MAX_IMAGES_PER_MEMBER = 50
+
+FIRST_NAMES = ['Sarah', 'Emma', 'Maya', 'Jessica', 'Aisha', 'Priya', 'Olivia', 'Zara', 'Chloe', 'Ananya', 'Lena', 'Sofia']
+LAST_NAMES = ['Johnson', 'Wilson', 'Patel', 'Chen', 'Khan', 'Sharma', 'Garcia', 'Rossi', 'Kim', 'Mehta', 'Novak', 'Silva']
+TITLES = ['Creative Designer', 'Fashion Stylist', 'Brand Manager', 'Art Director', 'Textile Designer', 'Photographer']
+# Portrait shots at the sizes the real uploads come in
+IMAGE_SIZES = [(1080, 1350), (1200, 1800), (2000, 3000), (3024, 4032)]
+BLURHASH_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalog of team members, images and media files for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--members',
+            type=int,
+            default=1000,
+            help=f'Number of team members to create (1 to {MAX_MEMBERS}, default: 1000)',
+        )
+        parser.add_argument(
+            '--min-images',
+            type=int,
+            default=0,
+            help='Minimum number of images per member (default: 0)',
+        )
+        parser.add_argument(
+            '--max-images',
+            type=int,
+            default=10,
+            help=f'Maximum number of images per member (at most {MAX_IMAGES_PER_MEMBER}, default: 10)',
+        )
+        parser.add_argument(
+            '--media-files',
+            type=int,
+            default=50,
+            help='Number of media files to create (default: 50)',
+        )
+        parser.add_argument(
+            '--derivatives',
+            action='store_true',
+            help='Also create a derivative per IMAGE_DERIVATIVE_WIDTHS x IMAGE_DERIVATIVE_FORMATS for every image',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed; the same seed and sizes give the same catalog (default: 0)',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Delete previously generated synthetic rows first (real rows are kept)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Members inserted per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        members = options['members']
+        min_images, max_images = options['min_images'], options['max_images']
+        if not 1 <= members <= MAX_MEMBERS:
+            raise CommandError(f'--members must be between 1 and {MAX_MEMBERS}')
+        if not 0 <= min_images <= max_images <= MAX_IMAGES_PER_MEMBER:
+            raise CommandError(f'Expected 0 <= --min-images <= --max-images <= {MAX_IMAGES_PER_MEMBER}')
+        if options['media_files'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--media-files must be >= 0 and --batch-size >= 1')
+
+        self.rng = random.Random(options['seed'])
+        self.base_url = self.storage_base_url()
+
+        if options['clear']:
+            self.clear_synthetic()
+
+        created_images = created_derivatives = 0
+        batch_size = options['batch_size']
+        for start in range(0, members, batch_size):
+            count = min(batch_size, members - start)
+            images, derivatives = self.create_members(start, count, min_images, max_images, options['derivatives'])
+            created_images += images
+            created_derivatives += derivatives
+            self.stdout.write(f'  {start + count}/{members} members, {created_images} images')
+
+        self.create_media_files(options['media_files'])
+
+        # bulk_create() skips the signals that normally invalidate caches and snapshots
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\nCreated {members} members, {created_images} images, {created_derivatives} derivatives '
+            f'and {options["media_files"]} media files'
+        ))
+
+    def storage_base_url(self):
+        """Public URL prefix shaped like the real Supabase bucket so payload sizes are realistic"""
+        supabase_url = (os.getenv('SUPABASE_URL') or 'https://example.supabase.co').rstrip('/')
+        bucket = os.getenv('SUPABASE_BUCKET_NAME', 'fashion-images')
+        return f'{supabase_url}/storage/v1/object/public/{bucket}/synthetic'
+
+    def clear_synthetic(self):
+        members, _ = TeamMember.objects.filter(view_url__startswith=SYNTHETIC_VIEW_URL_PREFIX).delete()
+        media, _ = MediaFile.objects.filter(name__startswith=SYNTHETIC_MEDIA_PREFIX).delete()
+        self.stdout.write(f'Deleted {members + media} synthetic rows')
+
+    def create_members(self, start, count, min_images, max_images, with_derivatives):
+        rng = self.rng
+        with transaction.atomic():
+            members = TeamMember.objects.bulk_create([
+                TeamMember(
+                    name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    title=rng.choice(TITLES),
+                    view_url=f'{SYNTHETIC_VIEW_URL_PREFIX}member-{start + number}',
+                )
+                for number in range(count)
+            ])
+
+            images = []
+            for member in members:
+                for order in range(rng.randint(min_images, max_images)):
+                    images.append(self.build_image(member, order))
+            FashionImage.objects.bulk_create(images, batch_size=500)
+
+            derivatives = []
+            if with_derivatives:
+                for image in images:
+                    derivatives.extend(self.build_derivatives(image))
+                ImageDerivative.objects.bulk_create(derivatives, batch_size=500)
+        return len(images), len(derivatives)
+
+    def build_image(self, member, order):
+        rng = self.rng
+        width, height = rng.choice(IMAGE_SIZES)
+        url = f'{self.base_url}/images/{member.pk}/{order}-{rng.getrandbits(32):08x}.jpg'
+        return FashionImage(
+            team_member=member,
+            image_url=url,
+            order=order,
+            width=width,
+            height=height,
+            size=rng.randint(150_000, 2_500_000),
+            mime='image/jpeg',
+            dominant_color=f'#{rng.getrandbits(24):06x}',
+            blurhash=''.join(rng.choice(BLURHASH_ALPHABET) for _ in range(28)),
+            dhash=f'{rng.getrandbits(64):016x}',
+            metadata_source=url,
+        )
+
+    def build_derivatives(self, image):
+        widths = getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', [320, 640, 1280, 2048])
+        formats = getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', ['webp', 'jpeg'])
+        stem = image.image_url.rsplit('.', 1)[0].replace('/images/', '/derivatives/', 1)
+        return [
+            ImageDerivative(
+                image=image,
+                width=width,
+                height=round(image.height * width / image.width),
+                format=image_format,
+                url=f'{stem}-{width}w.{image_format}',
+                size=max(1, image.size * width // image.width // 4),
+            )
+            for width in widths if width < image.width
+            for image_format in formats
+        ]
+
+    def create_media_files(self, count):
+        rng = self.rng
+        existing = MediaFile.objects.filter(name__startswith=SYNTHETIC_MEDIA_PREFIX).count()
+        media_files = []
+        for number in range(existing, existing + count):
+            media_type = rng.choice(['image', 'image', 'video', 'logo'])
+            extension = {'image': 'jpg', 'video': 'mp4', 'logo': 'png'}[media_type]
+            media_files.append(MediaFile(
+                name=f'{SYNTHETIC_MEDIA_PREFIX}{media_type}-{number}',
+                media_type=media_type,
+                file_url=f'{self.base_url}/{media_type}s/{number}.{extension}',
+                description=f'Synthetic {media_type} {number}',
+            ))
+        MediaFile.objects.bulk_create(media_files, batch_size=500)
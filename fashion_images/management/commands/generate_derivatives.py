@@ -0,0 +1,189 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+from fashion_images.catalog import bump_catalog_version
+from fashion_images.imaging import render_derivatives, derivative_file_name
+from fashion_images.models import FashionImage, ImageDerivative
+from fashion_images.storage import storage
+from fashion_images.storage_stats import collect_storage_stats
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Generate responsive WebP/JPEG derivatives of fashion images and upload them to Supabase'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show which derivatives would be generated without generating them',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate derivatives that already exist',
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: all cores)',
+        )
+        parser.add_argument(
+            '--widths',
+            type=int,
+            nargs='+',
+            default=None,
+            help='Target widths in pixels (default: IMAGE_DERIVATIVE_WIDTHS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Derivatives saved per database batch (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        force = options['force']
+        widths = options['widths'] or settings.IMAGE_DERIVATIVE_WIDTHS
+        formats = settings.IMAGE_DERIVATIVE_FORMATS
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN MODE - No derivatives will be generated'))
+        elif not storage.available:
+            self.stdout.write(
+                self.style.ERROR('Storage not configured. Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables, or pick another STORAGE_BACKEND.')
+            )
+            return
+
+        self.jobs = max(1, options['jobs'])
+        self.batch_size = max(1, options['batch_size'])
+        counts = {'generated': 0, 'up to date': 0, 'errors': 0}
+        tasks = self.pending(widths, formats, force, counts)
+
+        if dry_run:
+            for image, source, targets, previous in tasks:
+                self.stdout.write(f'  Would generate {len(targets)} derivatives for {image.team_member.name} - Image {image.order}')
+        else:
+            self.generate(tasks, counts)
+
+        self.stdout.write(f"Derivative summary: {counts['generated']} generated, {counts['up to date']} images up to date, {counts['errors']} errors")
+        self.stdout.write(self.style.SUCCESS('Derivative generation completed!'))
+
+    def pending(self, widths, formats, force, counts):
+        """Stream (image, source, targets, previous URLs) for images missing derivatives"""
+        images = FashionImage.objects.select_related('team_member').prefetch_related('derivatives').order_by('pk')
+        for image in images.iterator(chunk_size=self.batch_size):
+            previous = {(d.width, d.format): d.url for d in image.derivatives.all()}
+            targets = [(w, f) for w in widths for f in formats if force or (w, f) not in previous]
+            if not targets:
+                counts['up to date'] += 1
+                continue
+
+            source = self.get_source(image)
+            if not source:
+                counts['errors'] += 1
+                self.stdout.write(
+                    self.style.ERROR(f'  Error: {image.team_member.name} - Image {image.order} has no local file or URL')
+                )
+                continue
+            yield image, source, targets, previous
+
+    def generate(self, tasks, counts):
+        """Render in worker processes; uploads and DB writes stay on this process"""
+        self.stdout.write(f'Generating derivatives with {self.jobs} processes...')
+        batch = []
+        replaced = []
+        running = {}
+        exhausted = False
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor, collect_storage_stats() as storage_stats:
+            while True:
+                # Keep a couple of images per worker in flight so rows are read lazily
+                while not exhausted and len(running) < self.jobs * 2:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    image, source, targets, previous = task
+                    future = executor.submit(render_derivatives, source, targets, settings.IMAGE_DERIVATIVE_QUALITY)
+                    running[future] = (image, previous)
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    image, previous = running.pop(future)
+                    try:
+                        renditions = future.result()
+                    except Exception as e:
+                        counts['errors'] += 1
+                        self.stdout.write(
+                            self.style.ERROR(f'  Failed to render: {image.team_member.name} - Image {image.order} ({e})')
+                        )
+                        continue
+
+                    derivatives = self.upload_renditions(image, renditions)
+                    counts['generated'] += len(derivatives)
+                    counts['errors'] += len(renditions) - len(derivatives)
+                    self.stdout.write(f'  Generated {len(derivatives)} derivatives: {image.team_member.name} - Image {image.order}')
+                    batch.extend(derivatives)
+                    # Objects replaced when regenerating with --force
+                    replaced.extend(
+                        previous[d.width, d.format] for d in derivatives
+                        if previous.get((d.width, d.format)) not in (None, d.url)
+                    )
+                    if len(batch) >= self.batch_size:
+                        self.save(batch, replaced)
+                        batch, replaced = [], []
+            self.save(batch, replaced)
+
+        self.stdout.write('Storage operations:')
+        for line in storage_stats.summary_lines():
+            self.stdout.write(line)
+
+    def get_source(self, image):
+        """Prefer the local original; fall back to the uploaded copy"""
+        if image.image_file and image.image_file.name:
+            filename = os.path.basename(image.image_file.name)
+            local_path = os.path.join(settings.MEDIA_ROOT, 'images', filename)
+            if os.path.exists(local_path):
+                return local_path
+        return image.image_url
+
+    def upload_renditions(self, image, renditions):
+        """Upload encoded renditions; returns unsaved ImageDerivative rows for those that went up"""
+        original_name = image.image_file.name if image.image_file else (image.image_url or '').split('?')[0]
+        derivatives = []
+        for rendition in renditions:
+            url = storage.upload_file_from_content(
+                file_content=rendition['content'],
+                file_name=derivative_file_name(original_name, rendition['width'], rendition['extension']),
+                folder='fashion-images-derivatives'
+            )
+            if url:
+                derivatives.append(ImageDerivative(
+                    image=image, width=rendition['width'], height=rendition['height'],
+                    format=rendition['format'], url=url, size=len(rendition['content']),
+                ))
+        return derivatives
+
+    def save(self, derivatives, replaced):
+        """Insert or update a batch of derivatives, then delete the objects they replaced"""
+        if not derivatives:
+            return
+        with transaction.atomic():
+            ImageDerivative.objects.bulk_create(
+                derivatives,
+                update_conflicts=True,
+                unique_fields=['image', 'width', 'format'],
+                update_fields=['height', 'url', 'size'],
+            )
+            # bulk_create skips post_save, so invalidate cached catalog responses here
+            bump_catalog_version()
+        if replaced:
+            storage.delete_many(replaced)
+        self.stdout.write(f'  Saved {len(derivatives)} derivatives')
@@ -1,8 +1,13 @@
 import os
+import time
+from collections import Counter
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from fashion_images.journal import CommitBatcher, MigrationJournal, batched
 from fashion_images.models import FashionImage, MediaFile
-from fashion_images.supabase_service import supabase_storage
+from fashion_images.storage import storage
+from fashion_images.storage_stats import collect_storage_stats
+from fashion_images.upload_pool import UploadJob, UploadPool, UploadStats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,158 +26,290 @@ class Command(BaseCommand):
             action='store_true',
             help='Force re-upload even if Supabase URL already exists',
         )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its journal instead of starting over',
+        )
+        parser.add_argument(
+            '--content-addressed',
+            action='store_true',
+            default=None,
+            help='Store files under their SHA-256 digest and skip uploads of content already stored',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of concurrent uploads (default: 1)',
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=3,
+            help='Retries per file with exponential backoff (default: 3)',
+        )
+        parser.add_argument(
+            '--max-in-flight',
+            type=int,
+            default=64,
+            help='Maximum MB of file data being uploaded at once (default: 64MB)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows read and saved per database batch (default: 500)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         force = options['force']
+        self.batch_size = max(1, options['batch_size'])
+        
+        # Hashing and uploads run on worker threads; database reads and writes,
+        # including the content index, stay on this thread
+        self.content_addressed = storage.use_content_addressing(options['content_addressed'])
+        self.upload_pool = UploadPool(
+            self.store_file,
+            workers=options['workers'],
+            max_retries=options['retries'],
+            max_in_flight_bytes=options['max_in_flight'] * 1024 * 1024,
+            hash_files=True,
+            lookup=storage.stored_url if self.content_addressed else None,
+        )
+        self.upload_stats = UploadStats()
         
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN MODE - No files will be uploaded'))
         
-        # Check if Supabase is configured
-        if not supabase_storage.client:
+        # Check that the storage backend (Supabase by default) is configured
+        if not storage.available:
             self.stdout.write(
-                self.style.ERROR('Supabase not configured. Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables.')
+                self.style.ERROR('Storage not configured. Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables, or pick another STORAGE_BACKEND.')
             )
             return
         
-        self.stdout.write('Starting migration to Supabase...')
+        # Per-object progress; a dry run reads the journal but never resets it
+        self.journal = MigrationJournal('migrate_to_supabase', resume=options['resume'] or dry_run)
         
-        # Migrate FashionImage objects
-        self.migrate_fashion_images(dry_run, force)
+        self.stdout.write('Starting migration to Supabase...')
         
-        # Migrate MediaFile objects
-        self.migrate_media_files(dry_run, force)
+        with collect_storage_stats() as storage_stats:
+            # Migrate FashionImage objects
+            self.migrate_fashion_images(dry_run, force)
+            
+            # Migrate MediaFile objects
+            self.migrate_media_files(dry_run, force)
         
+        self.upload_stats.finished = time.monotonic()
+        if not dry_run:
+            self.stdout.write(f'\nThroughput: {self.upload_stats.summary()}')
+            self.stdout.write('Storage operations:')
+            for line in storage_stats.summary_lines():
+                self.stdout.write(line)
+            self.stdout.write('Migration journal:')
+            for line in self.journal.report():
+                self.stdout.write(line)
         self.stdout.write(self.style.SUCCESS('Migration completed!'))
 
+    def store_file(self, file_path, file_name, folder, digest):
+        """Worker thread: upload one file, named by its digest when content addressed"""
+        return storage.store_file(file_path, file_name, folder, digest if self.content_addressed else None)
+
+    def record_upload(self, result):
+        """Account for a finished upload and index content-addressed ones"""
+        self.upload_stats.record(result)
+        if result.url and self.content_addressed and not result.deduplicated:
+            storage.remember_upload(result.digest, result.url, result.job.size)
+
+    def fashion_image_jobs(self, dry_run, force, counts, batcher):
+        """Stream FashionImage rows in batches and yield an UploadJob for each one to upload"""
+        images = FashionImage.objects.select_related('team_member').order_by('pk')
+        for chunk in batched(images.iterator(chunk_size=self.batch_size), self.batch_size):
+            self.journal.load(chunk)
+            jobs = []
+            for image in chunk:
+                # Skip objects an interrupted run already finished
+                if self.journal.is_committed(image):
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {image.team_member.name} - Image {image.order} (already migrated by the resumed run)')
+                    continue
+                
+                # Skip if already has Supabase URL and not forcing
+                if image.image_url and not force:
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {image.team_member.name} - Image {image.order} (already has Supabase URL)')
+                    continue
+                
+                # Check if local file exists
+                if not image.image_file or not image.image_file.name:
+                    counts['errors'] += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error: {image.team_member.name} - Image {image.order} has no local file')
+                    )
+                    continue
+                
+                # Fix the path - extract filename and create correct path
+                filename = os.path.basename(image.image_file.name)  # Get just the filename (e.g., "1.jpg")
+                local_path = os.path.join(settings.MEDIA_ROOT, f'images/{filename}')
+                
+                if not os.path.exists(local_path):
+                    counts['errors'] += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error: Local file not found: {local_path}')
+                    )
+                    continue
+                
+                if dry_run:
+                    self.stdout.write(f'  Would migrate: {image.team_member.name} - Image {image.order}')
+                    counts['migrated'] += 1
+                    continue
+                
+                # Commit an upload the interrupted run finished but never saved
+                recovered_url = self.journal.uploaded_url(image, local_path)
+                if recovered_url:
+                    image.image_url = recovered_url
+                    self.journal.recovered += 1
+                    batcher.add(image)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Recovered: {image.team_member.name} - Image {image.order}')
+                    continue
+                
+                self.journal.queue(image)
+                jobs.append(UploadJob(
+                    file_path=local_path,
+                    file_name=filename,
+                    folder='fashion-images',
+                    size=os.path.getsize(local_path),
+                    payload=image,
+                ))
+            
+            # One journal write for the whole batch, then hand it to the pool
+            self.journal.start_uploads()
+            yield from jobs
+
     def migrate_fashion_images(self, dry_run=False, force=False):
         """Migrate FashionImage objects to Supabase"""
         self.stdout.write('\nMigrating FashionImage objects...')
         
-        images = FashionImage.objects.all()
-        migrated_count = 0
-        skipped_count = 0
-        error_count = 0
+        counts = Counter()
+        with CommitBatcher(self.journal, FashionImage, ['image_url'], self.batch_size) as batcher:
+            jobs = self.fashion_image_jobs(dry_run, force, counts, batcher)
+            for result in self.upload_pool.run(jobs):
+                self.record_upload(result)
+                image = result.job.payload
+                if result.url:
+                    image.image_url = result.url
+                    self.journal.uploaded(image, result.url, result.digest)
+                    batcher.add(image)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Migrated: {image.team_member.name} - Image {image.order}')
+                else:
+                    counts['errors'] += 1
+                    batcher.add_failure(image, result.error)
+                    self.stdout.write(
+                        self.style.ERROR(f'  Failed to upload: {image.team_member.name} - Image {image.order} ({result.error})')
+                    )
         
-        for image in images:
-            # Skip if already has Supabase URL and not forcing
-            if image.image_url and not force:
-                skipped_count += 1
-                self.stdout.write(f'  Skipped {image.team_member.name} - Image {image.order} (already has Supabase URL)')
-                continue
-            
-            # Check if local file exists
-            if not image.image_file or not image.image_file.name:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: {image.team_member.name} - Image {image.order} has no local file')
-                )
-                continue
-            
-            # Fix the path - extract filename and create correct path
-            file_path = image.image_file.name
-            filename = os.path.basename(file_path)  # Get just the filename (e.g., "1.jpg")
-            file_path = f'images/{filename}'  # Create correct path (e.g., "images/1.jpg")
-            
-            local_path = os.path.join(settings.MEDIA_ROOT, file_path)
-            
-            if not os.path.exists(local_path):
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: Local file not found: {local_path}')
-                )
-                continue
-            
-            if dry_run:
-                self.stdout.write(f'  Would migrate: {image.team_member.name} - Image {image.order}')
-                migrated_count += 1
-                continue
-            
-            # Upload to Supabase
-            filename = os.path.basename(image.image_file.name)
-            supabase_url = supabase_storage.upload_file(
-                file_path=local_path,
-                file_name=filename,
-                folder='fashion-images'
-            )
+        self.stdout.write(
+            f"FashionImage migration summary: {counts['migrated']} migrated, {counts['skipped']} skipped, {counts['errors']} errors"
+        )
+
+    def media_file_jobs(self, dry_run, force, counts, batcher):
+        """Stream MediaFile rows in batches and yield an UploadJob for each one to upload"""
+        media_files = MediaFile.objects.order_by('pk')
+        for chunk in batched(media_files.iterator(chunk_size=self.batch_size), self.batch_size):
+            self.journal.load(chunk)
+            jobs = []
+            for media in chunk:
+                # Skip objects an interrupted run already finished
+                if self.journal.is_committed(media):
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {media.name} (already migrated by the resumed run)')
+                    continue
+                
+                # Skip if already has Supabase URL and not forcing
+                if media.file_url and not force:
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {media.name} (already has Supabase URL)')
+                    continue
+                
+                # Check if local file exists
+                if not media.file or not media.file.name:
+                    counts['errors'] += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error: {media.name} has no local file')
+                    )
+                    continue
+                
+                # Fix the path - remove duplicate 'media/' prefix
+                file_path = media.file.name
+                if file_path.startswith('media/media/'):
+                    file_path = file_path.replace('media/media/', '')
+                elif file_path.startswith('media/'):
+                    file_path = file_path.replace('media/', '')
+                
+                local_path = os.path.join(settings.MEDIA_ROOT, file_path)
+                
+                if not os.path.exists(local_path):
+                    counts['errors'] += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error: Local file not found: {local_path}')
+                    )
+                    continue
+                
+                if dry_run:
+                    self.stdout.write(f'  Would migrate: {media.name}')
+                    counts['migrated'] += 1
+                    continue
+                
+                # Commit an upload the interrupted run finished but never saved
+                recovered_url = self.journal.uploaded_url(media, local_path)
+                if recovered_url:
+                    media.file_url = recovered_url
+                    self.journal.recovered += 1
+                    batcher.add(media)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Recovered: {media.name}')
+                    continue
+                
+                self.journal.queue(media)
+                jobs.append(UploadJob(
+                    file_path=local_path,
+                    file_name=os.path.basename(media.file.name),
+                    folder=f'media-{media.media_type}s',  # e.g., 'media-images', 'media-videos'
+                    size=os.path.getsize(local_path),
+                    payload=media,
+                ))
             
-            if supabase_url:
-                image.image_url = supabase_url
-                image.save()
-                migrated_count += 1
-                self.stdout.write(f'  Migrated: {image.team_member.name} - Image {image.order}')
-            else:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Failed to upload: {image.team_member.name} - Image {image.order}')
-                )
-        
-        self.stdout.write(f'FashionImage migration summary: {migrated_count} migrated, {skipped_count} skipped, {error_count} errors')
+            # One journal write for the whole batch, then hand it to the pool
+            self.journal.start_uploads()
+            yield from jobs
 
     def migrate_media_files(self, dry_run=False, force=False):
         """Migrate MediaFile objects to Supabase"""
         self.stdout.write('\nMigrating MediaFile objects...')
         
-        media_files = MediaFile.objects.all()
-        migrated_count = 0
-        skipped_count = 0
-        error_count = 0
+        counts = Counter()
+        with CommitBatcher(self.journal, MediaFile, ['file_url'], self.batch_size) as batcher:
+            jobs = self.media_file_jobs(dry_run, force, counts, batcher)
+            for result in self.upload_pool.run(jobs):
+                self.record_upload(result)
+                media = result.job.payload
+                if result.url:
+                    media.file_url = result.url
+                    self.journal.uploaded(media, result.url, result.digest)
+                    batcher.add(media)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Migrated: {media.name}')
+                else:
+                    counts['errors'] += 1
+                    batcher.add_failure(media, result.error)
+                    self.stdout.write(
+                        self.style.ERROR(f'  Failed to upload: {media.name} ({result.error})')
+                    )
         
-        for media in media_files:
-            # Skip if already has Supabase URL and not forcing
-            if media.file_url and not force:
-                skipped_count += 1
-                self.stdout.write(f'  Skipped {media.name} (already has Supabase URL)')
-                continue
-            
-            # Check if local file exists
-            if not media.file or not media.file.name:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: {media.name} has no local file')
-                )
-                continue
-            
-            # Fix the path - remove duplicate 'media/' prefix
-            file_path = media.file.name
-            if file_path.startswith('media/media/'):
-                file_path = file_path.replace('media/media/', '')
-            elif file_path.startswith('media/'):
-                file_path = file_path.replace('media/', '')
-            
-            local_path = os.path.join(settings.MEDIA_ROOT, file_path)
-            
-            if not os.path.exists(local_path):
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: Local file not found: {local_path}')
-                )
-                continue
-            
-            if dry_run:
-                self.stdout.write(f'  Would migrate: {media.name}')
-                migrated_count += 1
-                continue
-            
-            # Upload to Supabase
-            filename = os.path.basename(media.file.name)
-            folder = f'media-{media.media_type}s'  # e.g., 'media-images', 'media-videos'
-            supabase_url = supabase_storage.upload_file(
-                file_path=local_path,
-                file_name=filename,
-                folder=folder
-            )
-            
-            if supabase_url:
-                media.file_url = supabase_url
-                media.save()
-                migrated_count += 1
-                self.stdout.write(f'  Migrated: {media.name}')
-            else:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Failed to upload: {media.name}')
-                )
-        
-        self.stdout.write(f'MediaFile migration summary: {migrated_count} migrated, {skipped_count} skipped, {error_count} errors')
+        self.stdout.write(
+            f"MediaFile migration summary: {counts['migrated']} migrated, {counts['skipped']} skipped, {counts['errors']} errors"
+        )
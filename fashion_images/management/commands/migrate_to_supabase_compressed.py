@@ -1,13 +1,22 @@
 import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from fashion_images.imaging import compress_to_jpeg
+from fashion_images.journal import CommitBatcher, MigrationJournal, batched
 from fashion_images.models import FashionImage, MediaFile
-from fashion_images.supabase_service import supabase_storage
-from PIL import Image
+from fashion_images.storage import file_sha256, storage
+from fashion_images.storage_stats import collect_storage_stats, record_operation
 import logging
 
 logger = logging.getLogger(__name__)
 
+def prepare_upload(local_path, compress, max_bytes, min_quality):
+    """Worker process: digest of the source file for the journal, and its compressed copy if requested"""
+    digest = file_sha256(local_path)
+    return digest, compress_to_jpeg(local_path, max_bytes, min_quality) if compress else None
+
 class Command(BaseCommand):
     help = 'Migrate existing images from local storage to Supabase with compression'
 
@@ -22,234 +31,331 @@ class Command(BaseCommand):
             action='store_true',
             help='Force re-upload even if Supabase URL already exists',
         )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its journal instead of starting over',
+        )
+        parser.add_argument(
+            '--content-addressed',
+            action='store_true',
+            default=None,
+            help='Store files under their SHA-256 digest and skip uploads of content already stored',
+        )
         parser.add_argument(
             '--max-size',
             type=int,
             default=5,
             help='Maximum file size in MB after compression (default: 5MB)',
         )
+        parser.add_argument(
+            '--min-quality',
+            type=int,
+            default=60,
+            help='Lowest JPEG quality to accept before downscaling instead (default: 60)',
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of compression worker processes (default: all cores)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows read and saved per database batch (default: 500)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         force = options['force']
         max_size_mb = options['max_size']
+        self.content_addressed = options['content_addressed']
+        self.min_quality = options['min_quality']
+        self.jobs = max(1, options['jobs'])
+        self.batch_size = max(1, options['batch_size'])
         
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN MODE - No files will be uploaded'))
         
-        # Check if Supabase is configured
-        if not supabase_storage.client:
+        # Check that the storage backend (Supabase by default) is configured
+        if not storage.available:
             self.stdout.write(
-                self.style.ERROR('Supabase not configured. Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables.')
+                self.style.ERROR('Storage not configured. Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables, or pick another STORAGE_BACKEND.')
             )
             return
         
-        self.stdout.write('Starting migration to Supabase with compression...')
+        # Per-object progress; a dry run reads the journal but never resets it
+        self.journal = MigrationJournal('migrate_to_supabase_compressed', resume=options['resume'] or dry_run)
         
-        # Migrate FashionImage objects
-        self.migrate_fashion_images(dry_run, force, max_size_mb)
+        self.stdout.write('Starting migration to Supabase with compression...')
         
-        # Migrate MediaFile objects
-        self.migrate_media_files(dry_run, force, max_size_mb)
+        with collect_storage_stats() as storage_stats:
+            # Migrate FashionImage objects
+            self.migrate_fashion_images(dry_run, force, max_size_mb)
+            
+            # Migrate MediaFile objects
+            self.migrate_media_files(dry_run, force, max_size_mb)
         
+        if not dry_run:
+            self.stdout.write('\nStorage operations:')
+            for line in storage_stats.summary_lines():
+                self.stdout.write(line)
+            self.stdout.write('\nMigration journal:')
+            for line in self.journal.report():
+                self.stdout.write(line)
         self.stdout.write(self.style.SUCCESS('Migration completed!'))
 
-    def compress_image(self, input_path, output_path, max_size_mb):
-        """Compress image to specified maximum size"""
-        try:
-            with Image.open(input_path) as img:
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Calculate compression quality
-                original_size = os.path.getsize(input_path)
-                target_size = max_size_mb * 1024 * 1024  # Convert MB to bytes
-                
-                if original_size <= target_size:
-                    # No compression needed
-                    img.save(output_path, 'JPEG', quality=95)
-                    return output_path
-                
-                # Calculate quality based on size ratio
-                quality = int((target_size / original_size) * 95)
-                quality = max(10, min(95, quality))  # Keep quality between 10-95
-                
-                # Try different quality levels
-                for q in range(quality, 10, -5):
-                    img.save(output_path, 'JPEG', quality=q)
-                    if os.path.getsize(output_path) <= target_size:
+    def upload_all(self, jobs, max_size_mb):
+        """
+        Hash every file and compress oversized images in a process pool, then
+        upload everything
+        
+        Jobs are pulled lazily and at most two per worker process are
+        being prepared at once, so memory stays flat however many rows stream in.
+        
+        Args:
+            jobs: Iterable of (obj, local_path, filename, folder, compress) tuples
+            
+        Yields:
+            (obj, supabase_url or None, error message or None, source digest or None)
+            as uploads finish
+        """
+        max_bytes = max_size_mb * 1024 * 1024
+        max_pending = self.jobs * 2
+        jobs = iter(jobs)
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            running = {}
+            exhausted = False
+            while True:
+                while not exhausted and len(running) < max_pending:
+                    job = next(jobs, None)
+                    if job is None:
+                        exhausted = True
                         break
+                    obj, local_path, filename, folder, compress = job
+                    future = executor.submit(prepare_upload, local_path, compress, max_bytes, self.min_quality)
+                    running[future] = job
+                
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    obj, local_path, filename, folder, compress = running.pop(future)
+                    try:
+                        digest, compressed = future.result()
+                    except Exception as e:
+                        if compress:
+                            logger.error(f"Error compressing image {filename}: {e}")
+                            record_operation('compress', storage, 0.0, outcome='error')
+                            yield obj, None, f'compression failed: {e}', None
+                        else:
+                            logger.error(f"Error reading {filename}: {e}")
+                            yield obj, None, f'reading failed: {e}', None
+                        continue
+                    
+                    if compressed is None:
+                        # Small files go up unchanged, under the digest already taken
+                        supabase_url = storage.upload_file(
+                            file_path=local_path,
+                            file_name=filename,
+                            folder=folder,
+                            content_addressed=self.content_addressed,
+                            digest=digest
+                        )
+                        yield obj, supabase_url, None, digest
+                        continue
+                    record_operation('compress', storage, compressed['seconds'], compressed['original_size'])
+                    
+                    # Upload the compressed bytes straight from memory
+                    supabase_url = storage.upload_file_from_content(
+                        file_content=compressed['content'],
+                        file_name=os.path.splitext(filename)[0] + '.jpg',
+                        folder=folder,
+                        content_addressed=self.content_addressed
+                    )
+                    yield obj, supabase_url, None, digest
+
+    def fashion_image_jobs(self, dry_run, force, max_size_mb, counts, batcher):
+        """Stream FashionImage rows in batches and yield an upload job for each one to migrate"""
+        images = FashionImage.objects.select_related('team_member').order_by('pk')
+        for chunk in batched(images.iterator(chunk_size=self.batch_size), self.batch_size):
+            self.journal.load(chunk)
+            jobs = []
+            for image in chunk:
+                # Skip objects an interrupted run already finished
+                if self.journal.is_committed(image):
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {image.team_member.name} - Image {image.order} (already migrated by the resumed run)')
+                    continue
+                
+                # Skip if already has Supabase URL and not forcing
+                if image.image_url and not force:
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {image.team_member.name} - Image {image.order} (already has Supabase URL)')
+                    continue
+                
+                # Check if local file exists
+                if not image.image_file or not image.image_file.name:
+                    counts['errors'] += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error: {image.team_member.name} - Image {image.order} has no local file')
+                    )
+                    continue
                 
-                return output_path
+                # Fix the path - extract filename and create correct path
+                filename = os.path.basename(image.image_file.name)  # Get just the filename (e.g., "1.jpg")
+                local_path = os.path.join(settings.MEDIA_ROOT, f'images/{filename}')
                 
-        except Exception as e:
-            logger.error(f"Error compressing image {input_path}: {e}")
-            return None
+                if not os.path.exists(local_path):
+                    counts['errors'] += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error: Local file not found: {local_path}')
+                    )
+                    continue
+                
+                if dry_run:
+                    file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
+                    self.stdout.write(f'  Would migrate: {image.team_member.name} - Image {image.order} ({file_size_mb:.1f}MB)')
+                    counts['migrated'] += 1
+                    continue
+                
+                # Commit an upload the interrupted run finished but never saved
+                recovered_url = self.journal.uploaded_url(image, local_path)
+                if recovered_url:
+                    image.image_url = recovered_url
+                    self.journal.recovered += 1
+                    batcher.add(image)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Recovered: {image.team_member.name} - Image {image.order}')
+                    continue
+                
+                # Queue the image; oversized ones are compressed in the process pool
+                self.journal.queue(image)
+                compress = os.path.getsize(local_path) > max_size_mb * 1024 * 1024
+                jobs.append((image, local_path, filename, 'fashion-images', compress))
+            
+            # One journal write for the whole batch, then hand it to the uploader
+            self.journal.start_uploads()
+            yield from jobs
 
     def migrate_fashion_images(self, dry_run=False, force=False, max_size_mb=5):
         """Migrate FashionImage objects to Supabase"""
         self.stdout.write('\nMigrating FashionImage objects...')
         
-        images = FashionImage.objects.all()
-        migrated_count = 0
-        skipped_count = 0
-        error_count = 0
+        counts = Counter()
+        with CommitBatcher(self.journal, FashionImage, ['image_url'], self.batch_size) as batcher:
+            jobs = self.fashion_image_jobs(dry_run, force, max_size_mb, counts, batcher)
+            for image, supabase_url, error, digest in self.upload_all(jobs, max_size_mb):
+                if supabase_url:
+                    image.image_url = supabase_url
+                    self.journal.uploaded(image, supabase_url, digest)
+                    batcher.add(image)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Migrated: {image.team_member.name} - Image {image.order}')
+                else:
+                    counts['errors'] += 1
+                    batcher.add_failure(image, error or 'upload failed')
+                    self.stdout.write(
+                        self.style.ERROR(f'  Failed to upload: {image.team_member.name} - Image {image.order} ({error or "upload failed"})')
+                    )
         
-        for image in images:
-            # Skip if already has Supabase URL and not forcing
-            if image.image_url and not force:
-                skipped_count += 1
-                self.stdout.write(f'  Skipped {image.team_member.name} - Image {image.order} (already has Supabase URL)')
-                continue
-            
-            # Check if local file exists
-            if not image.image_file or not image.image_file.name:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: {image.team_member.name} - Image {image.order} has no local file')
-                )
-                continue
-            
-            # Fix the path - extract filename and create correct path
-            file_path = image.image_file.name
-            filename = os.path.basename(file_path)  # Get just the filename (e.g., "1.jpg")
-            file_path = f'images/{filename}'  # Create correct path (e.g., "images/1.jpg")
-            
-            local_path = os.path.join(settings.MEDIA_ROOT, file_path)
-            
-            if not os.path.exists(local_path):
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: Local file not found: {local_path}')
-                )
-                continue
-            
-            if dry_run:
-                file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
-                self.stdout.write(f'  Would migrate: {image.team_member.name} - Image {image.order} ({file_size_mb:.1f}MB)')
-                migrated_count += 1
-                continue
-            
-            # Compress image if needed
-            compressed_path = local_path
-            if os.path.getsize(local_path) > max_size_mb * 1024 * 1024:
-                temp_path = local_path + '.compressed.jpg'
-                compressed_path = self.compress_image(local_path, temp_path, max_size_mb)
-                if not compressed_path:
-                    error_count += 1
+        self.stdout.write(
+            f"FashionImage migration summary: {counts['migrated']} migrated, {counts['skipped']} skipped, {counts['errors']} errors"
+        )
+
+    def media_file_jobs(self, dry_run, force, max_size_mb, counts, batcher):
+        """Stream MediaFile rows in batches and yield an upload job for each one to migrate"""
+        media_files = MediaFile.objects.order_by('pk')
+        for chunk in batched(media_files.iterator(chunk_size=self.batch_size), self.batch_size):
+            self.journal.load(chunk)
+            jobs = []
+            for media in chunk:
+                # Skip objects an interrupted run already finished
+                if self.journal.is_committed(media):
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {media.name} (already migrated by the resumed run)')
+                    continue
+                
+                # Skip if already has Supabase URL and not forcing
+                if media.file_url and not force:
+                    counts['skipped'] += 1
+                    self.stdout.write(f'  Skipped {media.name} (already has Supabase URL)')
+                    continue
+                
+                # Check if local file exists
+                if not media.file or not media.file.name:
+                    counts['errors'] += 1
                     self.stdout.write(
-                        self.style.ERROR(f'  Failed to compress: {image.team_member.name} - Image {image.order}')
+                        self.style.ERROR(f'  Error: {media.name} has no local file')
                     )
                     continue
+                
+                # Fix the path - remove duplicate 'media/' prefix
+                file_path = media.file.name
+                if file_path.startswith('media/media/'):
+                    file_path = file_path.replace('media/media/', '')
+                elif file_path.startswith('media/'):
+                    file_path = file_path.replace('media/', '')
+                
+                local_path = os.path.join(settings.MEDIA_ROOT, file_path)
+                
+                if not os.path.exists(local_path):
+                    counts['errors'] += 1
+                    self.stdout.write(
+                        self.style.ERROR(f'  Error: Local file not found: {local_path}')
+                    )
+                    continue
+                
+                if dry_run:
+                    file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
+                    self.stdout.write(f'  Would migrate: {media.name} ({file_size_mb:.1f}MB)')
+                    counts['migrated'] += 1
+                    continue
+                
+                # Commit an upload the interrupted run finished but never saved
+                recovered_url = self.journal.uploaded_url(media, local_path)
+                if recovered_url:
+                    media.file_url = recovered_url
+                    self.journal.recovered += 1
+                    batcher.add(media)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Recovered: {media.name}')
+                    continue
+                
+                # Queue the file; oversized images are compressed in the process pool
+                self.journal.queue(media)
+                filename = os.path.basename(media.file.name)
+                folder = f'media-{media.media_type}s'  # e.g., 'media-images', 'media-videos'
+                compress = media.media_type == 'image' and os.path.getsize(local_path) > max_size_mb * 1024 * 1024
+                jobs.append((media, local_path, filename, folder, compress))
             
-            # Upload to Supabase
-            filename = os.path.basename(file_path)
-            supabase_url = supabase_storage.upload_file(
-                file_path=compressed_path,
-                file_name=filename,
-                folder='fashion-images'
-            )
-            
-            # Clean up temporary compressed file
-            if compressed_path != local_path and os.path.exists(compressed_path):
-                os.remove(compressed_path)
-            
-            if supabase_url:
-                image.image_url = supabase_url
-                image.save()
-                migrated_count += 1
-                file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
-                self.stdout.write(f'  Migrated: {image.team_member.name} - Image {image.order} ({file_size_mb:.1f}MB)')
-            else:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Failed to upload: {image.team_member.name} - Image {image.order}')
-                )
-        
-        self.stdout.write(f'FashionImage migration summary: {migrated_count} migrated, {skipped_count} skipped, {error_count} errors')
+            # One journal write for the whole batch, then hand it to the uploader
+            self.journal.start_uploads()
+            yield from jobs
 
     def migrate_media_files(self, dry_run=False, force=False, max_size_mb=5):
         """Migrate MediaFile objects to Supabase"""
         self.stdout.write('\nMigrating MediaFile objects...')
         
-        media_files = MediaFile.objects.all()
-        migrated_count = 0
-        skipped_count = 0
-        error_count = 0
-        
-        for media in media_files:
-            # Skip if already has Supabase URL and not forcing
-            if media.file_url and not force:
-                skipped_count += 1
-                self.stdout.write(f'  Skipped {media.name} (already has Supabase URL)')
-                continue
-            
-            # Check if local file exists
-            if not media.file or not media.file.name:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: {media.name} has no local file')
-                )
-                continue
-            
-            # Fix the path - remove duplicate 'media/' prefix
-            file_path = media.file.name
-            if file_path.startswith('media/media/'):
-                file_path = file_path.replace('media/media/', '')
-            elif file_path.startswith('media/'):
-                file_path = file_path.replace('media/', '')
-            
-            local_path = os.path.join(settings.MEDIA_ROOT, file_path)
-            
-            if not os.path.exists(local_path):
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Error: Local file not found: {local_path}')
-                )
-                continue
-            
-            if dry_run:
-                file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
-                self.stdout.write(f'  Would migrate: {media.name} ({file_size_mb:.1f}MB)')
-                migrated_count += 1
-                continue
-            
-            # Compress image files if needed
-            compressed_path = local_path
-            if media.media_type == 'image' and os.path.getsize(local_path) > max_size_mb * 1024 * 1024:
-                temp_path = local_path + '.compressed.jpg'
-                compressed_path = self.compress_image(local_path, temp_path, max_size_mb)
-                if not compressed_path:
-                    error_count += 1
+        counts = Counter()
+        with CommitBatcher(self.journal, MediaFile, ['file_url'], self.batch_size) as batcher:
+            jobs = self.media_file_jobs(dry_run, force, max_size_mb, counts, batcher)
+            for media, supabase_url, error, digest in self.upload_all(jobs, max_size_mb):
+                if supabase_url:
+                    media.file_url = supabase_url
+                    self.journal.uploaded(media, supabase_url, digest)
+                    batcher.add(media)
+                    counts['migrated'] += 1
+                    self.stdout.write(f'  Migrated: {media.name}')
+                else:
+                    counts['errors'] += 1
+                    batcher.add_failure(media, error or 'upload failed')
                     self.stdout.write(
-                        self.style.ERROR(f'  Failed to compress: {media.name}')
+                        self.style.ERROR(f'  Failed to upload: {media.name} ({error or "upload failed"})')
                     )
-                    continue
-            
-            # Upload to Supabase
-            filename = os.path.basename(media.file.name)
-            folder = f'media-{media.media_type}s'  # e.g., 'media-images', 'media-videos'
-            supabase_url = supabase_storage.upload_file(
-                file_path=compressed_path,
-                file_name=filename,
-                folder=folder
-            )
-            
-            # Clean up temporary compressed file
-            if compressed_path != local_path and os.path.exists(compressed_path):
-                os.remove(compressed_path)
-            
-            if supabase_url:
-                media.file_url = supabase_url
-                media.save()
-                migrated_count += 1
-                file_size_mb = os.path.getsize(local_path) / (1024 * 1024)
-                self.stdout.write(f'  Migrated: {media.name} ({file_size_mb:.1f}MB)')
-            else:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  Failed to upload: {media.name}')
-                )
         
-        self.stdout.write(f'MediaFile migration summary: {migrated_count} migrated, {skipped_count} skipped, {error_count} errors')
+        self.stdout.write(
+            f"MediaFile migration summary: {counts['migrated']} migrated, {counts['skipped']} skipped, {counts['errors']} errors"
+        )
@@ -0,0 +1,130 @@
+import io
+import json
+import pstats
+from django.core.management.base import BaseCommand, CommandError
+from fashion_images.profiling import (
+    delete_profile, get_profile_root, list_profile_ids, load_profile, load_stats, profile_path, speedscope_profile
+)
+
+class Command(BaseCommand):
+    help = 'List, show, export or clear the request profiles stored by ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            nargs='?',
+            choices=['list', 'show', 'export', 'clear'],
+            default='list',
+            help='list (default), show <id>, export <id> or clear',
+        )
+        parser.add_argument(
+            'profile_id',
+            nargs='?',
+            help="Profile id from `list` ('latest' for the newest)",
+        )
+        parser.add_argument(
+            '--route',
+            help='Only list profiles of this URL name (e.g. card-data, serve-media)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['pstats', 'speedscope'],
+            default='speedscope',
+            help='Export format: pstats (for snakeviz, pstats) or speedscope JSON (default)',
+        )
+        parser.add_argument(
+            '--output',
+            help='File to export to (default: <id>.prof or <id>.speedscope.json)',
+        )
+        parser.add_argument(
+            '--sort',
+            default='cumulative',
+            help='pstats sort key for show (default: cumulative)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=30,
+            help='Functions listed by show (default: 30)',
+        )
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'list':
+            return self.list_profiles(options['route'])
+        if action == 'clear':
+            profile_ids = list_profile_ids()
+            for profile_id in profile_ids:
+                delete_profile(profile_id)
+            self.stdout.write(self.style.SUCCESS(f'Deleted {len(profile_ids)} profiles'))
+            return
+
+        profile_id = self.resolve_id(options['profile_id'])
+        if action == 'show':
+            self.show(profile_id, options['sort'], options['limit'])
+        else:
+            self.export(profile_id, options['format'], options['output'])
+
+    def resolve_id(self, profile_id):
+        if not profile_id:
+            raise CommandError('Give a profile id (see `profiles list`) or `latest`')
+        if profile_id == 'latest':
+            profile_ids = list_profile_ids()
+            if not profile_ids:
+                raise CommandError(f'No profiles in {get_profile_root()}')
+            return profile_ids[-1]
+        if load_profile(profile_id) is None:
+            raise CommandError(f'No profile {profile_id} in {get_profile_root()}')
+        return profile_id
+
+    def list_profiles(self, route):
+        records = [load_profile(profile_id) for profile_id in list_profile_ids()]
+        records = [record for record in records if record and (not route or record['route'] == route)]
+        if not records:
+            self.stdout.write(f'No profiles in {get_profile_root()}')
+            return
+        self.stdout.write(f"{'id':<33} {'route':<22} {'status':>6} {'ms':>9} {'queries':>8} {'peak KiB':>9}  trigger")
+        for record in records:
+            memory = record.get('memory') or {}
+            peak = f"{memory['peak_bytes'] // 1024}" if memory else '-'
+            self.stdout.write(
+                f"{record['id']:<33} {record['route']:<22} {record['status']:>6} {record['duration_ms']:>9.1f} "
+                f"{record['queries']['count']:>8} {peak:>9}  {record['trigger']}"
+            )
+
+    def show(self, profile_id, sort, limit):
+        record = load_profile(profile_id)
+        self.stdout.write(
+            f"{record['method']} {record['path']} ({record['route']}) -> {record['status']} "
+            f"in {record['duration_ms']:.1f} ms, {record['created_at']}"
+        )
+
+        queries = record['queries']
+        self.stdout.write(f"\n{queries['count']} queries in {queries['duration_ms']:.1f} ms:")
+        for query in sorted(queries['log'], key=lambda query: -query['duration_ms'])[:10]:
+            self.stdout.write(f"  {query['duration_ms']:>8.2f} ms  {query['sql'][:200]}")
+
+        memory = record.get('memory')
+        if memory:
+            self.stdout.write(f"\nPeak traced memory {memory['peak_bytes'] / 1024:.1f} KiB; largest allocations still held at the end:")
+            for allocation in memory['top'][:10]:
+                self.stdout.write(f"  {allocation['bytes'] / 1024:>8.1f} KiB  {allocation['location']}")
+
+        output = io.StringIO()
+        try:
+            pstats.Stats(profile_path(profile_id, '.prof'), stream=output).sort_stats(sort).print_stats(limit)
+        except KeyError:
+            raise CommandError(f'Unknown sort key {sort!r}')
+        self.stdout.write('\n' + output.getvalue())
+
+    def export(self, profile_id, export_format, output):
+        if export_format == 'pstats':
+            output = output or f'{profile_id}.prof'
+            load_stats(profile_id).dump_stats(output)
+        else:
+            output = output or f'{profile_id}.speedscope.json'
+            record = load_profile(profile_id)
+            profile = speedscope_profile(load_stats(profile_id), f"{record['method']} {record['path']}")
+            with open(output, 'w') as f:
+                json.dump(profile, f)
+        self.stdout.write(self.style.SUCCESS(f'Exported {profile_id} to {output}'))
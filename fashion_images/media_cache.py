@@ -0,0 +1,121 @@
+"""
+In-process LRU cache for small media files
+
+Logos and loaders are requested on every page view; keeping their bytes in
+memory saves an open/read/close per hit. Entries are keyed by path and
+checked against the os.stat() result media_response() already has, so a
+replaced file (new inode, mtime or size) is re-read on the next request.
+"""
+from collections import OrderedDict
+import logging
+import os
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(stat):
+    """What must match for a cached copy to still be the file on disk"""
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class MediaCache:
+    """Byte-budgeted LRU of whole files with hit/miss/eviction counters"""
+
+    def __init__(self, max_bytes, max_file_size):
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_file_size, max_bytes)
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def accepts(self, size):
+        return 0 < size <= self.max_file_size
+
+    def get(self, path, stat):
+        """Cached bytes of `path` if they match `stat`, reading and caching small files on a miss"""
+        if not self.accepts(stat.st_size):
+            return None
+        signature = file_signature(stat)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        data = self.read(path, signature)
+        if data is None:
+            return None
+        with self.lock:
+            self.store(path, signature, data)
+        return data
+
+    def read(self, path, signature):
+        """The file's bytes, or None if it changed after the caller's stat()"""
+        try:
+            with open(path, 'rb') as f:
+                if file_signature(os.fstat(f.fileno())) != signature:
+                    return None
+                data = f.read()
+        except OSError:
+            return None
+        return data if len(data) == signature[3] else None
+
+    def store(self, path, signature, data):
+        old = self.entries.pop(path, None)
+        if old is not None:
+            self.current_bytes -= len(old[1])
+        self.entries[path] = (signature, data)
+        self.current_bytes += len(data)
+        while self.current_bytes > self.max_bytes:
+            evicted_path, (_, evicted) = self.entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+            logger.debug(f"Evicted {evicted_path} ({len(evicted)} bytes) from the media cache")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'max_file_size': self.max_file_size,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_media_cache():
+    """The process-wide MediaCache, or None when MEDIA_CACHE_MAX_BYTES is 0"""
+    global _cache
+    max_bytes = getattr(settings, 'MEDIA_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+    max_file_size = getattr(settings, 'MEDIA_CACHE_MAX_FILE_SIZE', 2 * 1024 * 1024)
+    if not max_bytes or not max_file_size:
+        return None
+    with _cache_lock:
+        # Rebuilt if the limits change (override_settings, reconfigured shells)
+        if _cache is None or (_cache.max_bytes, _cache.max_file_size) != (max_bytes, min(max_file_size, max_bytes)):
+            _cache = MediaCache(max_bytes, max_file_size)
+        return _cache
+
+
+def media_cache_stats():
+    """Counters of this process's media cache ({} when it is disabled)"""
+    cache = get_media_cache()
+    return cache.stats() if cache else {}
@@ -0,0 +1,292 @@
+import mimetypes
+import os
+import re
+import secrets
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from .media_cache import get_media_cache
+
+# Requests asking for more ranges than this get the whole file instead
+MAX_RANGES = 16
+
+RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+
+# Supported MEDIA_OFFLOAD modes and the header each front proxy acts on
+OFFLOAD_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',  # nginx
+    'x-sendfile': 'X-Sendfile',  # Apache mod_xsendfile, lighttpd
+}
+
+# Content types by extension; anything else falls back to mimetypes
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+    '.svg': 'image/svg+xml',
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.mov': 'video/quicktime',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'MEDIA_STREAM_CHUNK_SIZE', 64 * 1024)
+
+
+def resolve_media_path(media_type, filename):
+    """Return the absolute path of a media file, or None if it is missing or outside MEDIA_ROOT"""
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    media_path = os.path.realpath(os.path.join(media_root, media_type, filename))
+
+    # Reject traversal such as media_type='..' as well as symlinks leaving the media tree
+    if not media_path.startswith(media_root + os.sep):
+        return None
+    if not os.path.isfile(media_path):
+        return None
+    return media_path
+
+
+def get_offload_mode():
+    """Return the configured MEDIA_OFFLOAD mode, or None when Django streams files itself"""
+    mode = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if not mode:
+        return None
+    mode = mode.lower()
+    if mode not in OFFLOAD_HEADERS:
+        raise ImproperlyConfigured(
+            f"MEDIA_OFFLOAD must be one of {', '.join(OFFLOAD_HEADERS)} or empty, got {mode!r}"
+        )
+    return mode
+
+
+def get_content_type(filename):
+    """Determine content type based on file extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in CONTENT_TYPES:
+        return CONTENT_TYPES[extension]
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def file_etag(stat):
+    """Strong ETag from the file's mtime and size, the same in every worker"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def not_modified_response(request, stat):
+    """
+    Answer If-None-Match / If-Modified-Since (and If-Match /
+    If-Unmodified-Since) from the file's stat() alone
+
+    Returns:
+        A 304 or 412 response, or None if the file should be sent
+    """
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'public, max-age=31536000'
+    return response
+
+
+def parse_range_header(header, size):
+    """
+    Parse a Range header against a file of the given size
+
+    Returns:
+        None if the header should be ignored (malformed or too many ranges),
+        an empty list if no range is satisfiable, otherwise a sorted list of
+        non-overlapping inclusive (start, end) byte positions
+    """
+    units, _, range_set = header.partition('=')
+    if units.strip().lower() != 'bytes' or not range_set:
+        return None
+
+    ranges = []
+    for spec in range_set.split(','):
+        match = RANGE_SPEC_RE.match(spec.strip())
+        if not match:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+        elif last:
+            # Suffix range: the final N bytes of the file
+            suffix_length = int(last)
+            if suffix_length == 0:
+                continue
+            start = max(size - suffix_length, 0)
+            end = size - 1
+        else:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # Coalesce overlapping or adjacent ranges so each byte is sent once
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(request, etag, last_modified):
+    """Check If-Range; when it does not match the full file must be sent"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('W/'):
+        # Weak tags never satisfy If-Range
+        return False
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def iter_file_range(path, start, length, chunk_size):
+    """Yield `length` bytes of a file from `start` in bounded chunks"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_multipart_ranges(parts, read_range):
+    """Yield a multipart/byteranges body from precomputed (header, start, end) parts"""
+    for part_header, start, end in parts:
+        yield part_header
+        yield from read_range(start, end)
+
+
+def media_response(request, path, content_type, stat=None):
+    """
+    Build a streaming response for a media file
+
+    Supports HEAD, single and multiple byte ranges (206 Partial Content)
+    and If-Range, reading the file in bounded chunks so large videos never
+    have to fit in memory. Files up to MEDIA_CACHE_MAX_FILE_SIZE are served
+    from the in-process media cache instead of being reopened.
+    """
+    if stat is None:
+        stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    chunk_size = get_chunk_size()
+
+    ranges = None
+    range_header = request.META.get('HTTP_RANGE')
+    # Range is only defined for GET; HEAD reports the full representation
+    if range_header and request.method == 'GET' and if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+
+    # Bytes of small files from the media cache; None means read from disk
+    data = None
+    cache = get_media_cache()
+    if cache is not None and request.method == 'GET' and ranges != []:
+        data = cache.get(path, stat)
+
+    def read_range(start, end):
+        if data is not None:
+            return [data[start:end + 1]]
+        return iter_file_range(path, start, end - start + 1, chunk_size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif ranges is None:
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response['Content-Length'] = str(size)
+        elif data is not None:
+            response = HttpResponse(data, content_type=content_type)
+            response['Content-Length'] = str(size)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = chunk_size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            read_range(start, end),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        parts = []
+        content_length = 0
+        for start, end in ranges:
+            part_header = (
+                f'\r\n--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode('ascii')
+            parts.append((part_header, start, end))
+            content_length += len(part_header) + end - start + 1
+        closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        content_length += len(closing)
+
+        def body():
+            yield from iter_multipart_ranges(parts, read_range)
+            yield closing
+
+        response = StreamingHttpResponse(
+            body(),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = str(content_length)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'public, max-age=31536000'
+    return response
+
+
+def offload_response(path, content_type, mode):
+    """
+    Hand a resolved media file to the front proxy instead of copying it in Python
+
+    The response has no body; nginx (X-Accel-Redirect) or Apache/lighttpd
+    (X-Sendfile) replace it with the file, including Range handling, while
+    the Content-Type and caching headers chosen here are kept. Both headers
+    carry a percent-encoded path, so any file name gives a valid ASCII
+    header value.
+    """
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        # nginx expects a URI under an `internal` location aliased to MEDIA_ROOT
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        relative_path = os.path.relpath(path, media_root).replace(os.sep, '/')
+        prefix = getattr(settings, 'MEDIA_OFFLOAD_PREFIX', '/protected-media/').rstrip('/')
+        response[OFFLOAD_HEADERS[mode]] = quote(f'{prefix}/{relative_path}')
+    else:
+        # mod_xsendfile decodes the value (XSendFileUnescape, on by default)
+        response[OFFLOAD_HEADERS[mode]] = quote(path)
+    response['Cache-Control'] = 'public, max-age=31536000'
+    return response
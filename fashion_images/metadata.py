@@ -0,0 +1,48 @@
+import os
+from django.conf import settings
+from .models import FashionImage
+
+# Model fields written by apply_metadata()
+METADATA_FIELDS = ['width', 'height', 'size', 'mime', 'dominant_color', 'blurhash', 'dhash', 'metadata_source']
+
+
+def local_path(obj):
+    """Path of a FashionImage's or MediaFile's file under MEDIA_ROOT, if it exists"""
+    if isinstance(obj, FashionImage):
+        if not obj.image_file or not obj.image_file.name:
+            return None
+        path = os.path.join(settings.MEDIA_ROOT, 'images', os.path.basename(obj.image_file.name))
+    else:
+        if not obj.file or not obj.file.name:
+            return None
+        # Same 'media/' prefix fix as the migration commands
+        file_path = obj.file.name
+        if file_path.startswith('media/media/'):
+            file_path = file_path.replace('media/media/', '')
+        elif file_path.startswith('media/'):
+            file_path = file_path.replace('media/', '')
+        path = os.path.join(settings.MEDIA_ROOT, file_path)
+    return path if os.path.isfile(path) else None
+
+
+def metadata_source(obj, allow_remote=True):
+    """The local file if present, else (when allowed) the uploaded URL"""
+    path = local_path(obj)
+    if path:
+        return path
+    if allow_remote:
+        return (obj.image_url if isinstance(obj, FashionImage) else obj.file_url) or None
+    return None
+
+
+def metadata_is_current(obj, source):
+    """Whether the stored metadata was computed from `source` and is complete"""
+    # Images saved before dHash existed have dimensions but no hash yet
+    return source == obj.metadata_source and not (obj.width and not obj.dhash)
+
+
+def apply_metadata(obj, source, metadata):
+    """Copy an imaging.image_metadata() result onto the object (without saving)"""
+    for field, value in metadata.items():
+        setattr(obj, field, value)
+    obj.metadata_source = source
@@ -0,0 +1,332 @@
+"""
+Request metrics: latency histograms, query budgets and Server-Timing
+
+MetricsMiddleware times every request and counts its database queries
+through connection.execute_wrapper(), so no DEBUG query log is needed.
+Code that renders or compresses a response wraps that work in
+timed('serialize') / timed('compress') to report it separately. The
+results are kept in this process's REGISTRY and exposed in the Prometheus
+text format by the /metrics view. With SERVER_TIMING (on under DEBUG) each
+response also gets a Server-Timing header summarizing them.
+
+Metrics are per worker process: with several gunicorn workers each scrape
+sees the counters of the worker that answered it.
+"""
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+from .media_cache import media_cache_stats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Methods reported as themselves; any other becomes 'other' so clients cannot create label series
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'))
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more queries than its entry in QUERY_BUDGETS allows"""
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self.values.get(labels, 0)
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+            for labels, value in values
+        ]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def get(self, labels=()):
+        """(sum, count) observed for `labels`"""
+        entry = self.values.get(labels)
+        return (entry[1], entry[2]) if entry else (0, 0)
+
+    def render(self):
+        with self.lock:
+            values = sorted((labels, ([*counts], total, count)) for labels, (counts, total, count) in self.values.items())
+        lines = self.header()
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Metrics of this process, plus collectors reporting values kept elsewhere"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """`collector()` returns (name, type, help, [(labels dict, value), ...]) tuples"""
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    'fashion_http_request_duration_seconds', 'Time until the response is returned to the WSGI server',
+    ('route', 'method', 'status'), LATENCY_BUCKETS,
+))
+REQUEST_QUERIES = REGISTRY.register(Histogram(
+    'fashion_http_request_db_queries', 'Database queries per request', ('route',), QUERY_BUCKETS,
+))
+REQUEST_DB_DURATION = REGISTRY.register(Histogram(
+    'fashion_http_request_db_duration_seconds', 'Time per request spent in database queries', ('route',), LATENCY_BUCKETS,
+))
+REQUEST_PHASE_DURATION = REGISTRY.register(Histogram(
+    'fashion_http_request_phase_duration_seconds', 'Time per request spent serializing or compressing the response',
+    ('route', 'phase'), LATENCY_BUCKETS,
+))
+RESPONSE_BYTES = REGISTRY.register(Histogram(
+    'fashion_http_response_bytes', 'Response body size', ('route',), BYTES_BUCKETS,
+))
+QUERY_BUDGET_EXCEEDED = REGISTRY.register(Counter(
+    'fashion_query_budget_exceeded_total', 'Requests that ran more queries than QUERY_BUDGETS allows', ('route',),
+))
+
+
+@REGISTRY.register_collector
+def media_cache_metrics():
+    stats = media_cache_stats()
+    if not stats:
+        return []
+    return [
+        ('fashion_media_cache_hits_total', 'counter', 'Media cache hits', [({}, stats['hits'])]),
+        ('fashion_media_cache_misses_total', 'counter', 'Media cache misses', [({}, stats['misses'])]),
+        ('fashion_media_cache_evictions_total', 'counter', 'Media cache evictions', [({}, stats['evictions'])]),
+        ('fashion_media_cache_entries', 'gauge', 'Files in the media cache', [({}, stats['entries'])]),
+        ('fashion_media_cache_bytes', 'gauge', 'Bytes in the media cache', [({}, stats['bytes'])]),
+    ]
+
+
+class RequestMetrics:
+    """Queries and phase timings of the request being handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_duration = 0.0
+        self.phases = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_duration += time.perf_counter() - started
+
+    def add_phase(self, phase, duration):
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def current_request_metrics():
+    return _current.get()
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to `phase` of the current request, if any"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_phase(phase, time.perf_counter() - started)
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def route_name(request):
+    """Bounded label for the route: the URL name, or 'unmatched'"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unmatched'
+
+
+def method_label(method):
+    return method if method in HTTP_METHODS else 'other'
+
+
+def response_bytes(response):
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if not response.streaming:
+        return len(response.content)
+    return None
+
+
+def server_timing(metrics, total):
+    entries = [f'total;dur={total * 1000:.1f}', f'db;dur={metrics.db_duration * 1000:.1f};desc="{metrics.queries} queries"']
+    entries.extend(f'{phase};dur={duration * 1000:.1f}' for phase, duration in sorted(metrics.phases.items()))
+    return ', '.join(entries)
+
+
+def check_query_budget(route, queries):
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(route)
+    if budget is None or queries <= budget:
+        return
+    QUERY_BUDGET_EXCEEDED.inc((route,))
+    message = f'{route} ran {queries} queries, over its budget of {budget}'
+    mode = getattr(settings, 'QUERY_BUDGET_MODE', 'log')
+    if mode == 'raise':
+        raise QueryBudgetExceeded(message)
+    if mode == 'log':
+        logger.warning(message)
+
+
+class MetricsMiddleware:
+    """Record latency, queries, phases and bytes of every request (place it first in MIDDLEWARE)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics_enabled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - metrics.started
+
+        route = route_name(request)
+        REQUEST_DURATION.observe((route, method_label(request.method), str(response.status_code)), total)
+        REQUEST_QUERIES.observe((route,), metrics.queries)
+        REQUEST_DB_DURATION.observe((route,), metrics.db_duration)
+        for phase, duration in metrics.phases.items():
+            REQUEST_PHASE_DURATION.observe((route, phase), duration)
+        size = response_bytes(response)
+        if size is not None:
+            RESPONSE_BYTES.observe((route,), size)
+
+        if getattr(settings, 'SERVER_TIMING', settings.DEBUG):
+            timing = server_timing(metrics, total)
+            response['Server-Timing'] = f"{response['Server-Timing']}, {timing}" if response.has_header('Server-Timing') else timing
+
+        # Budgets are set for anonymous requests; a session adds its own and the user's lookups
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            check_query_budget(route, metrics.queries)
+        return response
+
+
+def render_metrics():
+    return REGISTRY.render()
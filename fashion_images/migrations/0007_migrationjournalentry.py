@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_images', '0006_imagederivative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigrationJournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command', models.CharField(max_length=50)),
+                ('object_type', models.CharField(max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('uploading', 'Uploading'), ('uploaded', 'Uploaded'), ('committed', 'Committed'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('digest', models.CharField(blank=True, max_length=64)),
+                ('url', models.URLField(blank=True, max_length=500, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('command', 'object_type', 'object_id'), name='unique_journal_object')],
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_images', '0007_migrationjournalentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fashionimage',
+            name='blurhash',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='fashionimage',
+            name='dominant_color',
+            field=models.CharField(blank=True, help_text='e.g. #a1b2c3', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='fashionimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fashionimage',
+            name='metadata_source',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='fashionimage',
+            name='mime',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='fashionimage',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, help_text='File size in bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='fashionimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='blurhash',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='dominant_color',
+            field=models.CharField(blank=True, help_text='e.g. #a1b2c3', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='metadata_source',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='mime',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, help_text='File size in bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fashion_images', '0008_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fashionimage',
+            name='dhash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='dhash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 class TeamMember(models.Model):
     name = models.CharField(max_length=100)
@@ -8,7 +9,23 @@ class TeamMember(models.Model):
     def __str__(self):
         return self.name
 
-class FashionImage(models.Model):
+class ImageMetadata(models.Model):
+    """Stored dimensions, size and placeholders of an image (filled in by fashion_images.metadata)"""
+    width = models.PositiveIntegerField(blank=True, null=True)
+    height = models.PositiveIntegerField(blank=True, null=True)
+    size = models.PositiveBigIntegerField(blank=True, null=True, help_text="File size in bytes")
+    mime = models.CharField(max_length=100, blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True, help_text="e.g. #a1b2c3")
+    blurhash = models.CharField(max_length=100, blank=True)
+    # 64-bit perceptual difference hash in hex, for near-duplicate search (see dedup.py)
+    dhash = models.CharField(max_length=16, blank=True, db_index=True)
+    # File or URL the metadata was computed from; recomputed when it changes
+    metadata_source = models.CharField(max_length=500, blank=True)
+    
+    class Meta:
+        abstract = True
+
+class FashionImage(ImageMetadata):
     team_member = models.ForeignKey(TeamMember, on_delete=models.CASCADE, related_name='images')
     # Store Supabase URL instead of local file
     image_url = models.URLField(max_length=500, blank=True, null=True, help_text="Supabase URL for the image")
@@ -21,8 +38,39 @@ class FashionImage(models.Model):
     
     def __str__(self):
         return f"{self.team_member.name} - Image {self.order}"
+    
+    def srcset(self, image_format):
+        """srcset value built from this image's derivatives in one format (uses prefetched rows)"""
+        return ', '.join(
+            f"{derivative.url} {derivative.width}w"
+            for derivative in self.derivatives.all()
+            if derivative.format == image_format
+        )
 
-class MediaFile(models.Model):
+class ImageDerivative(models.Model):
+    """Resized copy of a FashionImage, used to build responsive srcset values"""
+    FORMAT_CHOICES = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+    
+    image = models.ForeignKey(FashionImage, on_delete=models.CASCADE, related_name='derivatives')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    url = models.URLField(max_length=500)
+    size = models.PositiveIntegerField(help_text="Encoded size in bytes")
+    
+    class Meta:
+        ordering = ['width']
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'width', 'format'], name='unique_image_derivative'),
+        ]
+    
+    def __str__(self):
+        return f"{self.image} - {self.width}w {self.format}"
+
+class MediaFile(ImageMetadata):
     MEDIA_TYPE_CHOICES = [
         ('image', 'Image'),
         ('video', 'Video'),
@@ -38,4 +86,73 @@ class MediaFile(models.Model):
     description = models.TextField(blank=True)
     
     def __str__(self):
-        return f"{self.name} ({self.media_type})"
\ No newline at end of file
+        return f"{self.name} ({self.media_type})"
+
+class CatalogVersion(models.Model):
+    """Single-row counter bumped whenever team members, images or media files change"""
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Catalog v{self.version}"
+    
+    @property
+    def etag(self):
+        # Include the timestamp so a recreated database never reuses an old tag
+        return f'"catalog-{self.version}-{int(self.updated_at.timestamp() * 1000000):x}"'
+    
+    @property
+    def last_modified(self):
+        return int(self.updated_at.timestamp())
+
+class StoredObject(models.Model):
+    """Index of content-addressed uploads, keyed by the SHA-256 digest of the bytes"""
+    digest = models.CharField(max_length=64, unique=True)
+    url = models.URLField(max_length=500)
+    storage_path = models.CharField(max_length=300)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.digest[:12]} -> {self.storage_path}"
+
+class ResumableUpload(models.Model):
+    """A TUS upload in progress, so an interrupted upload of the same file continues where it stopped"""
+    # SHA-256 of bucket, folder, local path, size and mtime
+    fingerprint = models.CharField(max_length=64, unique=True)
+    upload_url = models.URLField(max_length=500)
+    storage_path = models.CharField(max_length=300)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.storage_path} ({self.size} bytes)"
+
+class MigrationJournalEntry(models.Model):
+    """Durable per-object progress of a storage migration command, used by --resume"""
+    STATE_CHOICES = [
+        ('pending', 'Pending'),
+        ('uploading', 'Uploading'),
+        ('uploaded', 'Uploaded'),
+        ('committed', 'Committed'),
+        ('failed', 'Failed'),
+    ]
+    
+    command = models.CharField(max_length=50)
+    object_type = models.CharField(max_length=20)
+    object_id = models.PositiveBigIntegerField()
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='pending')
+    # SHA-256 of the local source file that was uploaded
+    digest = models.CharField(max_length=64, blank=True)
+    url = models.URLField(max_length=500, blank=True, null=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['command', 'object_type', 'object_id'], name='unique_journal_object'),
+        ]
+    
+    def __str__(self):
+        return f"{self.command} {self.object_type}:{self.object_id} ({self.state})"
@@ -0,0 +1,35 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Opt-in keyset pagination ordered on the primary key
+
+    Requests with ?cursor= or ?limit= get {next, previous, results} pages
+    that seek with WHERE id > ... and never run COUNT(*), so every page
+    costs the same however deep the client scrolls. Other requests keep
+    the default page-number pagination.
+    """
+    ordering = 'id'
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+    def __init__(self):
+        self.fallback = None
+
+    def is_requested(self, request):
+        """Whether the client opted in with ?cursor= or ?limit="""
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            self.fallback = PageNumberPagination()
+            return self.fallback.paginate_queryset(queryset, request, view)
+        self.fallback = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return super().get_paginated_response(data)
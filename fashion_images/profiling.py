@@ -0,0 +1,308 @@
+"""
+On-demand profiling of live requests
+
+ProfilingMiddleware runs a request under cProfile (and tracemalloc) when
+PROFILING_SAMPLE_RATE picks it, from any client and optionally only for the
+URL names in PROFILING_ROUTES, or when a staff user asks for it with an
+`X-Profile: 1` header or `?profile=1`. Only staff can trigger a profile or
+see one's id (the `X-Profile-Id` response header); sampled requests are
+answered as usual. Each profile is written to PROFILING_ROOT as
+<id>.prof (pstats) next to <id>.json (route, timing, status, query log and
+top allocations). Only the newest PROFILING_MAX_PROFILES are kept. The
+`profiles` management command lists, shows and exports them.
+
+One request per process is profiled at a time; others run normally.
+"""
+import cProfile
+from contextlib import ExitStack
+import json
+import logging
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Queries kept in a profile's log; the count covers all of them
+MAX_LOGGED_QUERIES = 500
+MAX_SQL_LENGTH = 2000
+# Allocation sites listed in a profile
+TOP_ALLOCATIONS = 25
+
+_profiling_lock = threading.Lock()
+
+
+def get_profile_root():
+    return str(getattr(settings, 'PROFILING_ROOT', settings.BASE_DIR / 'profiles'))
+
+
+def profile_path(profile_id, suffix):
+    return os.path.join(get_profile_root(), f'{profile_id}{suffix}')
+
+
+def profiling_requested(request):
+    """Whether a staff user asked for this request to be profiled"""
+    flag = request.headers.get('X-Profile') or request.GET.get('profile')
+    if not flag or flag.lower() in ('0', 'false', 'no'):
+        return False
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def route_of(request):
+    try:
+        return resolve(request.path_info).view_name
+    except Resolver404:
+        return 'unmatched'
+
+
+def profiling_sampled(request):
+    """Whether PROFILING_SAMPLE_RATE picks this request, whoever sent it"""
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+    if not rate or random.random() >= rate:
+        return False
+    routes = getattr(settings, 'PROFILING_ROUTES', [])
+    return not routes or route_of(request) in routes
+
+
+class QueryLog:
+    """connection.execute_wrapper() hook recording the SQL and duration of each query"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if len(self.queries) < MAX_LOGGED_QUERIES:
+                self.queries.append({'sql': sql[:MAX_SQL_LENGTH], 'duration_ms': round(duration * 1000, 3)})
+
+
+def top_allocations(snapshot, limit=TOP_ALLOCATIONS):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ])
+    return [
+        {'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'bytes': stat.size, 'count': stat.count}
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def save_profile(profiler, record):
+    """Write the pstats file, then the record that makes the profile visible, and prune old ones"""
+    os.makedirs(get_profile_root(), exist_ok=True)
+    prof_path = profile_path(record['id'], '.prof')
+    profiler.dump_stats(prof_path)
+    _write_atomic(profile_path(record['id'], '.json'), json.dumps(record, indent=2).encode())
+    prune_profiles()
+
+
+def prune_profiles(keep=None):
+    keep = getattr(settings, 'PROFILING_MAX_PROFILES', 100) if keep is None else keep
+    profile_ids = list_profile_ids()
+    for profile_id in profile_ids[:max(len(profile_ids) - keep, 0)]:
+        delete_profile(profile_id)
+
+
+def delete_profile(profile_id):
+    for suffix in ('.json', '.prof'):
+        try:
+            os.unlink(profile_path(profile_id, suffix))
+        except FileNotFoundError:
+            pass
+
+
+def list_profile_ids():
+    """Stored profile ids, oldest first (ids start with their UTC timestamp)"""
+    root = get_profile_root()
+    if not os.path.isdir(root):
+        return []
+    return sorted(name[:-len('.json')] for name in os.listdir(root) if name.endswith('.json') and not name.startswith('.'))
+
+
+def load_profile(profile_id):
+    """The stored record of `profile_id`, or None"""
+    try:
+        with open(profile_path(profile_id, '.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def new_profile_id():
+    return f"{timezone.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+
+def profile_request(request, get_response, trigger):
+    """Run `get_response(request)` under the profilers and store the result"""
+    query_log = QueryLog()
+    profiler = cProfile.Profile()
+    trace_memory = getattr(settings, 'PROFILING_TRACEMALLOC', True) and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+        memory = None
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            memory = {'current_bytes': current, 'peak_bytes': peak, 'top': top_allocations(tracemalloc.take_snapshot())}
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    match = getattr(request, 'resolver_match', None)
+    record = {
+        'id': new_profile_id(),
+        'created_at': timezone.now().isoformat(),
+        'trigger': trigger,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'route': match.view_name if match else 'unmatched',
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        'queries': {'count': query_log.count, 'duration_ms': round(query_log.duration * 1000, 3), 'log': query_log.queries},
+        'memory': memory,
+        'pid': os.getpid(),
+    }
+    try:
+        save_profile(profiler, record)
+    except OSError as e:
+        logger.error(f"Could not store profile of {record['path']}: {e}")
+        return response, None
+    return response, record['id']
+
+
+class ProfilingMiddleware:
+    """Profile staff-requested and sampled requests (place it after AuthenticationMiddleware)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            return self.get_response(request)
+        if profiling_requested(request):
+            trigger = 'requested'
+        elif profiling_sampled(request):
+            trigger = 'sampled'
+        else:
+            return self.get_response(request)
+
+        # cProfile and tracemalloc are process-wide; concurrent requests run unprofiled
+        if not _profiling_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            response, profile_id = profile_request(request, self.get_response, trigger)
+        finally:
+            _profiling_lock.release()
+        # Only staff who asked for the profile learn its id
+        if profile_id and trigger == 'requested':
+            response['X-Profile-Id'] = profile_id
+        return response
+
+
+def load_stats(profile_id):
+    return pstats.Stats(profile_path(profile_id, '.prof'))
+
+
+def speedscope_profile(stats, name, min_fraction=0.001):
+    """
+    Speedscope "evented" profile approximating the call tree of `stats`
+
+    cProfile keeps per caller/callee totals rather than stacks, so each
+    function's time is split between its callees in proportion to the time
+    spent in them from any caller. Frames below `min_fraction` of the total
+    and recursive calls are folded into their parent.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, {})[func] = cumulative
+    roots = [func for func, (_, _, _, _, callers) in stats.stats.items() if not callers]
+    total = sum(stats.stats[func][3] for func in roots)
+
+    frames, frame_index, events = [], {}, []
+
+    def frame(func):
+        if func not in frame_index:
+            filename, line, function = func
+            frame_index[func] = len(frames)
+            frames.append({'name': function, 'file': filename, 'line': line})
+        return frame_index[func]
+
+    def walk(func, at, duration, stack):
+        index = frame(func)
+        events.append({'type': 'O', 'frame': index, 'at': at * 1000})
+        cumulative = stats.stats[func][3] or duration
+        children = [(callee, spent * duration / cumulative) for callee, spent in callees.get(func, {}).items()
+                    if callee not in stack]
+        spent_in_children = sum(spent for _, spent in children)
+        scale = duration / spent_in_children if spent_in_children > duration else 1
+        child_at = at
+        for callee, spent in sorted(children, key=lambda child: -child[1]):
+            spent *= scale
+            if total and spent / total >= min_fraction:
+                child_at = walk(callee, child_at, spent, stack | {callee})
+        # max() keeps the events ordered despite rounding in the children's sums
+        end = max(at + duration, child_at)
+        events.append({'type': 'C', 'frame': index, 'at': end * 1000})
+        return end
+
+    at = 0.0
+    for func in sorted(roots, key=lambda root: -stats.stats[root][3]):
+        at = walk(func, at, stats.stats[func][3], {func})
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'evented',
+            'name': name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': at * 1000,
+            'events': events,
+        }],
+        'name': name,
+        'activeProfileIndex': 0,
+        'exporter': 'fashion_images.profiling',
+    }
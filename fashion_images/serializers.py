@@ -1,12 +1,19 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import TeamMember, FashionImage, MediaFile
 
 class FashionImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    webp_srcset = serializers.SerializerMethodField()
+    sizes = serializers.SerializerMethodField()
     
     class Meta:
         model = FashionImage
-        fields = ['id', 'image_url', 'order']
+        fields = [
+            'id', 'image_url', 'order', 'srcset', 'webp_srcset', 'sizes',
+            'width', 'height', 'dominant_color', 'blurhash',
+        ]
     
     def get_image_url(self, obj):
         # Use Supabase URL if available, otherwise fallback to local file
@@ -22,13 +29,26 @@ class FashionImageSerializer(serializers.ModelSerializer):
             return f"/media/images/{filename}"
         
         return None
+    
+    def get_srcset(self, obj):
+        # JPEG derivatives, e.g. "https://.../a.jpg 320w, https://.../b.jpg 640w"
+        return obj.srcset('jpeg')
+    
+    def get_webp_srcset(self, obj):
+        return obj.srcset('webp')
+    
+    def get_sizes(self, obj):
+        return settings.IMAGE_SIZES
 
 class MediaFileSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     
     class Meta:
         model = MediaFile
-        fields = ['id', 'name', 'media_type', 'file_url', 'description']
+        fields = [
+            'id', 'name', 'media_type', 'file_url', 'description',
+            'width', 'height', 'size', 'mime', 'dominant_color', 'blurhash',
+        ]
     
     def get_file_url(self, obj):
         # Use Supabase URL if available, otherwise fallback to local file
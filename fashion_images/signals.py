@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .catalog import bump_catalog_version
+from .imaging import image_metadata
+from .metadata import METADATA_FIELDS, apply_metadata, metadata_is_current, metadata_source
+from .models import TeamMember, FashionImage, ImageDerivative, MediaFile
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=TeamMember)
+@receiver(post_save, sender=FashionImage)
+@receiver(post_save, sender=ImageDerivative)
+@receiver(post_save, sender=MediaFile)
+@receiver(post_delete, sender=TeamMember)
+@receiver(post_delete, sender=FashionImage)
+@receiver(post_delete, sender=ImageDerivative)
+@receiver(post_delete, sender=MediaFile)
+def catalog_changed(sender, **kwargs):
+    """Invalidate cached catalog responses whenever catalog rows change"""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=FashionImage)
+@receiver(post_save, sender=MediaFile)
+def fill_image_metadata(sender, instance, raw=False, **kwargs):
+    """
+    Compute metadata for newly saved local files
+
+    Only files under MEDIA_ROOT are read here; images that exist only as
+    URLs are filled in by the backfill_metadata command.
+    """
+    if raw or not getattr(settings, 'IMAGE_METADATA_ON_SAVE', True):
+        return
+    source = metadata_source(instance, allow_remote=False)
+    if not source or metadata_is_current(instance, source):
+        return
+    try:
+        metadata = image_metadata(source)
+    except Exception as e:
+        logger.warning(f"Could not read metadata of {source}: {e}")
+        return
+
+    apply_metadata(instance, source, metadata)
+    # update() instead of save() so this receiver does not run again
+    sender.objects.filter(pk=instance.pk).update(**{field: getattr(instance, field) for field in METADATA_FIELDS})
+    bump_catalog_version()
@@ -0,0 +1,189 @@
+"""
+Pre-rendered JSON snapshots of catalog endpoints, shared between workers
+
+Each snapshot is written once per catalog ETag to
+SNAPSHOT_ROOT/<name>.<version>.<key>.<origin>.json (plus .br/.zst/.gz
+variants) via a temporary file and an atomic rename. The key hashes the
+full catalog ETag with SNAPSHOT_FORMAT, so neither a recreated database
+nor a deploy that changes the payload serves an old file. Workers mmap the
+file, so all of them share one copy in the page cache and a steady-state
+request only copies bytes out of it.
+
+Only the origins in SNAPSHOT_ORIGINS are snapshotted; the payloads embed
+URLs built from the Host header, and requests for any other host are
+rendered live instead of leaving files and maps behind.
+"""
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from .compression import available_encodings, compress, negotiate_encoding
+from .metrics import timed
+
+# Encoding -> file suffix
+SNAPSHOT_ENCODINGS = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz', 'identity': ''}
+
+# Bump whenever the rendered card_data or media_list output changes shape
+SNAPSHOT_FORMAT = 2
+
+# Snapshots kept on disk besides the newest one, for workers that have not
+# seen the latest catalog version yet
+SNAPSHOT_KEEP_VERSIONS = 2
+
+# Most snapshot files a process keeps mapped
+SNAPSHOT_MAX_MAPPED = 32
+
+# (name, origin, encoding) -> (snapshot key, mmap) for this process, least recently used first
+_mapped = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_snapshot_root():
+    return str(getattr(settings, 'SNAPSHOT_ROOT', settings.BASE_DIR / 'snapshots'))
+
+
+def request_origin(request):
+    """Scheme and host; local fallback URLs in the payloads are built from it"""
+    return f'{request.scheme}://{request.get_host()}'
+
+
+def snapshots_enabled(request):
+    """Whether this request may be served from a snapshot: only origins in SNAPSHOT_ORIGINS are"""
+    if not getattr(settings, 'CATALOG_SNAPSHOTS', True):
+        return False
+    return request_origin(request) in getattr(settings, 'SNAPSHOT_ORIGINS', [])
+
+
+def _origin_key(origin):
+    return hashlib.sha1(origin.encode()).hexdigest()[:12]
+
+
+def snapshot_key(catalog):
+    """File key of the snapshots of `catalog`: its version plus a digest of the ETag and format"""
+    digest = hashlib.sha1(f'{SNAPSHOT_FORMAT}:{catalog.etag}'.encode()).hexdigest()[:12]
+    return f'{catalog.version}.{digest}'
+
+
+def snapshot_path(name, catalog, origin, encoding='identity'):
+    return os.path.join(
+        get_snapshot_root(),
+        f'{name}.{snapshot_key(catalog)}.{_origin_key(origin)}.json{SNAPSHOT_ENCODINGS[encoding]}',
+    )
+
+
+def _write_atomic(path, data):
+    """Write to a temporary file in the same directory and rename it into place"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def write_snapshot(name, catalog, origin, content):
+    """Write a rendered payload and its compressed variants for one catalog ETag"""
+    os.makedirs(get_snapshot_root(), exist_ok=True)
+    for encoding in available_encodings():
+        with timed('compress'):
+            compressed = compress(content, encoding, best=True)
+        _write_atomic(snapshot_path(name, catalog, origin, encoding), compressed)
+    prune_snapshots(name, catalog, origin)
+
+
+def prune_snapshots(name, catalog, origin):
+    """
+    Keep the snapshot of `catalog` and the SNAPSHOT_KEEP_VERSIONS most
+    recently written others; workers that still map a removed one keep
+    reading it until they unmap it
+    """
+    pattern = re.compile(rf'{re.escape(name)}\.(\d+\.[0-9a-f]+)\.{_origin_key(origin)}\.json')
+    root = get_snapshot_root()
+    # Newest write per key; versions restart with a new database, so age is by mtime
+    written = {}
+    for filename in os.listdir(root):
+        match = pattern.match(filename)
+        if match:
+            try:
+                mtime = os.path.getmtime(os.path.join(root, filename))
+            except FileNotFoundError:
+                continue
+            written.setdefault(match.group(1), []).append((filename, mtime))
+    current = snapshot_key(catalog)
+    others = sorted((key for key in written if key != current), key=lambda key: -max(m for _, m in written[key]))
+    for key in others[SNAPSHOT_KEEP_VERSIONS:]:
+        for filename, _ in written[key]:
+            try:
+                os.unlink(os.path.join(root, filename))
+            except FileNotFoundError:
+                pass
+
+
+def _map_file(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _unmap(mapped):
+    try:
+        mapped.close()
+    except BufferError:
+        # A response is still sending it; garbage collection closes it afterwards
+        pass
+
+
+def load_snapshot(name, catalog, origin, encoding, build):
+    """
+    Return the snapshot bytes as a memoryview of its mmap, building the
+    files first if needed
+
+    The view is taken under the lock, so an eviction in another thread
+    cannot close the map before the caller has copied it.
+
+    Args:
+        build: Callable returning the rendered JSON bytes; only called when
+            no worker has written this catalog ETag yet
+    """
+    key = (name, origin, encoding)
+    file_key = snapshot_key(catalog)
+    with _lock:
+        cached = _mapped.get(key)
+        if cached and cached[0] == file_key:
+            _mapped.move_to_end(key)
+            return memoryview(cached[1])
+        path = snapshot_path(name, catalog, origin, encoding)
+        try:
+            mapped = _map_file(path)
+        except FileNotFoundError:
+            write_snapshot(name, catalog, origin, build())
+            mapped = _map_file(path)
+        if cached:
+            _unmap(cached[1])
+        _mapped[key] = (file_key, mapped)
+        _mapped.move_to_end(key)
+        while len(_mapped) > SNAPSHOT_MAX_MAPPED:
+            _, (_, evicted) = _mapped.popitem(last=False)
+            _unmap(evicted)
+        return memoryview(mapped)
+
+
+def snapshot_response(request, name, catalog, build):
+    """JSON response served from the snapshot of `name` for `catalog`; check snapshots_enabled() first"""
+    encoding = negotiate_encoding(request)
+    content = load_snapshot(name, catalog, request_origin(request), encoding, build)
+    response = HttpResponse(content, content_type='application/json')
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,490 @@
+"""
+Object storage backends for uploaded images, media and derivatives
+
+STORAGE_BACKEND names the class to use (a dotted path) and STORAGE_OPTIONS
+its keyword arguments. Supabase is the default; LocalStorageBackend and
+InMemoryStorageBackend stand in for it so the migration and derivative
+commands can run, and be benchmarked, without a Supabase project.
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+from django.utils.module_loading import import_string
+from .storage_stats import storage_operation
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend(ABC):
+    """
+    Interface shared by all storage backends
+
+    Subclasses implement the abstract primitives (`_save_file`,
+    `_save_content`, `_delete`, `exists`, `list`, `public_url`,
+    `path_from_url`), so a backend missing one fails when instantiated;
+    naming, content addressing and error handling live here so every
+    backend behaves the same.
+    """
+
+    @property
+    def available(self) -> bool:
+        """Whether uploads can be made (False e.g. without credentials)"""
+        return True
+
+    def upload_file(self, file_path: str, file_name: str, folder: str = "images", content_addressed: Optional[bool] = None, digest: Optional[str] = None) -> Optional[str]:
+        """
+        Upload a local file
+
+        Args:
+            file_path: Local path to the file
+            file_name: Name for the file in storage (only its extension is kept)
+            folder: Folder in the bucket to store the file
+            content_addressed: Store under the SHA-256 digest and skip the upload
+                if identical content was stored before (default: SUPABASE_CONTENT_ADDRESSED)
+            digest: SHA-256 of the file if the caller already took it, so it is not hashed again
+
+        Returns:
+            Public URL of the uploaded file or None if failed
+        """
+        return self._upload(file_name, folder, content_addressed, digest, file_path=file_path)
+
+    def upload_file_from_content(self, file_content: bytes, file_name: str, folder: str = "images", content_addressed: Optional[bool] = None, digest: Optional[str] = None) -> Optional[str]:
+        """
+        Upload file content directly
+
+        Returns:
+            Public URL of the uploaded file or None if failed
+        """
+        return self._upload(file_name, folder, content_addressed, digest, file_content=file_content)
+
+    def upload_many(self, files: Iterable[Tuple[Union[str, bytes], str, str]], workers: int = 8) -> List[Optional[str]]:
+        """
+        Upload many files on a thread pool
+
+        Only the transfers run on the pool: with content addressing, files are
+        hashed and looked up before they are submitted and recorded as their
+        results come back, so the content index is only queried from the
+        calling thread.
+
+        Args:
+            files: (local path or bytes, file name, folder) tuples
+
+        Returns:
+            Public URLs (or None for failures) in the same order as `files`
+        """
+        files = list(files)
+        if not self.available:
+            logger.warning("Storage backend not available. Cannot upload file.")
+            return [None] * len(files)
+
+        content_addressed = self.use_content_addressing(None)
+        urls: List[Optional[str]] = [None] * len(files)
+        pending = []
+        for index, (source, file_name, folder) in enumerate(files):
+            file_path, file_content = (None, bytes(source)) if isinstance(source, (bytes, bytearray, memoryview)) else (source, None)
+            digest = None
+            if content_addressed:
+                try:
+                    digest = self._digest(file_path, file_content)
+                except OSError as e:
+                    logger.error(f"Error uploading file to storage: {e}")
+                    continue
+                urls[index] = self.stored_url(digest)
+                if urls[index]:
+                    logger.info(f"Skipped upload, identical content already stored: {urls[index]}")
+                    continue
+            pending.append((index, file_path, file_content, file_name, folder, digest))
+
+        def store(item):
+            _, file_path, file_content, file_name, folder, digest = item
+            try:
+                if file_content is None:
+                    return self.store_file(file_path, file_name, folder, digest)
+                return self.store_content(file_content, file_name, folder, digest)
+            finally:
+                # Resumable uploads keep their state in the database; close this thread's connection
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='storage') as executor:
+            for item, url in zip(pending, executor.map(store, pending)):
+                index, file_path, file_content, _, _, digest = item
+                urls[index] = url
+                if url and digest:
+                    size = os.path.getsize(file_path) if file_content is None else len(file_content)
+                    self.remember_upload(digest, url, size)
+        return urls
+
+    def store_file(self, file_path: str, file_name: str, folder: str = "images", digest: Optional[str] = None) -> Optional[str]:
+        """
+        Upload a local file without consulting or updating the content index
+
+        The object is named by `digest` when one is given, else uniquely.
+        Nothing here touches the database, so worker threads may call it; the
+        caller checks stored_url() first and calls remember_upload() after,
+        on its own thread.
+
+        Returns:
+            Public URL of the uploaded file or None if failed
+        """
+        return self._store(file_name, folder, digest, file_path=file_path)
+
+    def store_content(self, file_content: bytes, file_name: str, folder: str = "images", digest: Optional[str] = None) -> Optional[str]:
+        """store_file() for content held in memory"""
+        return self._store(file_name, folder, digest, file_content=file_content)
+
+    def stored_url(self, digest: str) -> Optional[str]:
+        """URL of content with this SHA-256 digest stored earlier by this backend, else None"""
+        with storage_operation('lookup', self) as operation:
+            existing_url = self._lookup_digest(digest)
+            operation.outcome = 'hit' if existing_url else 'miss'
+        return existing_url
+
+    def remember_upload(self, digest: str, url: str, size: int) -> None:
+        """Add a content-addressed upload to the content index"""
+        self._remember_digest(digest, url, self.path_from_url(url), size)
+
+    def use_content_addressing(self, content_addressed: Optional[bool]) -> bool:
+        """Resolve an upload's content_addressed argument (None means SUPABASE_CONTENT_ADDRESSED)"""
+        if content_addressed is None:
+            return getattr(settings, 'SUPABASE_CONTENT_ADDRESSED', False)
+        return content_addressed
+
+    def delete_file(self, file_url: str) -> bool:
+        """
+        Delete a file by its public URL
+
+        Returns:
+            True if deleted successfully, False otherwise
+        """
+        return self.delete_many([file_url])[file_url]
+
+    def delete_many(self, file_urls: Iterable[str], batch_size: int = 1000) -> Dict[str, bool]:
+        """
+        Delete many files, `batch_size` paths per backend call
+
+        Returns:
+            Mapping of each URL to whether it was deleted
+        """
+        results = {}
+        paths = {}
+        for file_url in file_urls:
+            path = self.path_from_url(file_url)
+            if path:
+                paths[file_url] = path
+            else:
+                logger.error(f"Could not extract path from URL: {file_url}")
+                results[file_url] = False
+
+        if not self.available:
+            logger.warning("Storage backend not available. Cannot delete files.")
+            return {**results, **{url: False for url in paths}}
+
+        items = list(paths.items())
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            try:
+                with storage_operation('remove', self, objects=len(batch)) as operation:
+                    deleted = self._delete([path for _, path in batch])
+                    if len(deleted) < len(batch):
+                        operation.outcome = 'partial'
+            except Exception as e:
+                logger.error(f"Error deleting files from storage: {e}")
+                deleted = set()
+            for url, path in batch:
+                results[url] = path in deleted
+                if path in deleted:
+                    logger.info(f"File deleted successfully: {url}")
+                    self._forget_path(path)
+        return results
+
+    @abstractmethod
+    def exists(self, storage_path: str) -> bool:
+        """Whether an object is stored at `storage_path`"""
+
+    @abstractmethod
+    def list(self, folder: str = "") -> List[str]:
+        """Storage paths of all files under `folder`, recursively"""
+
+    @abstractmethod
+    def public_url(self, storage_path: str) -> str:
+        """Public URL of the object at `storage_path`"""
+
+    @abstractmethod
+    def path_from_url(self, url: str) -> Optional[str]:
+        """Storage path of one of this backend's public URLs, else None"""
+
+    @abstractmethod
+    def _save_file(self, file_path: str, storage_path: str, file_extension: str, digest: Optional[str]) -> str:
+        """Store a local file; returns the storage path actually used"""
+
+    @abstractmethod
+    def _save_content(self, file_content: bytes, storage_path: str, file_extension: str, digest: Optional[str]) -> str:
+        """_save_file() for content held in memory"""
+
+    @abstractmethod
+    def _delete(self, storage_paths: List[str]) -> Set[str]:
+        """Remove objects; returns the paths that were removed"""
+
+    def _upload(self, file_name: str, folder: str, content_addressed: Optional[bool], digest: Optional[str], file_path: Optional[str] = None, file_content: Optional[bytes] = None) -> Optional[str]:
+        if not self.available:
+            logger.warning("Storage backend not available. Cannot upload file.")
+            return None
+
+        try:
+            if not self.use_content_addressing(content_addressed):
+                digest = None
+            else:
+                digest = digest or self._digest(file_path, file_content)
+                existing_url = self.stored_url(digest)
+                if existing_url:
+                    logger.info(f"Skipped upload, identical content already stored: {existing_url}")
+                    return existing_url
+            public_url = self._put(file_name, folder, digest, file_path, file_content)
+            if digest:
+                size = os.path.getsize(file_path) if file_content is None else len(file_content)
+                self.remember_upload(digest, public_url, size)
+            return public_url
+        except Exception as e:
+            logger.error(f"Error uploading file to storage: {e}")
+            return None
+
+    def _store(self, file_name: str, folder: str, digest: Optional[str], file_path: Optional[str] = None, file_content: Optional[bytes] = None) -> Optional[str]:
+        if not self.available:
+            logger.warning("Storage backend not available. Cannot upload file.")
+            return None
+
+        try:
+            return self._put(file_name, folder, digest, file_path, file_content)
+        except Exception as e:
+            logger.error(f"Error uploading file to storage: {e}")
+            return None
+
+    def _put(self, file_name: str, folder: str, digest: Optional[str], file_path: Optional[str], file_content: Optional[bytes]) -> str:
+        """Transfer the object and return its public URL; raises on failure"""
+        file_extension = os.path.splitext(file_name)[1]
+        size = os.path.getsize(file_path) if file_content is None else len(file_content)
+        storage_path = self._storage_path(folder, file_extension, digest)
+
+        with storage_operation('upload', self, size):
+            if file_content is None:
+                storage_path = self._save_file(file_path, storage_path, file_extension, digest)
+            else:
+                storage_path = self._save_content(file_content, storage_path, file_extension, digest)
+
+        with storage_operation('public_url', self):
+            public_url = self.public_url(storage_path)
+        logger.info(f"File uploaded successfully: {public_url}")
+        return public_url
+
+    def _digest(self, file_path: Optional[str], file_content: Optional[bytes]) -> str:
+        size = os.path.getsize(file_path) if file_content is None else len(file_content)
+        # Hash in chunks so large videos are never read fully just for the lookup
+        with storage_operation('hash', self, size):
+            return file_sha256(file_path) if file_content is None else hashlib.sha256(file_content).hexdigest()
+
+    def _storage_path(self, folder: str, file_extension: str, digest: Optional[str]) -> str:
+        """Name objects by content digest, or uniquely to avoid conflicts"""
+        return f"{folder}/{digest or uuid.uuid4()}{file_extension}"
+
+    def _lookup_digest(self, digest: str) -> Optional[str]:
+        """Return the URL of previously stored content with this digest in this backend"""
+        from .models import StoredObject
+        urls = StoredObject.objects.filter(digest=digest).values_list('url', flat=True)
+        # The index is shared; ignore entries written while another backend was configured
+        return next((url for url in urls if self.path_from_url(url)), None)
+
+    def _remember_digest(self, digest: str, url: str, storage_path: str, size: int) -> None:
+        from .models import StoredObject
+        StoredObject.objects.update_or_create(
+            digest=digest,
+            defaults={'url': url, 'storage_path': storage_path, 'size': size},
+        )
+
+    def _forget_path(self, storage_path: str) -> None:
+        """Drop index entries for a deleted object so its digest is uploaded again"""
+        from .models import StoredObject
+        StoredObject.objects.filter(storage_path=storage_path).delete()
+
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 hex digest of a file, read in fixed-size chunks"""
+    with open(file_path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class SimulatedLink:
+    """Optional per-request latency and bandwidth, so offline runs behave like a remote store"""
+
+    def __init__(self, latency: float = 0.0, bandwidth: Optional[float] = None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def transfer(self, size: int = 0) -> None:
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Stores objects as files under `root` and serves them from `base_url`
+
+    Args:
+        root: Directory holding the objects (default: BASE_DIR/storage)
+        base_url: URL prefix of the public URLs (default: /storage/)
+        latency: Seconds added to every upload/delete, to imitate a network
+        bandwidth: Bytes per second for uploads, to imitate a network
+    """
+
+    def __init__(self, root: Optional[str] = None, base_url: str = '/storage/', latency: float = 0.0, bandwidth: Optional[float] = None):
+        self.root = os.path.abspath(root or os.path.join(settings.BASE_DIR, 'storage'))
+        self.base_url = base_url.rstrip('/') + '/'
+        self.link = SimulatedLink(latency, bandwidth)
+
+    def _local_path(self, storage_path: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, storage_path))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Storage path outside the storage root: {storage_path}")
+        return path
+
+    def _write(self, storage_path: str, write) -> str:
+        """Write through a temporary file so readers never see a partial object"""
+        path = self._local_path(storage_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return storage_path
+
+    def _save_file(self, file_path, storage_path, file_extension, digest):
+        self.link.transfer(os.path.getsize(file_path))
+
+        def copy(f):
+            with open(file_path, 'rb') as source:
+                shutil.copyfileobj(source, f)
+        return self._write(storage_path, copy)
+
+    def _save_content(self, file_content, storage_path, file_extension, digest):
+        self.link.transfer(len(file_content))
+        return self._write(storage_path, lambda f: f.write(file_content))
+
+    def _delete(self, storage_paths):
+        self.link.transfer()
+        deleted = set()
+        for storage_path in storage_paths:
+            try:
+                os.unlink(self._local_path(storage_path))
+                deleted.add(storage_path)
+            except (FileNotFoundError, ValueError):
+                pass
+        return deleted
+
+    def exists(self, storage_path):
+        try:
+            return os.path.isfile(self._local_path(storage_path))
+        except ValueError:
+            return False
+
+    def list(self, folder=""):
+        top = os.path.join(self.root, folder) if folder else self.root
+        paths = []
+        for directory, _, filenames in os.walk(top):
+            for filename in filenames:
+                if not filename.startswith('.tmp-'):
+                    paths.append(os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, '/'))
+        return sorted(paths)
+
+    def public_url(self, storage_path):
+        return f"{self.base_url}{storage_path}"
+
+    def path_from_url(self, url):
+        url = url.split('?', 1)[0]
+        return url[len(self.base_url):] if url.startswith(self.base_url) and len(url) > len(self.base_url) else None
+
+
+class InMemoryStorageBackend(StorageBackend):
+    """
+    Keeps objects in a dict; for tests and for benchmarks that should not touch disk
+
+    Args:
+        base_url: URL prefix of the public URLs (default: memory://storage/)
+        latency: Seconds added to every upload/delete, to imitate a network
+        bandwidth: Bytes per second for uploads, to imitate a network
+    """
+
+    def __init__(self, base_url: str = 'memory://storage/', latency: float = 0.0, bandwidth: Optional[float] = None):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.link = SimulatedLink(latency, bandwidth)
+        self.objects: Dict[str, bytes] = {}
+        self.lock = threading.Lock()
+
+    def _save_file(self, file_path, storage_path, file_extension, digest):
+        with open(file_path, 'rb') as f:
+            return self._save_content(f.read(), storage_path, file_extension, digest)
+
+    def _save_content(self, file_content, storage_path, file_extension, digest):
+        self.link.transfer(len(file_content))
+        with self.lock:
+            self.objects[storage_path] = bytes(file_content)
+        return storage_path
+
+    def _delete(self, storage_paths):
+        self.link.transfer()
+        with self.lock:
+            return {path for path in storage_paths if self.objects.pop(path, None) is not None}
+
+    def exists(self, storage_path):
+        return storage_path in self.objects
+
+    def list(self, folder=""):
+        prefix = folder.rstrip('/') + '/' if folder else ''
+        with self.lock:
+            return sorted(path for path in self.objects if path.startswith(prefix))
+
+    def public_url(self, storage_path):
+        return f"{self.base_url}{storage_path}"
+
+    def path_from_url(self, url):
+        url = url.split('?', 1)[0]
+        return url[len(self.base_url):] if url.startswith(self.base_url) and len(url) > len(self.base_url) else None
+
+
+def get_storage_backend() -> StorageBackend:
+    """A new instance of the configured STORAGE_BACKEND"""
+    backend_class = import_string(getattr(settings, 'STORAGE_BACKEND', 'fashion_images.supabase_service.SupabaseStorageService'))
+    return backend_class(**getattr(settings, 'STORAGE_OPTIONS', {}))
+
+
+class DefaultStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = get_storage_backend()
+
+
+# The configured backend, created on first use
+storage = DefaultStorage()
+
+
+@receiver(setting_changed)
+def reset_storage(setting, **kwargs):
+    """Pick up a new backend under override_settings"""
+    if setting in ('STORAGE_BACKEND', 'STORAGE_OPTIONS'):
+        storage._wrapped = empty
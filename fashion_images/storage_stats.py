@@ -0,0 +1,236 @@
+"""
+Timing, bytes, retries and outcome of storage operations
+
+StorageBackend wraps each step of storing or removing an object (hash,
+lookup, upload, public_url, remove) in storage_operation(), and the
+compressing migration records its compress step with record_operation().
+Every operation is added to the fashion_storage_* metrics served at
+/metrics and to any collect_storage_stats() block that is open, which the
+migration commands use for their summaries.
+
+For uploads the summary also fits time = overhead + bytes / bandwidth over
+the successful uploads. A large per-request overhead points at the storage
+API; a low bandwidth points at the network.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+from django.utils.functional import LazyObject, empty
+from .metrics import REGISTRY, Counter, Histogram
+
+STORAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Squared coefficient of variation of upload sizes needed for the cost model
+MIN_SIZE_SPREAD = 0.01
+
+STORAGE_DURATION = REGISTRY.register(Histogram(
+    'fashion_storage_operation_duration_seconds', 'Wall time of storage operations',
+    ('backend', 'operation', 'outcome'), STORAGE_BUCKETS,
+))
+STORAGE_BYTES = REGISTRY.register(Counter(
+    'fashion_storage_operation_bytes_total', 'Bytes handled by storage operations', ('backend', 'operation'),
+))
+STORAGE_OBJECTS = REGISTRY.register(Counter(
+    'fashion_storage_operation_objects_total', 'Objects handled by storage operations', ('backend', 'operation'),
+))
+STORAGE_RETRIES = REGISTRY.register(Counter(
+    'fashion_storage_operation_retries_total', 'Retries inside storage operations (e.g. resumable upload parts)',
+    ('backend', 'operation'),
+))
+
+
+def backend_name(backend):
+    if isinstance(backend, LazyObject):
+        # The `storage` proxy: name the backend it stands for
+        if backend._wrapped is empty:
+            backend._setup()
+        backend = backend._wrapped
+    return type(backend).__name__
+
+
+class StorageOperation:
+    """One timed operation; `outcome` may be changed inside the block (e.g. to 'hit')"""
+
+    def __init__(self, operation, backend, size=0, objects=1):
+        self.operation = operation
+        self.backend = backend
+        self.size = size
+        self.objects = objects
+        self.outcome = 'ok'
+        self.retries = 0
+        self.seconds = 0.0
+
+
+class OperationStats:
+    """Totals of one kind of operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.objects = 0
+        self.retries = 0
+        self.outcomes = {}
+        # Sums for the least-squares fit of seconds against bytes
+        self.fit = [0, 0.0, 0.0, 0.0, 0.0]
+
+    def add(self, op):
+        self.count += 1
+        self.errors += op.outcome == 'error'
+        self.seconds += op.seconds
+        self.max_seconds = max(self.max_seconds, op.seconds)
+        self.bytes += op.size
+        self.objects += op.objects
+        self.retries += op.retries
+        self.outcomes[op.outcome] = self.outcomes.get(op.outcome, 0) + 1
+        if op.outcome == 'ok':
+            n, sx, sy, sxx, sxy = self.fit
+            self.fit = [n + 1, sx + op.size, sy + op.seconds, sxx + op.size * op.size, sxy + op.size * op.seconds]
+
+    def cost_model(self):
+        """(seconds of overhead per request, bytes per second), or None without enough spread in sizes"""
+        n, sx, sy, sxx, sxy = self.fit
+        spread = n * sxx - sx * sx
+        # Sizes within ~10% of each other cannot separate overhead from transfer time
+        if n < 3 or spread < MIN_SIZE_SPREAD * sx * sx:
+            return None
+        slope = (n * sxy - sx * sy) / spread
+        if slope <= 0:
+            # Time does not grow with size: all of it is per-request overhead
+            return sy / n, None
+        return max((sy - slope * sx) / n, 0.0), 1 / slope
+
+
+class StorageStats:
+    """Operation totals by operation name"""
+
+    def __init__(self):
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def add(self, op):
+        with self.lock:
+            self.operations.setdefault(op.operation, OperationStats()).add(op)
+
+    def get(self, operation):
+        return self.operations.get(operation)
+
+    def summary_lines(self):
+        """Human-readable totals, one line per operation, plus the upload time split"""
+        with self.lock:
+            operations = sorted(self.operations.items(), key=lambda item: -item[1].seconds)
+        if not operations:
+            return ['  No storage operations']
+        lines = []
+        for name, stats in operations:
+            outcomes = ', '.join(f'{count} {outcome}' for outcome, count in sorted(stats.outcomes.items()))
+            line = (
+                f'  {name:<11} {outcomes:<22} {stats.seconds:>8.2f}s total, '
+                f'{stats.seconds / stats.count * 1000:>8.1f}ms mean, {stats.max_seconds * 1000:>8.1f}ms max'
+            )
+            if stats.bytes:
+                line += f', {stats.bytes / (1024 * 1024):.1f}MB' if stats.bytes >= 1024 * 1024 else f', {stats.bytes / 1024:.1f}KB'
+            if stats.objects != stats.count:
+                line += f', {stats.objects} objects'
+            if stats.retries:
+                line += f', {stats.retries} retries'
+            lines.append(line)
+        lines.extend(self.bottleneck_lines())
+        return lines
+
+    def bottleneck_lines(self):
+        upload = self.get('upload')
+        if upload is None:
+            return []
+        compress = self.get('compress')
+        model = upload.cost_model()
+        if model is None:
+            lines = ['  Uploads: sizes too similar to separate request overhead from transfer time']
+            shares = {'storage API and network': upload.seconds}
+        else:
+            overhead, bandwidth = model
+            rate = f'{bandwidth / (1024 * 1024):.2f}MB/s' if bandwidth else 'no measurable size dependence'
+            lines = [f'  Uploads: ~{overhead * 1000:.0f}ms per request + {rate}']
+            api_seconds = min(overhead * upload.count, upload.seconds)
+            shares = {
+                'storage API (per-request overhead)': api_seconds,
+                'network (transfer)': upload.seconds - api_seconds,
+            }
+        shares['compression'] = compress.seconds if compress else 0.0
+        bound = max(shares, key=shares.get)
+        lines.append(
+            '  Estimated time: ' + ', '.join(f'{label} {seconds:.1f}s' for label, seconds in shares.items())
+            + f' -> mostly {bound}'
+        )
+        return lines
+
+
+# Totals of this process, and the collect_storage_stats() blocks currently open
+STORAGE_STATS = StorageStats()
+_collectors = []
+_collectors_lock = threading.Lock()
+
+_current = ContextVar('storage_operation', default=None)
+
+
+def record(op):
+    labels = (op.backend, op.operation)
+    STORAGE_DURATION.observe((*labels, op.outcome), op.seconds)
+    if op.size:
+        STORAGE_BYTES.inc(labels, op.size)
+    STORAGE_OBJECTS.inc(labels, op.objects)
+    if op.retries:
+        STORAGE_RETRIES.inc(labels, op.retries)
+    STORAGE_STATS.add(op)
+    with _collectors_lock:
+        collectors = list(_collectors)
+    for collector in collectors:
+        collector.add(op)
+
+
+def record_operation(operation, backend, seconds, size=0, outcome='ok', objects=1):
+    """Record an operation timed elsewhere (e.g. in a worker process)"""
+    op = StorageOperation(operation, backend_name(backend), size, objects)
+    op.seconds = seconds
+    op.outcome = outcome
+    record(op)
+
+
+@contextmanager
+def storage_operation(operation, backend, size=0, objects=1):
+    """Time the block as one `operation` of `backend`; an exception marks it as an error"""
+    op = StorageOperation(operation, backend_name(backend), size, objects)
+    token = _current.set(op)
+    started = time.perf_counter()
+    try:
+        yield op
+    except BaseException:
+        op.outcome = 'error'
+        raise
+    finally:
+        op.seconds = time.perf_counter() - started
+        _current.reset(token)
+        record(op)
+
+
+def count_retry():
+    """Count a retry against the operation running in this thread or task"""
+    op = _current.get()
+    if op is not None:
+        op.retries += 1
+
+
+@contextmanager
+def collect_storage_stats():
+    """Collect the operations of all threads while the block runs"""
+    stats = StorageStats()
+    with _collectors_lock:
+        _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        with _collectors_lock:
+            _collectors.remove(stats)
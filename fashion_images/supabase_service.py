@@ -1,14 +1,75 @@
+import asyncio
+import base64
+from datetime import timedelta
+import hashlib
 import os
+import random
+import time
 import uuid
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+import httpx
 from supabase import create_client, Client
 from django.conf import settings
+from django.utils import timezone
+from .storage import StorageBackend
+from .storage_stats import count_retry, storage_operation
 import logging
 
 logger = logging.getLogger(__name__)
 
-class SupabaseStorageService:
-    def __init__(self):
+TUS_VERSION = '1.0.0'
+
+# Supabase keeps unfinished resumable uploads for 24 hours
+RESUMABLE_UPLOAD_TTL = timedelta(hours=23)
+
+class BaseStorageService:
+    """Helpers shared by the blocking and async Supabase storage services"""
+    
+    def _get_content_type(self, file_extension: str) -> str:
+        """Get content type based on file extension"""
+        content_types = {
+            '.jpg': 'image/jpeg',
+            '.jpeg': 'image/jpeg',
+            '.png': 'image/png',
+            '.gif': 'image/gif',
+            '.webp': 'image/webp',
+            '.mp4': 'video/mp4',
+            '.mov': 'video/quicktime',
+            '.avi': 'video/x-msvideo',
+            '.pdf': 'application/pdf',
+        }
+        return content_types.get(file_extension.lower(), 'application/octet-stream')
+    
+    def _extract_path_from_url(self, url: str) -> Optional[str]:
+        """Extract storage path from Supabase public URL"""
+        try:
+            # Drop any query string (get_public_url appends a bare '?')
+            url = url.split('?', 1)[0]
+            # Supabase URLs typically look like: https://project.supabase.co/storage/v1/object/public/bucket/path
+            parts = url.split('/storage/v1/object/public/')
+            if len(parts) > 1:
+                path_with_bucket = parts[1]
+                # Remove bucket name from path
+                path_parts = path_with_bucket.split('/', 1)
+                if len(path_parts) > 1:
+                    return path_parts[1]  # Return path without bucket name
+            return None
+        except Exception as e:
+            logger.error(f"Error extracting path from URL: {e}")
+            return None
+    
+    def _removed_paths(self, storage_paths, removed_objects) -> Set[str]:
+        """
+        Paths of `storage_paths` that Storage reports as removed
+        
+        Removed objects carry their full path as `name`; a bare file name is
+        never enough, as another folder may hold an object of the same name.
+        """
+        removed = {entry.get('name') for entry in removed_objects or []}
+        return {path for path in storage_paths if path in removed}
+
+class SupabaseStorageService(BaseStorageService, StorageBackend):
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None):
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_ANON_KEY')
         self.bucket_name = os.getenv('SUPABASE_BUCKET_NAME', 'fashion-images')
@@ -23,160 +84,402 @@ class SupabaseStorageService:
             except Exception as e:
                 logger.error(f"Failed to initialize Supabase client: {e}")
                 self.client = None
+        # Lets tests point resumable uploads at a local stand-in server
+        self.transport = transport
+    
+    @property
+    def available(self) -> bool:
+        return self.client is not None
     
-    def upload_file(self, file_path: str, file_name: str, folder: str = "images") -> Optional[str]:
+    @property
+    def bucket(self):
+        return self.client.storage.from_(self.bucket_name)
+    
+    def _save_file(self, file_path: str, storage_path: str, file_extension: str, digest: Optional[str]) -> str:
         """
-        Upload a file to Supabase storage
+        Upload a local file
+        
+        Files larger than SUPABASE_RESUMABLE_THRESHOLD are sent in parts
+        with the resumable (TUS) protocol instead of being read into memory.
+        """
+        if os.path.getsize(file_path) > getattr(settings, 'SUPABASE_RESUMABLE_THRESHOLD', 6 * 1024 * 1024):
+            return self._upload_resumable(file_path, storage_path, file_extension, digest)
+        
+        # Read file content
+        with open(file_path, 'rb') as f:
+            file_content = f.read()
+        return self._save_content(file_content, storage_path, file_extension, digest)
+    
+    def _save_content(self, file_content: bytes, storage_path: str, file_extension: str, digest: Optional[str]) -> str:
+        result = self.bucket.upload(
+            path=storage_path,
+            file=file_content,
+            file_options=self._file_options(file_extension, digest)
+        )
+        if not result:
+            raise RuntimeError("Failed to upload file to Supabase")
+        return storage_path
+    
+    def _delete(self, storage_paths: List[str]) -> Set[str]:
+        return self._removed_paths(storage_paths, self.bucket.remove(storage_paths))
+    
+    def exists(self, storage_path: str) -> bool:
+        return self.available and self.bucket.exists(storage_path)
+    
+    def list(self, folder: str = "") -> List[str]:
+        """Storage paths under `folder`, walking sub-folders page by page"""
+        paths = []
+        folders = [folder.strip('/')]
+        while folders:
+            current = folders.pop()
+            offset = 0
+            while True:
+                entries = self.bucket.list(current, {'limit': 1000, 'offset': offset})
+                for entry in entries:
+                    path = f"{current}/{entry['name']}" if current else entry['name']
+                    # Folders come back without an id
+                    if entry.get('id') is None:
+                        folders.append(path)
+                    else:
+                        paths.append(path)
+                if len(entries) < 1000:
+                    break
+                offset += len(entries)
+        return sorted(paths)
+    
+    def public_url(self, storage_path: str) -> str:
+        return self.bucket.get_public_url(storage_path)
+    
+    def path_from_url(self, url: str) -> Optional[str]:
+        return self._extract_path_from_url(url)
+    
+    def _upload_resumable(self, file_path: str, storage_path: str, file_extension: str, digest: Optional[str]) -> str:
+        """
+        Upload a file through Supabase's TUS endpoint in fixed-size parts
+        
+        Only one part is held in memory at a time. Each part is retried on
+        its own, continuing from the offset the server reports, and the
+        upload URL is kept in ResumableUpload so a later call for the same
+        unchanged file resumes instead of starting over. That state is the
+        only database access of an upload; the thread pools that call this
+        close their workers' connections after each upload.
         
-        Args:
-            file_path: Local path to the file
-            file_name: Name for the file in storage
-            folder: Folder in the bucket to store the file
-            
         Returns:
-            Public URL of the uploaded file or None if failed
+            The storage path of the completed object: `storage_path`, or the
+            path of the upload that was resumed (raises on failure)
         """
-        if not self.client:
-            logger.warning("Supabase client not available. Cannot upload file.")
-            return None
-            
-        try:
-            # Generate unique filename to avoid conflicts
-            file_extension = os.path.splitext(file_name)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            storage_path = f"{folder}/{unique_filename}"
+        from .models import ResumableUpload
+        stat = os.stat(file_path)
+        folder = storage_path.rsplit('/', 1)[0]
+        fingerprint = hashlib.sha256(
+            f"{self.bucket_name}\0{folder}\0{os.path.abspath(file_path)}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()
+        ).hexdigest()
+        chunk_size = getattr(settings, 'SUPABASE_RESUMABLE_CHUNK_SIZE', 6 * 1024 * 1024)
+        
+        with self._tus_client() as http:
+            upload = ResumableUpload.objects.filter(
+                fingerprint=fingerprint, created_at__gte=timezone.now() - RESUMABLE_UPLOAD_TTL
+            ).first()
+            offset = self._tus_offset(http, upload.upload_url) if upload else None
+            if offset is None:
+                ResumableUpload.objects.filter(fingerprint=fingerprint).delete()
+                upload = ResumableUpload.objects.create(
+                    fingerprint=fingerprint,
+                    upload_url=self._tus_create(http, storage_path, stat.st_size, file_extension, digest),
+                    storage_path=storage_path,
+                    size=stat.st_size,
+                )
+                offset = 0
+            else:
+                logger.info(f"Resuming upload of {file_path} at byte {offset} of {stat.st_size}")
             
-            # Read file content
             with open(file_path, 'rb') as f:
-                file_content = f.read()
-            
-            # Upload to Supabase
-            result = self.client.storage.from_(self.bucket_name).upload(
-                path=storage_path,
-                file=file_content,
-                file_options={"content-type": self._get_content_type(file_extension)}
+                while offset < stat.st_size:
+                    offset = self._tus_send_part(http, upload.upload_url, f, offset, chunk_size)
+        
+        upload.delete()
+        return upload.storage_path
+    
+    def _tus_client(self) -> httpx.Client:
+        return httpx.Client(
+            base_url=f"{self.supabase_url.rstrip('/')}/storage/v1",
+            headers={
+                'Authorization': f'Bearer {self.supabase_key}',
+                'apikey': self.supabase_key,
+                'Tus-Resumable': TUS_VERSION,
+            },
+            timeout=getattr(settings, 'SUPABASE_RESUMABLE_TIMEOUT', 120.0),
+            transport=self.transport,
+        )
+    
+    def _tus_create(self, http: httpx.Client, storage_path: str, size: int, file_extension: str, digest: Optional[str]) -> str:
+        """Start a resumable upload and return its URL"""
+        metadata = {
+            'bucketName': self.bucket_name,
+            'objectName': storage_path,
+            'contentType': self._get_content_type(file_extension),
+        }
+        response = http.post(
+            '/upload/resumable',
+            headers={
+                'Upload-Length': str(size),
+                'Upload-Metadata': ','.join(f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in metadata.items()),
+                'x-upsert': self._file_options(file_extension, digest).get('upsert', 'false'),
+            },
+        )
+        response.raise_for_status()
+        return response.headers['Location']
+    
+    def _tus_offset(self, http: httpx.Client, upload_url: str) -> Optional[int]:
+        """Bytes the server already has for an upload, or None if it no longer exists"""
+        response = http.head(upload_url)
+        if response.status_code in (404, 410):
+            return None
+        response.raise_for_status()
+        return int(response.headers['Upload-Offset'])
+    
+    def _tus_send_part(self, http: httpx.Client, upload_url: str, f, offset: int, chunk_size: int) -> int:
+        """Send the part starting at `offset`, retrying with backoff; returns the new offset"""
+        max_retries = getattr(settings, 'SUPABASE_RESUMABLE_RETRIES', 5)
+        attempt = 0
+        while True:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            try:
+                # httpx keeps each request in a reference cycle until the next GC run;
+                # a one-shot iterator lets the part's bytes go as soon as they are sent
+                response = http.patch(
+                    upload_url,
+                    content=iter((chunk,)),
+                    headers={
+                        'Upload-Offset': str(offset),
+                        'Content-Length': str(len(chunk)),
+                        'Content-Type': 'application/offset+octet-stream',
+                    },
+                )
+                response.raise_for_status()
+                return int(response.headers['Upload-Offset'])
+            except httpx.HTTPError as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                count_retry()
+                delay = random.uniform(0, min(30.0, 0.5 * (2 ** (attempt - 1))))
+                logger.warning(f"Part at byte {offset} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                # Part of the chunk may have been stored; carry on from what the server has
+                try:
+                    server_offset = self._tus_offset(http, upload_url)
+                except httpx.HTTPError:
+                    continue
+                if server_offset is None:
+                    raise
+                offset = server_offset
+    
+    def _file_options(self, file_extension: str, digest: Optional[str]) -> dict:
+        file_options = {"content-type": self._get_content_type(file_extension)}
+        if digest:
+            # A digest path always holds the same bytes, so overwriting is harmless
+            file_options["upsert"] = "true"
+        return file_options
+
+
+class AsyncSupabaseStorageService(BaseStorageService):
+    """
+    Async counterpart of SupabaseStorageService
+    
+    Talks to the Supabase Storage REST API through one long-lived
+    httpx.AsyncClient, so connections are kept alive (and multiplexed over
+    HTTP/2) across calls instead of being set up per request. The client is
+    created lazily inside the running event loop; call `aclose()` (or use
+    the service as an async context manager) before that loop ends.
+    """
+    
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        http2: bool = True,
+        timeout: float = 60.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.supabase_url = (os.getenv('SUPABASE_URL') or '').rstrip('/')
+        self.supabase_key = os.getenv('SUPABASE_ANON_KEY')
+        self.bucket_name = os.getenv('SUPABASE_BUCKET_NAME', 'fashion-images')
+        self.limits = httpx.Limits(
+            max_connections=max_connections or getattr(settings, 'SUPABASE_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=max_keepalive_connections or getattr(settings, 'SUPABASE_MAX_KEEPALIVE_CONNECTIONS', 20),
+            keepalive_expiry=keepalive_expiry or getattr(settings, 'SUPABASE_KEEPALIVE_EXPIRY', 30.0),
+        )
+        self.http2 = http2
+        self.timeout = timeout
+        # Lets tests and benchmarks point the service at a local stand-in server
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    @property
+    def configured(self) -> bool:
+        return bool(self.supabase_url and self.supabase_key)
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.supabase_url}/storage/v1",
+                headers={
+                    'Authorization': f'Bearer {self.supabase_key}',
+                    'apikey': self.supabase_key,
+                },
+                limits=self.limits,
+                http2=self.http2,
+                timeout=self.timeout,
+                transport=self.transport,
             )
-            
-            if result:
-                # Get public URL
-                public_url = self.client.storage.from_(self.bucket_name).get_public_url(storage_path)
-                logger.info(f"File uploaded successfully: {public_url}")
-                return public_url
-            else:
-                logger.error("Failed to upload file to Supabase")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error uploading file to Supabase: {e}")
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Close pooled connections; a new client is created on next use"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    def get_public_url(self, storage_path: str) -> str:
+        return f"{self.supabase_url}/storage/v1/object/public/{self.bucket_name}/{storage_path}"
+    
+    async def upload_file(self, file_path: str, file_name: str, folder: str = "images") -> Optional[str]:
+        """
+        Upload a local file to Supabase storage without blocking the event loop
+        
+        Returns:
+            Public URL of the uploaded file or None if failed
+        """
+        try:
+            file_content = await asyncio.to_thread(self._read_file, file_path)
+        except OSError as e:
+            logger.error(f"Error reading file for Supabase upload: {e}")
             return None
+        return await self.upload_file_from_content(file_content, file_name, folder)
     
-    def upload_file_from_content(self, file_content: bytes, file_name: str, folder: str = "images") -> Optional[str]:
+    async def upload_file_from_content(self, file_content: bytes, file_name: str, folder: str = "images") -> Optional[str]:
         """
-        Upload file content directly to Supabase storage
+        Upload file content to Supabase storage
         
-        Args:
-            file_content: File content as bytes
-            file_name: Name for the file in storage
-            folder: Folder in the bucket to store the file
-            
         Returns:
             Public URL of the uploaded file or None if failed
         """
-        if not self.client:
+        if not self.configured:
             logger.warning("Supabase client not available. Cannot upload file.")
             return None
-            
+        
         try:
             # Generate unique filename to avoid conflicts
             file_extension = os.path.splitext(file_name)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            storage_path = f"{folder}/{unique_filename}"
+            storage_path = f"{folder}/{uuid.uuid4()}{file_extension}"
             
-            # Upload to Supabase
-            result = self.client.storage.from_(self.bucket_name).upload(
-                path=storage_path,
-                file=file_content,
-                file_options={"content-type": self._get_content_type(file_extension)}
-            )
+            with storage_operation('upload', self, len(file_content)):
+                response = await self.client.post(
+                    f"/object/{self.bucket_name}/{storage_path}",
+                    content=file_content,
+                    headers={'Content-Type': self._get_content_type(file_extension), 'x-upsert': 'false'},
+                )
+                response.raise_for_status()
             
-            if result:
-                # Get public URL
-                public_url = self.client.storage.from_(self.bucket_name).get_public_url(storage_path)
-                logger.info(f"File uploaded successfully: {public_url}")
-                return public_url
-            else:
-                logger.error("Failed to upload file to Supabase")
-                return None
-                
+            public_url = self.get_public_url(storage_path)
+            logger.info(f"File uploaded successfully: {public_url}")
+            return public_url
         except Exception as e:
             logger.error(f"Error uploading file to Supabase: {e}")
             return None
     
-    def delete_file(self, file_url: str) -> bool:
+    async def delete_file(self, file_url: str) -> bool:
         """
         Delete a file from Supabase storage
         
-        Args:
-            file_url: Public URL of the file to delete
-            
         Returns:
             True if deleted successfully, False otherwise
         """
-        if not self.client:
-            logger.warning("Supabase client not available. Cannot delete file.")
-            return False
+        return (await self.delete_many([file_url]))[file_url]
+    
+    async def upload_many(self, files: Iterable[Tuple[Union[str, bytes], str, str]], concurrency: int = 100) -> List[Optional[str]]:
+        """
+        Upload many files concurrently
+        
+        Args:
+            files: (local path or bytes, file name, folder) tuples
+            concurrency: Maximum number of uploads in flight at once
             
-        try:
-            # Extract path from URL
+        Returns:
+            Public URLs (or None for failures) in the same order as `files`
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def upload(source, file_name, folder):
+            async with semaphore:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    return await self.upload_file_from_content(bytes(source), file_name, folder)
+                return await self.upload_file(source, file_name, folder)
+        
+        return await asyncio.gather(*(upload(*item) for item in files))
+    
+    async def delete_many(self, file_urls: Iterable[str], batch_size: int = 1000, concurrency: int = 10) -> Dict[str, bool]:
+        """
+        Delete many files, batching paths into Storage's bulk remove endpoint
+        
+        Returns:
+            Mapping of each URL to whether it was deleted
+        """
+        results = {}
+        paths = {}
+        for file_url in file_urls:
             path = self._extract_path_from_url(file_url)
-            if not path:
-                logger.error("Could not extract path from URL")
-                return False
-            
-            # Delete from Supabase
-            result = self.client.storage.from_(self.bucket_name).remove([path])
-            
-            if result:
-                logger.info(f"File deleted successfully: {file_url}")
-                return True
+            if path:
+                paths[file_url] = path
             else:
-                logger.error("Failed to delete file from Supabase")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error deleting file from Supabase: {e}")
-            return False
-    
-    def _get_content_type(self, file_extension: str) -> str:
-        """Get content type based on file extension"""
-        content_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp',
-            '.mp4': 'video/mp4',
-            '.mov': 'video/quicktime',
-            '.avi': 'video/x-msvideo',
-            '.pdf': 'application/pdf',
-        }
-        return content_types.get(file_extension.lower(), 'application/octet-stream')
+                logger.error(f"Could not extract path from URL: {file_url}")
+                results[file_url] = False
+        
+        if not self.configured:
+            logger.warning("Supabase client not available. Cannot delete files.")
+            return {**results, **{url: False for url in paths}}
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        items = list(paths.items())
+        
+        async def remove(batch):
+            async with semaphore:
+                try:
+                    with storage_operation('remove', self, objects=len(batch)):
+                        response = await self.client.request(
+                            'DELETE',
+                            f"/object/{self.bucket_name}",
+                            json={'prefixes': [path for _, path in batch]},
+                        )
+                        response.raise_for_status()
+                    removed = self._removed_paths([path for _, path in batch], response.json())
+                    return {url: path in removed for url, path in batch}
+                except Exception as e:
+                    logger.error(f"Error deleting files from Supabase: {e}")
+                    return {url: False for url, _ in batch}
+        
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        for batch_result in await asyncio.gather(*(remove(batch) for batch in batches)):
+            results.update(batch_result)
+        return results
     
-    def _extract_path_from_url(self, url: str) -> Optional[str]:
-        """Extract storage path from Supabase public URL"""
-        try:
-            # Supabase URLs typically look like: https://project.supabase.co/storage/v1/object/public/bucket/path
-            parts = url.split('/storage/v1/object/public/')
-            if len(parts) > 1:
-                path_with_bucket = parts[1]
-                # Remove bucket name from path
-                path_parts = path_with_bucket.split('/', 1)
-                if len(path_parts) > 1:
-                    return path_parts[1]  # Return path without bucket name
-            return None
-        except Exception as e:
-            logger.error(f"Error extracting path from URL: {e}")
-            return None
+    @staticmethod
+    def _read_file(file_path: str) -> bytes:
+        with open(file_path, 'rb') as f:
+            return f.read()
 
 # Global instance
 supabase_storage = SupabaseStorageService()
+
+# Async instance for ASGI views and asyncio-based commands
+async_supabase_storage = AsyncSupabaseStorageService()
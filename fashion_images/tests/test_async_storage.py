@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import tempfile
+from unittest import mock
+import httpx
+from django.test import SimpleTestCase
+from fashion_images.supabase_service import AsyncSupabaseStorageService
+
+SUPABASE_URL = 'https://project.supabase.co'
+BUCKET = 'fashion-images'
+PUBLIC_PREFIX = f'{SUPABASE_URL}/storage/v1/object/public/{BUCKET}/'
+
+
+class StandInStorage:
+    """MockTransport handler imitating Storage's upload and bulk remove endpoints"""
+
+    def __init__(self, fail_names=(), fail_deletes=False, delay=0.01):
+        self.objects = set()
+        self.fail_names = set(fail_names)
+        self.fail_deletes = fail_deletes
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delete_batches = []
+
+    async def __call__(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            prefix = f'/storage/v1/object/{BUCKET}'
+            if request.method == 'POST' and request.url.path.startswith(prefix + '/'):
+                path = request.url.path[len(prefix) + 1:]
+                if request.content.decode() in self.fail_names:
+                    return httpx.Response(500, json={'error': 'internal'})
+                self.objects.add(path)
+                return httpx.Response(200, json={'Key': f'{BUCKET}/{path}'})
+            if request.method == 'DELETE' and request.url.path == prefix:
+                prefixes = json.loads(request.content)['prefixes']
+                self.delete_batches.append(prefixes)
+                if self.fail_deletes:
+                    return httpx.Response(503, json={'error': 'unavailable'})
+                removed = [path for path in prefixes if path in self.objects]
+                self.objects.difference_update(removed)
+                return httpx.Response(200, json=[{'name': path} for path in removed])
+            return httpx.Response(404)
+        finally:
+            self.in_flight -= 1
+
+
+@mock.patch.dict(os.environ, {'SUPABASE_URL': SUPABASE_URL, 'SUPABASE_ANON_KEY': 'key', 'SUPABASE_BUCKET_NAME': BUCKET})
+class AsyncStorageServiceTests(SimpleTestCase):
+    def service(self, stand_in):
+        return AsyncSupabaseStorageService(http2=False, transport=httpx.MockTransport(stand_in))
+
+    async def test_upload_many_keeps_order_and_respects_concurrency(self):
+        stand_in = StandInStorage()
+        files = [(f'file-{i}'.encode(), f'{i}.jpg', 'images') for i in range(20)]
+        async with self.service(stand_in) as service:
+            urls = await service.upload_many(files, concurrency=4)
+
+        self.assertEqual(len(urls), 20)
+        self.assertTrue(all(url.startswith(PUBLIC_PREFIX + 'images/') and url.endswith('.jpg') for url in urls))
+        self.assertEqual(len(set(urls)), 20)
+        self.assertEqual(len(stand_in.objects), 20)
+        self.assertEqual(stand_in.max_in_flight, 4)
+
+    async def test_upload_many_reports_partial_failures_in_place(self):
+        stand_in = StandInStorage(fail_names={'file-1', 'file-3'})
+        files = [(f'file-{i}'.encode(), f'{i}.png', 'logos') for i in range(5)]
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as local_file:
+            local_file.write(b'local')
+            local_file.flush()
+            files += [(local_file.name, 'local.jpg', 'images'), ('/nonexistent/missing.jpg', 'missing.jpg', 'images')]
+            with self.assertLogs('fashion_images.supabase_service', 'ERROR'):
+                async with self.service(stand_in) as service:
+                    urls = await service.upload_many(files)
+
+        self.assertEqual([url is not None for url in urls], [True, False, True, False, True, True, False])
+        self.assertEqual(len(stand_in.objects), 4)
+
+    async def test_delete_many_batches_paths_and_limits_concurrency(self):
+        stand_in = StandInStorage()
+        async with self.service(stand_in) as service:
+            urls = await service.upload_many([(b'x', f'{i}.jpg', 'images') for i in range(7)])
+            stand_in.max_in_flight = 0
+            results = await service.delete_many(urls, batch_size=2, concurrency=2)
+
+        self.assertEqual(results, {url: True for url in urls})
+        self.assertEqual(sorted(len(batch) for batch in stand_in.delete_batches), [1, 2, 2, 2])
+        self.assertEqual(stand_in.max_in_flight, 2)
+        self.assertEqual(stand_in.objects, set())
+
+    async def test_delete_many_reports_partial_failures(self):
+        stand_in = StandInStorage()
+        async with self.service(stand_in) as service:
+            [stored] = await service.upload_many([(b'x', 'a.jpg', 'images')])
+            missing = PUBLIC_PREFIX + 'images/never-uploaded.jpg'
+            foreign = 'https://example.com/a.jpg'
+            with self.assertLogs('fashion_images.supabase_service', 'ERROR'):
+                results = await service.delete_many([stored, missing, foreign])
+
+        self.assertEqual(results, {stored: True, missing: False, foreign: False})
+        # The foreign URL never reaches Storage
+        self.assertEqual(stand_in.delete_batches, [[stored[len(PUBLIC_PREFIX):], 'images/never-uploaded.jpg']])
+
+    async def test_delete_many_matches_full_paths_only(self):
+        stand_in = StandInStorage()
+        stand_in.objects.update({'logos/logo.png', 'videos/logo.png'})
+        urls = [PUBLIC_PREFIX + path for path in ('images/logo.png', 'logos/logo.png')]
+        async with self.service(stand_in) as service:
+            results = await service.delete_many(urls)
+
+        # The removed logos/logo.png says nothing about images/logo.png
+        self.assertEqual(results, dict(zip(urls, [False, True])))
+        self.assertEqual(stand_in.objects, {'videos/logo.png'})
+
+    async def test_failed_batch_only_fails_its_own_urls(self):
+        stand_in = StandInStorage()
+        async with self.service(stand_in) as service:
+            urls = await service.upload_many([(b'x', f'{i}.jpg', 'images') for i in range(4)])
+            stand_in.fail_deletes = True
+            with self.assertLogs('fashion_images.supabase_service', 'ERROR'):
+                failed = await service.delete_many(urls[:2], batch_size=1)
+            stand_in.fail_deletes = False
+            deleted = await service.delete_many(urls[2:], batch_size=1)
+
+        self.assertEqual(failed, {url: False for url in urls[:2]})
+        self.assertEqual(deleted, {url: True for url in urls[2:]})
+
+    async def test_unconfigured_service_touches_nothing(self):
+        stand_in = StandInStorage()
+        with mock.patch.dict(os.environ, {'SUPABASE_URL': ''}):
+            service = self.service(stand_in)
+        with self.assertLogs('fashion_images.supabase_service', 'WARNING'):
+            urls = await service.upload_many([(b'x', 'a.jpg', 'images')])
+            results = await service.delete_many([PUBLIC_PREFIX + 'images/a.jpg'])
+
+        self.assertEqual(urls, [None])
+        self.assertEqual(results, {PUBLIC_PREFIX + 'images/a.jpg': False})
+        self.assertEqual(stand_in.max_in_flight, 0)
@@ -0,0 +1,105 @@
+import json
+from unittest import skipUnless
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from fashion_images.card_data import (
+    build_card_data, card_members_queryset, get_card_data_engine, render_card_data, serializer_card_data,
+)
+from fashion_images.models import FashionImage, ImageDerivative, TeamMember
+
+SUPABASE_IMAGE = 'https://example.supabase.co/storage/v1/object/public/fashion-images/images/a.jpg'
+
+
+def card_data_request(secure=False, host='testserver'):
+    return Request(RequestFactory().get('/api/card-data/', secure=secure, HTTP_HOST=host))
+
+
+class CardDataEngineTests(TestCase):
+    """The fast card_data engines must render byte-for-byte what the DRF serializers render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.plain = TeamMember.objects.create(name='Plain', title='Model', view_url='/view/plain')
+        FashionImage.objects.create(team_member=cls.plain, order=0, image_url=SUPABASE_IMAGE)
+        cls.no_images = TeamMember.objects.create(name='No Images', title='Designer', view_url='/view/none')
+
+        # Escaping, tied orders, local fallbacks, missing sources and unsorted derivatives
+        cls.edge = TeamMember.objects.create(
+            name='Zoë   "Quoted" \\ Back', title='Créatrice <b>\u2028', view_url='/view/zoe?a=1&b=2'
+        )
+        supabase = FashionImage.objects.create(
+            team_member=cls.edge, order=1, image_url=SUPABASE_IMAGE,
+            width=2400, height=3000, size=113429, mime='image/jpeg', dominant_color='#7b6432',
+            blurhash='L0EB.s~SfQ~S~9j[fQj[fQfQfQfQ',
+        )
+        FashionImage.objects.create(team_member=cls.edge, order=1, image_file='images/tied-order.jpg')
+        FashionImage.objects.create(team_member=cls.edge, order=0, image_file='nested/dir/local.png')
+        FashionImage.objects.create(team_member=cls.edge, order=2)
+        for width, image_format in [(640, 'webp'), (320, 'jpeg'), (320, 'webp'), (1280, 'jpeg')]:
+            ImageDerivative.objects.create(
+                image=supabase, width=width, height=width, format=image_format,
+                url=f'https://example.supabase.co/d/{width}.{image_format}', size=width,
+            )
+
+    def expected(self, request, member_ids=None):
+        members = card_members_queryset()
+        if member_ids is not None:
+            members = members.filter(id__in=member_ids)
+        return JSONRenderer().render(serializer_card_data(request, members))
+
+    def assertEngineMatches(self, engine, request, member_ids=None):
+        expected = self.expected(request, member_ids)
+        actual = render_card_data(request, member_ids, engine=engine)
+        if engine == 'postgres':
+            # PostgreSQL formats JSON its own way; the payloads must still be equal
+            self.assertEqual(json.loads(actual), json.loads(expected))
+        else:
+            self.assertEqual(actual, expected)
+
+    def engines(self):
+        engines = ['values', 'serializer']
+        if connection.vendor == 'postgresql':
+            engines.append('postgres')
+        return engines
+
+    def test_all_members(self):
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                self.assertEngineMatches(engine, card_data_request())
+
+    def test_member_subsets(self):
+        subsets = [[self.edge.id], [self.no_images.id, self.plain.id], []]
+        for engine in self.engines():
+            for member_ids in subsets:
+                with self.subTest(engine=engine, member_ids=member_ids):
+                    self.assertEngineMatches(engine, card_data_request(), member_ids)
+
+    @override_settings(ALLOWED_HOSTS=['shop.example.com'])
+    def test_local_urls_follow_the_request_origin(self):
+        request = card_data_request(secure=True, host='shop.example.com')
+        for engine in self.engines():
+            with self.subTest(engine=engine):
+                self.assertEngineMatches(engine, request)
+        self.assertIn(b'https://shop.example.com/', render_card_data(request, engine='values'))
+
+    def test_edge_case_member_shape(self):
+        [card] = build_card_data(card_data_request(), [self.edge.id], engine='values')
+        self.assertEqual(card['title'], 'Créatrice <b>\u2028')
+        # Images come in (order, id) order; one without a source is still listed
+        self.assertEqual(card['images'], [
+            'http://testserver/media/images/local.png', SUPABASE_IMAGE,
+            'http://testserver/media/images/tied-order.jpg', None,
+        ])
+        self.assertEqual(card['imageSources'][1]['srcset'], 'https://example.supabase.co/d/320.jpeg 320w, https://example.supabase.co/d/1280.jpeg 1280w')
+
+    @override_settings(CARD_DATA_ENGINE='auto')
+    def test_auto_uses_json_agg_on_postgresql(self):
+        expected = 'postgres' if connection.vendor == 'postgresql' else 'values'
+        self.assertEqual(get_card_data_engine(), expected)
+        self.assertEngineMatches(expected, card_data_request())
+
+    @skipUnless(connection.vendor == 'postgresql', 'the postgres engine needs PostgreSQL')
+    def test_postgres_engine(self):
+        self.assertEngineMatches('postgres', card_data_request())
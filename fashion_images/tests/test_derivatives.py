@@ -0,0 +1,72 @@
+import io
+import os
+import shutil
+import tempfile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from fashion_images.catalog import get_catalog_version
+from fashion_images.models import FashionImage, ImageDerivative, TeamMember
+from fashion_images.storage import storage
+
+MEMORY_URL = 'memory://storage/'
+
+
+class GenerateDerivativesTests(TestCase):
+    images = 5
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        os.makedirs(os.path.join(cls.media_root, 'images'))
+        cls.enterClassContext(override_settings(
+            MEDIA_ROOT=cls.media_root,
+            STORAGE_BACKEND='fashion_images.storage.InMemoryStorageBackend',
+            SUPABASE_CONTENT_ADDRESSED=False,
+            IMAGE_DERIVATIVE_WIDTHS=[320],
+            IMAGE_DERIVATIVE_FORMATS=['webp', 'jpeg'],
+        ))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        member = TeamMember.objects.create(name='Model', title='Model', view_url='/view/model')
+        for order in range(cls.images):
+            Image.new('RGB', (400, 500), (order * 40, 90, 120)).save(os.path.join(cls.media_root, 'images', f'{order}.jpg'))
+            FashionImage.objects.create(team_member=member, order=order, image_file=f'images/{order}.jpg')
+
+    def setUp(self):
+        self.enterContext(override_settings(STORAGE_OPTIONS={}))
+
+    def generate(self, **options):
+        out = io.StringIO()
+        call_command('generate_derivatives', jobs=2, batch_size=4, stdout=out, **options)
+        return out.getvalue()
+
+    def test_derivatives_are_saved_in_batches(self):
+        version = get_catalog_version().version
+
+        output = self.generate()
+
+        self.assertEqual(ImageDerivative.objects.count(), 2 * self.images)
+        for derivative in ImageDerivative.objects.all():
+            self.assertEqual((derivative.width, derivative.height), (320, 400))
+            self.assertEqual(len(storage.objects[derivative.url[len(MEMORY_URL):]]), derivative.size)
+        # Ten rows in batches of four: one catalog version bump per batch
+        self.assertEqual(get_catalog_version().version - version, 3)
+        self.assertEqual(output.count('  Saved '), 3)
+        self.assertIn(f'{2 * self.images} generated, 0 images up to date, 0 errors', output)
+
+        self.assertIn(f'0 generated, {self.images} images up to date', self.generate())
+
+    def test_force_replaces_and_deletes_old_objects(self):
+        self.generate()
+        old_urls = set(ImageDerivative.objects.values_list('url', flat=True))
+
+        self.generate(force=True)
+
+        new_urls = set(ImageDerivative.objects.values_list('url', flat=True))
+        self.assertEqual(len(new_urls), 2 * self.images)
+        self.assertFalse(old_urls & new_urls)
+        self.assertEqual({MEMORY_URL + path for path in storage.objects}, new_urls)
@@ -0,0 +1,337 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+from urllib.parse import quote, unquote
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from django.utils.http import http_date
+from fashion_images.media_cache import MediaCache, get_media_cache
+from fashion_images.media_serving import OFFLOAD_HEADERS, get_content_type
+
+LOGO = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+VIDEO = os.urandom(200 * 1024)
+FILES = {
+    ('logos', 'logo.png'): LOGO,
+    ('videos', 'lookbook.mp4'): VIDEO,
+    ('images', 'défilé été.jpg'): b'\xff\xd8\xff' + os.urandom(2048),
+}
+
+
+def media_url(media_type, filename):
+    return f'/media/{media_type}/{quote(filename)}'
+
+
+class MediaTestCase(SimpleTestCase):
+    """Serves FILES from a temporary MEDIA_ROOT"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = os.path.realpath(tempfile.mkdtemp())
+        for (media_type, filename), content in FILES.items():
+            os.makedirs(os.path.join(cls.media_root, media_type), exist_ok=True)
+            with open(os.path.join(cls.media_root, media_type, filename), 'wb') as f:
+                f.write(content)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root)
+
+    def media_path(self, media_type, filename):
+        return os.path.join(self.media_root, media_type, filename)
+
+
+class MediaOffloadTests(MediaTestCase):
+    """The X-Accel-Redirect / X-Sendfile headers a front proxy would act on"""
+
+    def proxied_path(self, mode, response):
+        """Map the offload header back to a file the way the proxy would"""
+        target = response[OFFLOAD_HEADERS[mode]]
+        self.assertTrue(target.isascii(), target)
+        target = unquote(target)
+        if mode == 'x-sendfile':
+            return target
+        prefix = settings.MEDIA_OFFLOAD_PREFIX.rstrip('/') + '/'
+        self.assertTrue(target.startswith(prefix), target)
+        return os.path.join(self.media_root, target[len(prefix):])
+
+    def test_files_are_handed_to_the_proxy(self):
+        for mode in OFFLOAD_HEADERS:
+            for media_type, filename in FILES:
+                with self.subTest(mode=mode, filename=filename), override_settings(MEDIA_OFFLOAD=mode):
+                    response = self.client.get(media_url(media_type, filename))
+
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.content, b'')
+                    self.assertEqual(response['Content-Type'], get_content_type(filename))
+                    self.assertEqual(self.proxied_path(mode, response), self.media_path(media_type, filename))
+
+    def test_rejected_paths_never_reach_the_proxy(self):
+        for mode in OFFLOAD_HEADERS:
+            for url in ('/media/../manage.py', '/media/%2e%2e/manage.py', '/media/images/missing-file.jpg'):
+                with self.subTest(mode=mode, url=url), override_settings(MEDIA_OFFLOAD=mode):
+                    response = self.client.get(url)
+
+                    self.assertEqual(response.status_code, 404)
+                    self.assertFalse(response.has_header(OFFLOAD_HEADERS[mode]))
+
+    @override_settings(MEDIA_OFFLOAD='x-bogus')
+    def test_unknown_mode_is_a_configuration_error(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.client.get(media_url('logos', 'logo.png'))
+
+
+@override_settings(MEDIA_CACHE_MAX_BYTES=0)
+class MediaRangeTests(MediaTestCase):
+    """Range, If-Range and HEAD handling, streamed from disk"""
+
+    url = media_url('videos', 'lookbook.mp4')
+
+    def get(self, method='get', **headers):
+        response = getattr(self.client, method)(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_file(self):
+        response, body = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, VIDEO)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+    def test_head_reports_the_full_file_without_a_body(self):
+        for headers in ({}, {'Range': 'bytes=0-99'}):
+            with self.subTest(headers=headers):
+                response, body = self.get('head', **headers)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(body, b'')
+                self.assertEqual(response['Content-Length'], str(len(VIDEO)))
+                self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_single_ranges(self):
+        size = len(VIDEO)
+        cases = {
+            'bytes=100-199': (100, 199),
+            'bytes=1000-': (1000, size - 1),
+            'bytes=-500': (size - 500, size - 1),
+            f'bytes=0-{size + 1000}': (0, size - 1),
+            'bytes=0-99,50-149': (0, 149),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(range=header):
+                response, body = self.get(Range=header)
+
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+                self.assertEqual(body, VIDEO[start:end + 1])
+
+    def test_multiple_ranges(self):
+        response, body = self.get(Range='bytes=0-9, 500-599, -10')
+
+        self.assertEqual(response.status_code, 206)
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        self.assertEqual(response['Content-Length'], str(len(body)))
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[-1], b'--\r\n')
+        size = len(VIDEO)
+        for part, (start, end) in zip(parts[1:-1], [(0, 9), (500, 599), (size - 10, size - 1)]):
+            headers, _, data = part.partition(b'\r\n\r\n')
+            self.assertIn(f'Content-Range: bytes {start}-{end}/{size}'.encode(), headers)
+            self.assertIn(b'Content-Type: video/mp4', headers)
+            self.assertEqual(data, VIDEO[start:end + 1] + b'\r\n')
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(Range=f'bytes={len(VIDEO)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(VIDEO)}')
+        self.assertEqual(body, b'')
+
+    def test_ignored_ranges_send_the_full_file(self):
+        too_many = 'bytes=' + ','.join(f'{i * 10}-{i * 10 + 1}' for i in range(17))
+        for header in ('bytes=abc', 'items=0-10', 'bytes=10-5', too_many):
+            with self.subTest(range=header):
+                response, body = self.get(Range=header)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(body, VIDEO)
+
+    def test_if_range(self):
+        head, _ = self.get('head')
+        etag, last_modified = head['ETag'], head['Last-Modified']
+        cases = {etag: 206, last_modified: 206, '"stale"': 200, f'W/{etag}': 200, 'Mon, 01 Jan 2001 00:00:00 GMT': 200}
+        for if_range, status in cases.items():
+            with self.subTest(if_range=if_range):
+                response, body = self.get(Range='bytes=0-99', **{'If-Range': if_range})
+
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(body, VIDEO[:100] if status == 206 else VIDEO)
+
+
+@override_settings(MEDIA_CACHE_MAX_BYTES=1024 * 1024, MEDIA_CACHE_MAX_FILE_SIZE=1024 * 1024)
+class CachedMediaRangeTests(MediaRangeTests):
+    """The same responses built from the media cache's bytes"""
+
+
+class MediaValidatorTests(MediaTestCase):
+    """ETag/Last-Modified on media responses and the 304s they allow"""
+
+    url = media_url('logos', 'logo.png')
+
+    def test_validators_are_sent(self):
+        response = self.client.get(self.url)
+        stat = os.stat(self.media_path('logos', 'logo.png'))
+
+        self.assertEqual(response['ETag'], f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"')
+        self.assertEqual(response['Last-Modified'], http_date(int(stat.st_mtime)))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000')
+
+    def test_revalidation_returns_304(self):
+        first = self.client.get(self.url)
+        cases = [
+            {'If-None-Match': first['ETag']},
+            {'If-None-Match': f'"other", {first["ETag"]}'},
+            {'If-None-Match': '*'},
+            {'If-Modified-Since': first['Last-Modified']},
+        ]
+        for headers in cases:
+            with self.subTest(headers=headers):
+                response = self.client.get(self.url, headers=headers)
+
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], first['ETag'])
+
+    def test_304_does_not_read_the_file(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with mock.patch('fashion_images.views.media_response') as media_response:
+            response = self.client.get(self.url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        media_response.assert_not_called()
+
+    def test_changed_file_is_sent_again(self):
+        etag = self.client.get(self.url)['ETag']
+        path = self.media_path('logos', 'logo.png')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.addCleanup(os.utime, path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.content, LOGO)
+
+    def test_failed_precondition_returns_412(self):
+        response = self.client.get(self.url, headers={'If-Match': '"other"'})
+
+        self.assertEqual(response.status_code, 412)
+
+    def test_head_revalidation_returns_304(self):
+        etag = self.client.head(self.url)['ETag']
+
+        self.assertEqual(self.client.head(self.url, headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_legacy_image_endpoint_shares_the_validators(self):
+        name = quote('défilé été.jpg')
+        etag = self.client.get(f'/media/images/{name}')['ETag']
+
+        self.assertEqual(self.client.get(f'/images/{name}', headers={'If-None-Match': etag}).status_code, 304)
+
+
+class MediaCacheTests(MediaTestCase):
+    """The byte-budgeted LRU behind media_response()"""
+
+    def write(self, name, content):
+        path = self.media_path('logos', name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def get(self, cache, path):
+        return cache.get(path, os.stat(path))
+
+    def test_hits_and_misses(self):
+        cache = MediaCache(max_bytes=10_000, max_file_size=5_000)
+        path = self.write('a.png', b'a' * 1000)
+
+        self.assertEqual(self.get(cache, path), b'a' * 1000)
+        self.assertEqual(self.get(cache, path), b'a' * 1000)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_files_are_evicted_first(self):
+        cache = MediaCache(max_bytes=3000, max_file_size=1000)
+        a, b, c, d = (self.write(f'{name}.png', name.encode() * 1000) for name in 'abcd')
+        for path in (a, b, c, a):
+            self.get(cache, path)
+
+        # b is now the least recently used entry
+        self.get(cache, d)
+
+        self.assertEqual(list(cache.entries), [c, a, d])
+        self.assertEqual(cache.stats()['bytes'], 3000)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_large_and_empty_files_are_not_cached(self):
+        cache = MediaCache(max_bytes=10_000, max_file_size=1000)
+        large = self.write('large.png', b'x' * 1001)
+        empty = self.write('empty.png', b'')
+
+        self.assertIsNone(self.get(cache, large))
+        self.assertIsNone(self.get(cache, empty))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_replaced_file_is_read_again(self):
+        cache = MediaCache(max_bytes=10_000, max_file_size=5_000)
+        path = self.write('a.png', b'old')
+        self.get(cache, path)
+        with open(path, 'wb') as f:
+            f.write(b'newer')
+
+        self.assertEqual(self.get(cache, path), b'newer')
+        self.assertEqual(cache.stats()['bytes'], 5)
+
+    def test_file_changed_after_stat_is_not_cached(self):
+        cache = MediaCache(max_bytes=10_000, max_file_size=5_000)
+        path = self.write('a.png', b'old')
+        stat = os.stat(path)
+        with open(path, 'wb') as f:
+            f.write(b'newer')
+
+        self.assertIsNone(cache.get(path, stat))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_settings(self):
+        with override_settings(MEDIA_CACHE_MAX_BYTES=0):
+            self.assertIsNone(get_media_cache())
+        with override_settings(MEDIA_CACHE_MAX_BYTES=4096, MEDIA_CACHE_MAX_FILE_SIZE=8192):
+            cache = get_media_cache()
+            self.assertEqual((cache.max_bytes, cache.max_file_size), (4096, 4096))
+            self.assertIs(get_media_cache(), cache)
+        # The shipped limit keeps the site logo in memory
+        self.assertTrue(get_media_cache().accepts(len(LOGO)))
+
+    @override_settings(MEDIA_CACHE_MAX_BYTES=1024 * 1024, MEDIA_CACHE_MAX_FILE_SIZE=1024 * 1024)
+    def test_serve_media_reads_small_files_once(self):
+        url = media_url('logos', 'logo.png')
+        cache = get_media_cache()
+        cache.clear()
+        hits = cache.stats()['hits']
+        with mock.patch('fashion_images.media_serving.FileResponse') as file_response:
+            responses = [self.client.get(url) for _ in range(3)]
+
+        self.assertEqual([response.content for response in responses], [LOGO] * 3)
+        file_response.assert_not_called()
+        self.assertEqual(cache.stats()['hits'] - hits, 2)
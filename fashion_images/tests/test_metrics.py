@@ -0,0 +1,49 @@
+import base64
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from fashion_images.models import FashionImage, MediaFile, TeamMember
+
+
+@override_settings(QUERY_BUDGET_MODE='raise', PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class MetricsMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            member = TeamMember.objects.create(name=f'Member {i}', title='Model', view_url=f'/view/{i}')
+            for order in range(3):
+                FashionImage.objects.create(team_member=member, order=order, image_url=f'https://cdn.example.com/{i}/{order}.jpg')
+            MediaFile.objects.create(name=f'logo-{i}', media_type='image', file_url=f'https://cdn.example.com/logo-{i}.png', dhash='0f' * 8)
+        User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def get(self, name):
+        # Basic auth: budgets are not checked for requests with a session cookie
+        credentials = base64.b64encode(b'staff:secret').decode()
+        return self.client.get(reverse(name), HTTP_AUTHORIZATION=f'Basic {credentials}')
+
+    def test_server_timing_header(self):
+        with override_settings(SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.get('card-data'))
+
+        with override_settings(SERVER_TIMING=True):
+            response = self.get('card-data')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"')
+
+    def test_every_route_to_a_budgeted_view_is_checked(self):
+        # The router's action routes reach the same views as the short URLs
+        for name in ('card-data', 'teammember-card-data', 'duplicates', 'mediafile-duplicates'):
+            with self.subTest(name=name), override_settings(QUERY_BUDGETS={name: 0}):
+                with self.assertRaisesMessage(Exception, f'{name} ran '):
+                    self.get(name)
+
+    def test_router_routes_share_the_budgets_of_the_short_urls(self):
+        for short, routed in [('card-data', 'teammember-card-data'), ('duplicates', 'mediafile-duplicates')]:
+            with self.subTest(name=routed):
+                self.assertIsNotNone(settings.QUERY_BUDGETS.get(routed))
+                self.assertEqual(settings.QUERY_BUDGETS[routed], settings.QUERY_BUDGETS[short])
+
+    def test_card_data_and_duplicates_stay_within_their_budgets(self):
+        for name in ('card-data', 'teammember-card-data', 'duplicates', 'mediafile-duplicates'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 200)
@@ -0,0 +1,256 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from fashion_images.models import FashionImage, MigrationJournalEntry, TeamMember
+from fashion_images.storage import InMemoryStorageBackend, file_sha256, storage
+from fashion_images.upload_pool import UploadJob, UploadPool, UploadStats
+
+MEMORY_URL = 'memory://storage/'
+
+
+def jobs(count, size=100):
+    return [UploadJob(file_path=f'/images/{i}.jpg', file_name=f'{i}.jpg', folder='images', size=size, payload=i) for i in range(count)]
+
+
+class UploadPoolTests(SimpleTestCase):
+    @mock.patch('fashion_images.upload_pool.time.sleep')
+    def test_failed_attempts_are_retried_with_backoff(self, sleep):
+        outcomes = iter([ConnectionError('reset by peer'), None, 'https://cdn/0.jpg'])
+
+        def upload(file_path, file_name, folder, digest):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        pool = UploadPool(upload, max_retries=3, backoff_base=0.5, backoff_max=0.75)
+        with self.assertLogs('fashion_images.upload_pool', 'WARNING') as logs:
+            [result] = pool.run(jobs(1))
+
+        self.assertEqual((result.url, result.attempts, result.error), ('https://cdn/0.jpg', 3, None))
+        self.assertIn('reset by peer', logs.output[0])
+        self.assertIn('upload returned no URL', logs.output[1])
+        # Full jitter: up to base * 2^(n-1), capped at backoff_max
+        [first], [second] = (call.args for call in sleep.call_args_list)
+        self.assertTrue(0 <= first <= 0.5)
+        self.assertTrue(0 <= second <= 0.75)
+        stats = UploadStats()
+        stats.record(result)
+        self.assertEqual((stats.files, stats.retries, stats.failed), (1, 2, 0))
+
+    @mock.patch('fashion_images.upload_pool.time.sleep')
+    def test_gives_up_after_max_retries(self, sleep):
+        upload = mock.Mock(side_effect=ConnectionError('timed out'))
+        pool = UploadPool(upload, max_retries=2)
+        with self.assertLogs('fashion_images.upload_pool', 'WARNING'):
+            [result] = pool.run(jobs(1))
+
+        self.assertIsNone(result.url)
+        self.assertEqual((result.attempts, result.error), (3, 'timed out'))
+        self.assertEqual(upload.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_results_come_back_with_their_jobs(self):
+        def upload(file_path, file_name, folder, digest):
+            # Later jobs finish first
+            time.sleep(0.001 * (20 - int(file_name.split('.')[0])))
+            return f'https://cdn/{folder}/{file_name}'
+
+        results = list(UploadPool(upload, workers=4).run(jobs(20)))
+        in_order = list(UploadPool(upload, workers=1).run(jobs(20)))
+
+        self.assertCountEqual([result.job.payload for result in results], range(20))
+        for result in results:
+            self.assertEqual(result.url, f'https://cdn/images/{result.job.payload}.jpg')
+        # A single worker finishes the jobs in the order they were given
+        self.assertEqual([result.job.payload for result in in_order], list(range(20)))
+
+    def test_in_flight_bytes_are_capped(self):
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def upload(file_path, file_name, folder, digest):
+            with lock:
+                in_flight.append(file_name)
+                peak.append(len(in_flight))
+            time.sleep(0.005)
+            with lock:
+                in_flight.remove(file_name)
+            return f'https://cdn/{file_name}'
+
+        results = list(UploadPool(upload, workers=8, max_in_flight_bytes=300).run(jobs(24)))
+
+        self.assertEqual(len(results), 24)
+        self.assertLessEqual(max(peak), 3)
+
+
+class MigrationTestCase(TestCase):
+    """Local images under a temporary MEDIA_ROOT, migrated to InMemoryStorageBackend"""
+
+    images = 6
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root)
+        os.makedirs(os.path.join(cls.media_root, 'images'))
+        cls.enterClassContext(override_settings(
+            MEDIA_ROOT=cls.media_root,
+            STORAGE_BACKEND='fashion_images.storage.InMemoryStorageBackend',
+            SUPABASE_CONTENT_ADDRESSED=False,
+        ))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = TeamMember.objects.create(name='Model', title='Model', view_url='/view/model')
+        for order in range(cls.images):
+            with open(os.path.join(cls.media_root, 'images', f'{order}.jpg'), 'wb') as f:
+                f.write(f'image {order}'.encode())
+            FashionImage.objects.create(team_member=cls.member, order=order, image_file=f'images/{order}.jpg')
+
+    def setUp(self):
+        # A fresh, empty InMemoryStorageBackend for each test
+        self.enterContext(override_settings(STORAGE_OPTIONS={}))
+
+    def migrate(self, **options):
+        out = io.StringIO()
+        call_command('migrate_to_supabase', stdout=out, **options)
+        return out.getvalue()
+
+    def assertAllMigrated(self):
+        for image in FashionImage.objects.all():
+            with self.subTest(order=image.order):
+                self.assertTrue(image.image_url.startswith(MEMORY_URL + 'fashion-images/'))
+                stored = storage.objects[image.image_url[len(MEMORY_URL):]]
+                self.assertEqual(stored, f'image {image.order}'.encode())
+
+
+class MigrateToSupabaseTests(MigrationTestCase):
+    def test_concurrent_migration(self):
+        output = self.migrate(workers=4)
+
+        self.assertAllMigrated()
+        self.assertEqual(len(storage.objects), self.images)
+        self.assertIn(f'{self.images} migrated, 0 skipped, 0 errors', output)
+        self.assertRegex(output, rf'Throughput: {self.images} files, .* files/s, .* MB/s, 0 already stored, 0 retries, 0 failed')
+
+    def test_content_already_stored_is_not_counted_as_uploaded(self):
+        self.migrate(content_addressed=True)
+        stored = dict(storage.objects)
+
+        output = self.migrate(content_addressed=True, force=True)
+
+        self.assertEqual(storage.objects, stored)
+        self.assertAllMigrated()
+        self.assertIn('Throughput: 0 files, 0.0MB', output)
+        self.assertIn(f'{self.images} already stored, 0 retries, 0 failed', output)
+
+    def test_compressed_migration_hashes_each_file_once(self):
+        # The worker processes take the digest; the backend must not hash again
+        with mock.patch.object(InMemoryStorageBackend, '_digest') as digest:
+            call_command('migrate_to_supabase_compressed', content_addressed=True, jobs=2, stdout=io.StringIO())
+
+        digest.assert_not_called()
+        self.assertAllMigrated()
+        self.assertEqual(len(storage.objects), self.images)
+
+
+class ResumeMigrationTests(MigrationTestCase):
+    def crash_after(self, uploads):
+        """Kill the run, as a restart would, when it starts upload number `uploads + 1`"""
+        save_file = InMemoryStorageBackend._save_file
+        started = []
+
+        def crashing(backend, *args):
+            started.append(args)
+            if len(started) > uploads:
+                raise KeyboardInterrupt
+            return save_file(backend, *args)
+        with mock.patch.object(InMemoryStorageBackend, '_save_file', crashing):
+            with self.assertRaises(KeyboardInterrupt):
+                self.migrate(workers=1, batch_size=2)
+
+    def journal_states(self):
+        entries = MigrationJournalEntry.objects.filter(command='migrate_to_supabase')
+        return {entry.object_id: entry.state for entry in entries}
+
+    def test_resume_skips_work_the_interrupted_run_finished(self):
+        self.crash_after(3)
+        images = list(FashionImage.objects.order_by('order'))
+        states = self.journal_states()
+        self.assertEqual([states[image.id] for image in images[:4]], ['committed'] * 3 + ['uploading'])
+        self.assertEqual([bool(image.image_url) for image in images], [True] * 3 + [False] * 3)
+
+        # --force would re-upload every image; the journal still skips the committed ones
+        output = self.migrate(workers=1, batch_size=2, resume=True, force=True)
+
+        self.assertAllMigrated()
+        self.assertEqual(len(storage.objects), self.images)
+        self.assertEqual(output.count('already migrated by the resumed run'), 3)
+        self.assertIn('3 migrated, 3 skipped, 0 errors', output)
+        self.assertIn('were restarted; any that had started may have left orphaned objects', output)
+        self.assertIn(f'    fashionimage {images[3].id}', output)
+        self.assertIn('Journal: 0 pending, 0 uploading, 0 uploaded, 6 committed, 0 failed', output)
+
+    def test_finished_uploads_are_committed_without_uploading_again(self):
+        first, replaced = FashionImage.objects.order_by('order')[:2]
+        for image in (first, replaced):
+            MigrationJournalEntry.objects.create(
+                command='migrate_to_supabase', object_type='fashionimage', object_id=image.id, state='uploaded',
+                url=f'{MEMORY_URL}fashion-images/{image.order}.jpg',
+                digest=file_sha256(os.path.join(self.media_root, 'images', f'{image.order}.jpg')),
+            )
+        # The file on disk no longer matches the journaled upload
+        MigrationJournalEntry.objects.filter(object_id=replaced.id).update(digest='0' * 64)
+
+        output = self.migrate(resume=True)
+
+        first.refresh_from_db()
+        self.assertEqual(first.image_url, f'{MEMORY_URL}fashion-images/0.jpg')
+        replaced.refresh_from_db()
+        self.assertNotEqual(replaced.image_url, f'{MEMORY_URL}fashion-images/1.jpg')
+        self.assertEqual(len(storage.objects), self.images - 1)
+        self.assertIn('Recovered: Model - Image 0', output)
+        self.assertIn('1 uploads from the previous run were committed without re-uploading', output)
+
+    def test_without_resume_the_journal_starts_over(self):
+        self.crash_after(3)
+
+        output = self.migrate(force=True)
+
+        self.assertNotIn('already migrated by the resumed run', output)
+        self.assertIn(f'{self.images} migrated, 0 skipped, 0 errors', output)
+        self.assertEqual(len(storage.objects), 3 + self.images)
+
+
+class BatchedMigrationTests(MigrationTestCase):
+    def migrate_counting_queries(self, batch_size):
+        with CaptureQueriesContext(connection) as queries:
+            self.migrate(workers=2, batch_size=batch_size, force=True)
+        return [query['sql'] for query in queries]
+
+    def test_queries_grow_with_batches_not_rows(self):
+        few = self.migrate_counting_queries(batch_size=3)
+        for order in range(self.images, 4 * self.images):
+            with open(os.path.join(self.media_root, 'images', f'{order}.jpg'), 'wb') as f:
+                f.write(f'image {order}'.encode())
+            self.addCleanup(os.remove, os.path.join(self.media_root, 'images', f'{order}.jpg'))
+            FashionImage.objects.create(team_member=self.member, order=order, image_file=f'images/{order}.jpg')
+
+        # Four times the rows in the same two batches
+        many = self.migrate_counting_queries(batch_size=12)
+
+        self.assertAllMigrated()
+        self.assertEqual(len(many), len(few))
+        updates = [sql for sql in many if sql.startswith('UPDATE "fashion_images_fashionimage"')]
+        self.assertEqual(len(updates), 2)
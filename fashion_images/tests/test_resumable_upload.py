@@ -0,0 +1,148 @@
+import base64
+import os
+import tempfile
+from unittest import mock
+import httpx
+from django.test import TestCase, TransactionTestCase, override_settings
+from fashion_images.models import ResumableUpload
+from fashion_images.supabase_service import SupabaseStorageService
+from fashion_images.upload_pool import UploadJob, UploadPool
+
+SUPABASE_URL = 'https://project.supabase.co'
+PUBLIC_PREFIX = f'{SUPABASE_URL}/storage/v1/object/public/fashion-images/'
+CHUNK_SIZE = 1024
+
+
+class StandInTus:
+    """MockTransport handler imitating Storage's resumable (TUS) endpoint"""
+
+    def __init__(self):
+        self.uploads = {}
+        self.patches = 0
+        # PATCH requests after this many fail as if the network went down
+        self.fail_after = None
+
+    def __call__(self, request):
+        if request.method == 'POST':
+            upload_id = str(len(self.uploads))
+            metadata = dict(item.split(' ') for item in request.headers['Upload-Metadata'].split(','))
+            self.uploads[upload_id] = {
+                'length': int(request.headers['Upload-Length']),
+                'name': base64.b64decode(metadata['objectName']).decode(),
+                'data': bytearray(),
+            }
+            return httpx.Response(201, headers={'Location': f'{SUPABASE_URL}/storage/v1/upload/resumable/{upload_id}'})
+
+        upload = self.uploads.get(request.url.path.rsplit('/', 1)[1])
+        if upload is None:
+            return httpx.Response(404)
+        if request.method == 'HEAD':
+            return httpx.Response(200, headers={'Upload-Offset': str(len(upload['data']))})
+
+        self.patches += 1
+        if self.fail_after is not None and self.patches > self.fail_after:
+            raise httpx.ConnectError('connection refused')
+        if int(request.headers['Upload-Offset']) != len(upload['data']):
+            return httpx.Response(409)
+        upload['data'] += request.read()
+        return httpx.Response(204, headers={'Upload-Offset': str(len(upload['data']))})
+
+
+def supabase_service(tus):
+    with mock.patch.dict(os.environ, {'SUPABASE_URL': SUPABASE_URL, 'SUPABASE_ANON_KEY': 'key'}):
+        service = SupabaseStorageService(transport=httpx.MockTransport(tus))
+    service.client = mock.MagicMock()
+    service.client.storage.from_.return_value.get_public_url.side_effect = lambda path: PUBLIC_PREFIX + path
+    return service
+
+
+@mock.patch('fashion_images.supabase_service.time.sleep')
+@override_settings(
+    SUPABASE_RESUMABLE_THRESHOLD=CHUNK_SIZE, SUPABASE_RESUMABLE_CHUNK_SIZE=CHUNK_SIZE, SUPABASE_RESUMABLE_RETRIES=1,
+)
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        self.tus = StandInTus()
+        self.service = supabase_service(self.tus)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'lookbook.mp4')
+        self.data = os.urandom(10 * CHUNK_SIZE + 100)
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def interrupt_after(self, parts):
+        self.tus.fail_after = parts
+        with self.assertLogs('fashion_images', 'ERROR'):
+            self.assertIsNone(self.service.upload_file(self.path, 'lookbook.mp4', 'videos'))
+        self.tus.fail_after = None
+        self.tus.patches = 0
+
+    def test_interrupted_upload_resumes_where_it_stopped(self, sleep):
+        self.interrupt_after(4)
+        upload = ResumableUpload.objects.get()
+        self.assertEqual(len(self.tus.uploads['0']['data']), 4 * CHUNK_SIZE)
+
+        url = self.service.upload_file(self.path, 'lookbook.mp4', 'videos')
+
+        # The same TUS upload was continued with the seven missing parts
+        self.assertEqual(len(self.tus.uploads), 1)
+        self.assertEqual(self.tus.patches, 7)
+        self.assertEqual(bytes(self.tus.uploads['0']['data']), self.data)
+        self.assertEqual(url, PUBLIC_PREFIX + upload.storage_path)
+        self.assertFalse(ResumableUpload.objects.exists())
+
+    def test_changed_file_starts_over(self, sleep):
+        self.interrupt_after(4)
+        with open(self.path, 'ab') as f:
+            f.write(b'more')
+
+        self.service.upload_file(self.path, 'lookbook.mp4', 'videos')
+
+        self.assertEqual(len(self.tus.uploads), 2)
+        self.assertEqual(bytes(self.tus.uploads['1']['data']), self.data + b'more')
+        # Only the abandoned upload of the old contents is left
+        self.assertEqual(ResumableUpload.objects.get().upload_url, f'{SUPABASE_URL}/storage/v1/upload/resumable/0')
+
+    def test_upload_gone_from_server_starts_over(self, sleep):
+        self.interrupt_after(4)
+        self.tus.uploads.clear()
+
+        url = self.service.upload_file(self.path, 'lookbook.mp4', 'videos')
+
+        self.assertEqual(bytes(self.tus.uploads['0']['data']), self.data)
+        self.assertEqual(url, PUBLIC_PREFIX + self.tus.uploads['0']['name'])
+        self.assertFalse(ResumableUpload.objects.exists())
+
+
+@mock.patch('fashion_images.supabase_service.time.sleep')
+@override_settings(
+    SUPABASE_RESUMABLE_THRESHOLD=CHUNK_SIZE, SUPABASE_RESUMABLE_CHUNK_SIZE=CHUNK_SIZE, SUPABASE_RESUMABLE_RETRIES=1,
+)
+class PooledResumableUploadTests(TransactionTestCase):
+    """Resume state written from UploadPool worker threads"""
+
+    def test_pool_resumes_an_interrupted_upload(self, sleep):
+        tus = StandInTus()
+        service = supabase_service(tus)
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as f:
+            data = os.urandom(6 * CHUNK_SIZE)
+            f.write(data)
+            f.flush()
+            job = UploadJob(file_path=f.name, file_name='look.mp4', folder='videos', size=len(data))
+
+            tus.fail_after = 2
+            pool = UploadPool(service.store_file, workers=2, max_retries=0)
+            with self.assertLogs('fashion_images', 'ERROR'):
+                [failed] = pool.run([job])
+            self.assertIsNone(failed.url)
+            self.assertEqual(ResumableUpload.objects.count(), 1)
+
+            tus.fail_after = None
+            tus.patches = 0
+            [result] = pool.run([job])
+
+        self.assertEqual(result.url, PUBLIC_PREFIX + tus.uploads['0']['name'])
+        self.assertEqual(tus.patches, 4)
+        self.assertEqual(bytes(tus.uploads['0']['data']), data)
+        self.assertFalse(ResumableUpload.objects.exists())
@@ -0,0 +1,195 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, Optional
+from django.db import connections
+from .storage import file_sha256
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ByteBudget:
+    """Caps the number of bytes held by in-flight uploads across all worker threads"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> int:
+        # A file larger than the whole budget may still go, but only on its own
+        size = min(size, self.max_bytes)
+        with self._condition:
+            while self.in_flight and self.in_flight + size > self.max_bytes:
+                self._condition.wait()
+            self.in_flight += size
+        return size
+
+    def release(self, size: int) -> None:
+        with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+
+@dataclass
+class UploadJob:
+    """One object to upload; `payload` is handed back untouched with the result"""
+    file_path: str
+    file_name: str
+    folder: str
+    size: int
+    payload: Any = None
+
+
+@dataclass
+class UploadResult:
+    job: UploadJob
+    url: Optional[str]
+    attempts: int
+    elapsed: float
+    error: Optional[str] = None
+    # SHA-256 of the file, when the pool was asked to hash files
+    digest: Optional[str] = None
+    # The URL came from `lookup`; nothing was uploaded
+    deduplicated: bool = False
+
+
+@dataclass
+class UploadStats:
+    """Throughput summary for a batch of uploads"""
+    files: int = 0
+    failed: int = 0
+    bytes: int = 0
+    retries: int = 0
+    # Files whose content was already stored; they count towards neither files nor bytes
+    deduplicated: int = 0
+    started: float = field(default_factory=time.monotonic)
+    finished: Optional[float] = None
+
+    def record(self, result: UploadResult) -> None:
+        self.retries += max(result.attempts - 1, 0)
+        if result.deduplicated:
+            self.deduplicated += 1
+        elif result.url:
+            self.files += 1
+            self.bytes += result.job.size
+        else:
+            self.failed += 1
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f'{self.files} files, {self.bytes / (1024 * 1024):.1f}MB in {self.elapsed:.1f}s '
+            f'({self.files / elapsed:.2f} files/s, {self.bytes / (1024 * 1024) / elapsed:.2f} MB/s, '
+            f'{self.deduplicated} already stored, {self.retries} retries, {self.failed} failed)'
+        )
+
+
+class UploadPool:
+    """
+    Runs uploads on a bounded thread pool with per-object retries
+
+    Failed attempts (an exception or a falsy URL from `upload_func`) are
+    retried with exponential backoff and full jitter. With `hash_files` a
+    worker first takes each file's SHA-256; `lookup` is then called with it on
+    the calling thread, and a URL it returns is used instead of uploading.
+    `upload_func` gets the digest (or None) with the file, and only it runs on
+    the workers. Results are yielded on the calling thread so database reads
+    and writes never leave it.
+    """
+
+    def __init__(
+        self,
+        upload_func: Callable[..., Optional[str]],
+        workers: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        max_in_flight_bytes: int = 64 * 1024 * 1024,
+        hash_files: bool = False,
+        lookup: Optional[Callable[[str], Optional[str]]] = None,
+    ):
+        self.upload_func = upload_func
+        self.workers = max(1, workers)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget = ByteBudget(max_in_flight_bytes)
+        self.hash_files = hash_files or lookup is not None
+        self.lookup = lookup
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    def _upload(self, job: UploadJob, digest: Optional[str], started: float) -> UploadResult:
+        reserved = self.budget.acquire(job.size)
+        try:
+            attempts = 0
+            error = None
+            while True:
+                attempts += 1
+                try:
+                    url = self.upload_func(file_path=job.file_path, file_name=job.file_name, folder=job.folder, digest=digest)
+                    if url:
+                        return UploadResult(job, url, attempts, time.monotonic() - started, digest=digest)
+                    error = 'upload returned no URL'
+                except Exception as e:
+                    error = str(e)
+                if attempts > self.max_retries:
+                    return UploadResult(job, None, attempts, time.monotonic() - started, error, digest)
+                delay = self.backoff_delay(attempts)
+                logger.warning(f"Upload of {job.file_name} failed ({error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        finally:
+            self.budget.release(reserved)
+            # Resumable uploads keep their state in the database; close this thread's connection
+            connections.close_all()
+
+    def _hashed(self, job: UploadJob, future, started: float, executor):
+        """Result for a file whose hash finished, or the future of its upload"""
+        try:
+            digest = future.result()
+        except OSError as e:
+            return UploadResult(job, None, 1, time.monotonic() - started, str(e))
+        existing_url = self.lookup(digest) if self.lookup else None
+        if existing_url:
+            return UploadResult(job, existing_url, 0, time.monotonic() - started, digest=digest, deduplicated=True)
+        return executor.submit(self._upload, job, digest, started)
+
+    def run(self, jobs: Iterable[UploadJob]) -> Iterator[UploadResult]:
+        """Upload all jobs, yielding results in completion order"""
+        jobs = iter(jobs)
+        # Keep the queue short so job iterables are consumed lazily
+        max_pending = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='upload') as executor:
+            # future -> (job, start time, whether the future is the job's hash)
+            running = {}
+            while True:
+                for job in islice(jobs, max_pending - len(running)):
+                    started = time.monotonic()
+                    if self.hash_files:
+                        running[executor.submit(file_sha256, job.file_path)] = (job, started, True)
+                    else:
+                        running[executor.submit(self._upload, job, None, started)] = (job, started, False)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, started, hashing = running.pop(future)
+                    if not hashing:
+                        yield future.result()
+                        continue
+                    outcome = self._hashed(job, future, started, executor)
+                    if isinstance(outcome, UploadResult):
+                        yield outcome
+                    else:
+                        running[outcome] = (job, started, False)
@@ -9,6 +9,8 @@ router.register(r'media-files', views.MediaFileViewSet)
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api/card-data/', views.TeamMemberViewSet.as_view({'get': 'card_data'}), name='card-data'),
+    path('api/duplicates/', views.MediaFileViewSet.as_view({'get': 'duplicates'}), name='duplicates'),
     path('media/<str:media_type>/<str:filename>', views.serve_media, name='serve-media'),
     path('images/<str:image_name>', views.serve_image, name='serve-image'),
+    path('metrics', views.metrics, name='metrics'),
 ]
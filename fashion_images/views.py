@@ -1,69 +1,116 @@
+import hmac
+import os
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.http import HttpResponse, FileResponse
 from django.conf import settings
-import os
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+from .card_data import build_card_data, render_card_data
+from .catalog import get_catalog_version, apply_catalog_validators
+from .compression import CompressedResponseMixin
+from .dedup import DEFAULT_DUPLICATE_DISTANCE, MAX_API_DUPLICATE_DISTANCE, cached_duplicate_clusters, wasted_bytes
+from .media_serving import (
+    resolve_media_path, get_content_type, get_offload_mode, media_response, not_modified_response,
+    offload_response
+)
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics, timed
 from .models import TeamMember, FashionImage, MediaFile
+from .pagination import KeysetPagination
+from .renderers import ORJSONRenderer
 from .serializers import TeamMemberSerializer, MediaFileSerializer
+from .snapshots import snapshot_response, snapshots_enabled
 
-class TeamMemberViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = TeamMember.objects.all()
+class TeamMemberViewSet(CompressedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = TeamMember.objects.prefetch_related('images__derivatives')
     serializer_class = TeamMemberSerializer
+    pagination_class = KeysetPagination
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=[ORJSONRenderer])
     def card_data(self, request):
         """API endpoint that returns card data in the same format as frontend expects"""
-        team_members = TeamMember.objects.prefetch_related('images').all()
-        serializer = self.get_serializer(team_members, many=True)
+        # Answer revalidation requests from the catalog version alone
+        catalog = get_catalog_version()
+        not_modified = get_conditional_response(
+            request, etag=catalog.etag, last_modified=catalog.last_modified
+        )
+        if not_modified is not None:
+            return apply_catalog_validators(not_modified, catalog, vary_on_host=True)
         
-        # Transform the data to match frontend format
-        card_data = []
-        for member in serializer.data:
-            card_data.append({
-                'id': member['id'],
-                'name': member['name'],
-                'title': member['title'],
-                'images': [img['image_url'] for img in member['images']],
-                'viewUrl': member['view_url']
-            })
+        # The full catalog unless the client asks for pages with ?cursor= / ?limit=
+        if self.paginator.is_requested(request):
+            page = self.paginator.paginate_queryset(TeamMember.objects.only('id'), request, view=self)
+            card_data = build_card_data(request, member_ids=[member.id for member in page])
+            return apply_catalog_validators(self.paginator.get_paginated_response(card_data), catalog, vary_on_host=True)
         
-        return Response(card_data)
+        if not snapshots_enabled(request):
+            response = HttpResponse(render_card_data(request), content_type='application/json')
+            return apply_catalog_validators(response, catalog, vary_on_host=True)
+        
+        # Serve the pre-rendered catalog; only the first request after a change renders it
+        response = snapshot_response(request, 'card_data', catalog, lambda: render_card_data(request))
+        return apply_catalog_validators(response, catalog, vary_on_host=True)
 
+@require_safe
 def serve_media(request, media_type, filename):
     """Serve media files directly from the backend"""
     # Current path structure: media/images/, media/videos/, media/logos/
-    media_path = os.path.join(settings.MEDIA_ROOT, media_type, filename)
-    
-    if os.path.exists(media_path):
-        # Determine content type based on file extension
-        if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif')):
-            content_type = 'image/jpeg' if filename.lower().endswith(('.jpg', '.jpeg')) else 'image/png'
-        elif filename.lower().endswith('.mp4'):
-            content_type = 'video/mp4'
-        else:
-            content_type = 'application/octet-stream'
-        
-        with open(media_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type=content_type)
-            response['Cache-Control'] = 'public, max-age=31536000'
-            return response
-    else:
+    media_path = resolve_media_path(media_type, filename)
+    if media_path is None:
         return HttpResponse('Media file not found', status=404)
+    
+    content_type = get_content_type(filename)
+    
+    # Let nginx/Apache send the file when offloading is configured
+    offload_mode = get_offload_mode()
+    if offload_mode:
+        return offload_response(media_path, content_type, offload_mode)
+    
+    # Revalidations are answered from stat() without opening the file
+    stat = os.stat(media_path)
+    not_modified = not_modified_response(request, stat)
+    if not_modified is not None:
+        return not_modified
+    
+    # Stream the file (or the requested byte ranges) in bounded chunks
+    return media_response(request, media_path, content_type, stat)
 
 def serve_image(request, image_name):
     """Serve images directly from the backend (legacy endpoint)"""
     return serve_media(request, 'images', image_name)
 
-class MediaFileViewSet(viewsets.ReadOnlyModelViewSet):
+@require_safe
+def metrics(request):
+    """Request metrics of this worker in the Prometheus text format"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    # Without a token the metrics are only served in development
+    if not token and not settings.DEBUG:
+        return HttpResponse('Not found', status=404)
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Forbidden', status=403)
+    
+    response = HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+class MediaFileViewSet(CompressedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = MediaFile.objects.all()
     serializer_class = MediaFileSerializer
+    pagination_class = KeysetPagination
     
-    @action(detail=False, methods=['get'])
-    def media_list(self, request):
-        """Get list of all media files"""
-        media_files = MediaFile.objects.all()
-        serializer = self.get_serializer(media_files, many=True, context={'request': request})
+    def get_permissions(self):
+        # Also applies to /api/duplicates/, which is routed without the action's kwargs
+        if self.action == 'duplicates':
+            return [IsAdminUser()]
+        return super().get_permissions()
+    
+    def build_media_list(self, media_files):
+        """Media files as name/type/url/description entries"""
+        serializer = self.get_serializer(media_files, many=True, context={'request': self.request})
         
         media_data = []
         for media in serializer.data:
@@ -73,5 +120,55 @@ class MediaFileViewSet(viewsets.ReadOnlyModelViewSet):
                 'url': media['file_url'],
                 'description': media['description']
             })
+        return media_data
+    
+    def render_media_list(self, media_files):
+        media_data = self.build_media_list(media_files)
+        with timed('serialize'):
+            return JSONRenderer().render(media_data)
+    
+    @action(detail=False, methods=['get'])
+    def media_list(self, request):
+        """Get list of all media files"""
+        catalog = get_catalog_version()
+        not_modified = get_conditional_response(
+            request, etag=catalog.etag, last_modified=catalog.last_modified
+        )
+        if not_modified is not None:
+            return apply_catalog_validators(not_modified, catalog, vary_on_host=True)
+        
+        media_files = MediaFile.objects.all()
+        if not snapshots_enabled(request):
+            return apply_catalog_validators(Response(self.build_media_list(media_files)), catalog, vary_on_host=True)
+        
+        response = snapshot_response(
+            request, 'media_list', catalog,
+            lambda: self.render_media_list(media_files),
+        )
+        return apply_catalog_validators(response, catalog, vary_on_host=True)
+    
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def duplicates(self, request):
+        """Clusters of near-identical images and media files (staff only; ?threshold= bits, default 6)"""
+        try:
+            threshold = int(request.query_params.get('threshold', DEFAULT_DUPLICATE_DISTANCE))
+        except ValueError:
+            raise ValidationError({'threshold': 'Must be an integer.'})
+        # Larger radii compare nearly every pair; find_duplicates handles them offline
+        if not 0 <= threshold <= MAX_API_DUPLICATE_DISTANCE:
+            raise ValidationError({'threshold': f'Must be between 0 and {MAX_API_DUPLICATE_DISTANCE}.'})
+        
+        # Hashes only change through saves and backfills, which bump the catalog version
+        catalog = get_catalog_version()
+        not_modified = get_conditional_response(
+            request, etag=catalog.etag, last_modified=catalog.last_modified
+        )
+        if not_modified is not None:
+            return apply_catalog_validators(not_modified, catalog)
         
-        return Response(media_data)
\ No newline at end of file
+        clusters = cached_duplicate_clusters(catalog, threshold)
+        return apply_catalog_validators(Response({
+            'threshold': threshold,
+            'clusters': [{'wastedBytes': wasted_bytes(cluster), 'items': cluster} for cluster in clusters],
+            'wastedBytes': sum(wasted_bytes(cluster) for cluster in clusters),
+        }), catalog)